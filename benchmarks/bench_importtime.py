@@ -0,0 +1,68 @@
+"""
+Import-time benchmark of SMD Converter
+
+Measures cumulative import time of library and command line modules with
+`python -X importtime`, and fails when it exceeds the budget or when
+modules which are needed only by GUI (or slow to import) are loaded.
+
+Usage
+=====
+  >>> python benchmarks/bench_importtime.py
+
+"""
+
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+# {module: budget of cumulative import time (ms)}
+BUDGETS_MS: Dict[str, float] = {
+    'smdconverter': 10.,
+    'smdconverter.smdparser': 400.,
+    'smdconverter.cli': 500.,
+}
+FORBIDDEN_MODULES = ('tkinter', 'tkinterdnd2', 'ibwpy', 'pkg_resources')
+REPEAT = 5  # the best of REPEAT runs is compared with the budget
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_LINE = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """returns cumulative import time of module (ms)
+    and cumulative time of all imported modules"""
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    imported: Dict[str, float] = {}
+    for line in res.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            imported[match.group(4)] = int(match.group(2)) / 1000
+    return imported[module], imported
+
+
+def main() -> int:
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        results = [measure(module) for _ in range(REPEAT)]
+        best = min(time for time, _ in results)
+        imported = results[0][1]
+        forbidden = [name for name in imported
+                     if name.split('.')[0] in FORBIDDEN_MODULES]
+
+        status = "OK"
+        if best > budget or forbidden:
+            status = "FAILED"
+            failed = True
+        print(f"{module}: {best:.1f} ms (budget: {budget:.0f} ms) {status}")
+        if forbidden:
+            print(f"  unexpected imports: {', '.join(sorted(forbidden))}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
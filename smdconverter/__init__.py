@@ -12,6 +12,13 @@ Launch GUI application with:
 
 """
 
-from .singlesmdconverter import App
-
 __all__ = ['App']
+
+
+def __getattr__(name: str) -> type:
+    # import GUI (Tk, tkinterdnd2, ...) only when App is used, so that
+    # command line tools and library modules start quickly
+    if name == 'App':
+        from .singlesmdconverter import App
+        return App
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import json
 from os.path import isfile
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Union
 
 from .constants import SETTINGS_JSON_PATH
 from .defaultsettings import DEFAULT_SETTINGS
 
+if TYPE_CHECKING:
+    from .smdparser import SpectralUnit
+
 JSON_INDENT = 4
 
 
@@ -54,6 +57,110 @@ class ApplicationSettings:
     def set_spectral_axis_name_format(self, unit: str, format_: str) -> None:
         self.__settings_dict['spectralAxisNameFormats'][unit] = format_
 
+    @property
+    def spectral_axis_export_units(self) -> List[SpectralUnit]:
+        """returns units of spectral axes exported in batch"""
+        return self.__settings_dict.setdefault(
+            'spectralAxisExportUnits', ["nm", "cm-1", "GHz"])
+
+    @property
+    def preprocessing(self) -> Dict[str, List[Dict[str, Any]]]:
+        # NOTE: settings files saved by older versions
+        # do not have this item
+        return self.__settings_dict.setdefault('preprocessing', {})
+
+    def preprocessing_steps(self, detector_name: str) -> List[Dict[str, Any]]:
+        """returns settings of preprocessing steps for the detector
+        (empty when preprocessing is not configured)"""
+        return self.preprocessing.get(detector_name, [])
+
+    @property
+    def band_maps(self) -> Dict[str, Dict[str, Any]]:
+        """returns bands and expressions of maps for each detector name
+        ({"unit": ..., "bands": ..., "maps": ...})"""
+        return self.__settings_dict.setdefault('bandMaps', {})
+
+    @property
+    def statistics(self) -> Dict[str, Any]:
+        return self.__settings_dict.setdefault(
+            'statistics', {'enabled': True, 'saturationLevels': {}})
+
+    @property
+    def statistics_flag(self) -> bool:
+        """whether statistics of data are computed in conversion"""
+        return self.statistics.get('enabled', True)
+
+    def saturation_level(self, detector_name: str) -> Union[float, None]:
+        """returns level at or above which values of the detector are
+        counted as saturated (None if not set)"""
+        return self.statistics.get('saturationLevels', {}).get(detector_name)
+
+    @property
+    def preview_bands(self) -> Dict[str, Dict[str, Any]]:
+        """returns band integrated in preview for each detector name
+        ({"unit": ..., "start": ..., "stop": ...})"""
+        return self.__settings_dict.setdefault('previewBands', {})
+
+    @property
+    def output(self) -> Dict[str, Any]:
+        return self.__settings_dict.setdefault(
+            'output', {'fsync': True, 'fsyncBatchSize': 16})
+
+    @property
+    def fsync_flag(self) -> bool:
+        return self.output.get('fsync', True)
+
+    @property
+    def fsync_batch_size(self) -> int:
+        return self.output.get('fsyncBatchSize', 16)
+
+    @property
+    def staging_mode(self) -> str:
+        """returns whether outputs are written via local staging directory
+        ("auto": only for network destinations, "always" or "never")"""
+        return self.output.get('staging', "auto")
+
+    @property
+    def staging_dir(self) -> str:
+        return self.output.get('stagingDir', "")
+
+    @property
+    def copy_workers(self) -> int:
+        return self.output.get('copyWorkers', 2)
+
+    @property
+    def dedup_flag(self) -> bool:
+        """returns whether outputs of identical sources are reused"""
+        return self.output.get('dedup', True)
+
+    @property
+    def pipeline(self) -> Dict[str, Any]:
+        return self.__settings_dict.setdefault(
+            'pipeline', {'readAhead': 2, 'writeQueueSize': 1})
+
+    @property
+    def read_ahead(self) -> int:
+        return self.pipeline.get('readAhead', 2)
+
+    @property
+    def write_queue_size(self) -> int:
+        return self.pipeline.get('writeQueueSize', 1)
+
+    @property
+    def read_cache(self) -> Dict[str, Any]:
+        return self.__settings_dict.setdefault(
+            'readCache', {'maxMegabytes': 256, 'rowsPerChunk': 8})
+
+    @property
+    def read_cache_bytes(self) -> int:
+        """returns upper limit of size of chunk cache in bytes"""
+        return int(self.read_cache.get('maxMegabytes', 256) * 1024 * 1024)
+
+    @property
+    def read_cache_rows(self) -> int:
+        """returns number of y-rows in each cached chunk"""
+        return self.read_cache.get('rowsPerChunk', 8)
+
     def overwrite_settings(self, new_settings: ApplicationSettings) -> None:
         self.__settings_dict = new_settings.settings_dict
 
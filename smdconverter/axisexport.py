@@ -0,0 +1,125 @@
+"""
+Batch export of spectral axes
+
+Jobs in a batch often share exactly the same spectral axis. Axes of all jobs
+are hashed for each unit, and each distinct axis is saved only once as an
+ibw file, named after the first job which has it. Other jobs are mapped to
+the shared wave.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .appsettings import ApplicationSettings
+from .convertjob import ConvertJob
+from .nameformatter import (NameRegistry, NameReport,
+                            SpectralAxisIBWNameFormatter)
+from .outputwriter import OutputWriter
+from .smdparser import SpectralUnit
+
+AxisEntry = Tuple[ConvertJob, SpectralUnit, str]  # (owner job, unit, name)
+
+
+def axis_hash(axis: np.ndarray, unit: SpectralUnit) -> str:
+    """returns hash of values and unit of spectral axis"""
+    hash_ = hashlib.sha1(unit.encode('utf-8'))
+    hash_.update(np.ascontiguousarray(axis).tobytes())
+    return hash_.hexdigest()
+
+
+def existing_names(path: str) -> List[str]:
+    """returns names of ibw files in the directory (empty if the directory
+    does not exist)"""
+    if not os.path.isdir(path):
+        return []
+    return [os.path.splitext(entry)[0] for entry in os.listdir(path)
+            if os.path.splitext(entry)[1].lower() == ".ibw"]
+
+
+class SpectralAxisExport:
+    """Plan of exporting spectral axes of jobs, in which each distinct axis
+    is exported only once
+    """
+
+    def __init__(self, jobs: Iterable[ConvertJob],
+                 units: Sequence[SpectralUnit],
+                 settings: ApplicationSettings,
+                 reserved_names: Iterable[str] = ()) -> None:
+        """
+        Args:
+            jobs (Iterable[ConvertJob]): jobs whose axes (of selected
+                detectors) are exported. Detectors without spectral axis
+                are skipped.
+            units (Sequence[SpectralUnit]): units of exported axes
+            settings (ApplicationSettings): settings which contain name
+                formats of spectral axes
+            reserved_names (Iterable[str], optional): names which axis
+                waves must not take (e.g. files already in the destination
+                directory). Output names of jobs are always reserved.
+                Defaults to ().
+        """
+        self.__axes: Dict[str, AxisEntry] = {}  # hash -> entry
+        self.__names: Dict[ConvertJob, Dict[SpectralUnit, str]] = {}
+        jobs = list(jobs)
+        registry = NameRegistry()
+        for name in reserved_names:
+            registry.add(name)
+        for job in jobs:
+            registry.add(job.output_name)
+        report = NameReport()
+        for job in jobs:
+            if job.shape[3] == 1:  # detector without spectral axis
+                continue
+            names = self.__names.setdefault(job, {})
+            for unit in units:
+                key = axis_hash(job.spectral_axis_array(unit), unit)
+                if key not in self.__axes:
+                    name = SpectralAxisIBWNameFormatter(
+                        job, settings, report=report).get_name(unit)
+                    name = registry.unique_name(name)
+                    registry.add(name)
+                    self.__axes[key] = (job, unit, name)
+                names[unit] = self.__axes[key][2]
+        report.print_summary()
+
+    @property
+    def axes(self) -> List[AxisEntry]:
+        """returns distinct axes (job which owns the axis, unit and name)"""
+        return list(self.__axes.values())
+
+    @property
+    def names(self) -> Dict[ConvertJob, Dict[SpectralUnit, str]]:
+        """returns name of axis wave of each job for each unit"""
+        return self.__names
+
+    def lines(self) -> List[str]:
+        """returns mapping of jobs to axis waves"""
+        return [f"{job.output_name}: " + ", ".join(
+                    f"{unit} -> {name}" for unit, name in names.items())
+                for job, names in self.__names.items()]
+
+    def save(self, path: str,
+             writer: Union[OutputWriter, None] = None) -> None:
+        """save each distinct axis into the directory
+
+        Args:
+            path (str): destination directory (ends with separator)
+            writer (Union[OutputWriter, None], optional): writer of outputs.
+                Defaults to None (outputs are committed immediately).
+        """
+        if writer is None:
+            with OutputWriter() as writer:
+                self.save(path, writer)
+            return
+
+        for job, unit, name in self.__axes.values():
+            save_path = f"{path}{name}.ibw"
+            ibw = job.spectra_axis_ibw(unit=unit, name=name)
+            writer.write_with(save_path, ibw.save,
+                              functools.partial(print, f"Saved: {save_path}"))
@@ -0,0 +1,237 @@
+"""
+Maps of band integrals and expressions over them
+
+Bands are ranges of spectral axis, and maps are expressions over values of
+bands. They are configured for each detector in settings (key: "bandMaps"),
+for example:
+
+    "bandMaps": {
+        "Andor CCD": {
+            "unit": "cm-1",
+            "bands": {"D": [1300, 1400], "G": [1550, 1620],
+                      "bg": [1800, 1850]},
+            "maps": {"ratio": "(D - bg_mean) / (G - bg_mean)",
+                     "G_position": "G_centroid"}
+        }
+    }
+
+Each band provides the following values of each spectrum:
+    <band>: integrated intensity (trapezoidal rule on spectral axis)
+    <band>_mean: mean intensity
+    <band>_max: maximum intensity
+    <band>_centroid: intensity-weighted mean position
+    <band>_peak: position of maximum
+Expressions are compiled once and evaluated for chunks of spectra, and all
+maps of a detector are computed in a single pass over its spectral data.
+"""
+
+from __future__ import annotations
+
+import ast
+import os
+from typing import Any, Dict, List, Set, Tuple, Union
+
+import numpy as np
+
+from .mapexport import make_map_note, map_wave_names, save_map
+from .outputwriter import OutputWriter
+from .smdparser import SimpledSMDParser, SpectralUnit
+
+BandMapSettings = Dict[str, Any]  # {"unit": ..., "bands": ..., "maps": ...}
+
+QUANTITIES = ('mean', 'max', 'centroid', 'peak')  # suffixes of band values
+FUNCTIONS = {
+    'abs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log,
+    'log10': np.log10, 'minimum': np.minimum, 'maximum': np.maximum,
+    'where': np.where}
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class BandExpression:
+    """Arithmetic expression over band values compiled once
+    Only arithmetic operators, comparisons, numbers, band values and
+    functions in FUNCTIONS are allowed.
+    """
+
+    def __init__(self, text: str) -> None:
+        try:
+            tree = ast.parse(text, mode='eval')
+        except SyntaxError as error:
+            raise ValueError(f"invalid expression ({text}): {error.msg}")
+        names: Set[str] = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(f"{type(node).__name__} is not allowed in "
+                                 f"expression ({text})")
+            if isinstance(node, ast.Call) and not (
+                    isinstance(node.func, ast.Name)
+                    and node.func.id in FUNCTIONS and not node.keywords):
+                raise ValueError(f"invalid function call in expression "
+                                 f"({text})")
+            if isinstance(node, ast.Constant) \
+                    and not isinstance(node.value, (int, float)):
+                raise ValueError(f"invalid constant in expression ({text})")
+            if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                names.add(node.id)
+        self.text = text
+        self.names = names
+        self.__code = compile(tree, '<expression>', 'eval')
+
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        """evaluate expression with values of names (arrays of the same
+        shape)"""
+        namespace: Dict[str, Any] = dict(FUNCTIONS)
+        namespace.update(values)
+        with np.errstate(all='ignore'):
+            return eval(self.__code, {'__builtins__': {}}, namespace)
+
+
+def integration_weights(axis: np.ndarray, start: float,
+                        stop: float) -> np.ndarray:
+    """returns weights of trapezoidal integration over the band
+    (zero outside the band; axis may be in descending order)"""
+    low, high = min(start, stop), max(start, stop)
+    order = np.argsort(axis, kind='stable')
+    sorted_axis = axis[order].astype(np.float64)
+    inside = (sorted_axis >= low) & (sorted_axis <= high)
+    if np.count_nonzero(inside) < 2:
+        raise ValueError(f"band ({start} ~ {stop}) has too few points")
+    points = sorted_axis[inside]
+    steps = np.diff(points) / 2
+    band_weights = np.zeros(points.size)
+    band_weights[:-1] += steps
+    band_weights[1:] += steps
+    res = np.zeros(axis.size)
+    res[order[inside]] = band_weights
+    return res
+
+
+class BandMapGenerator:
+    """Class for computing maps of expressions over bands of a detector
+    """
+    CHUNK_SPECTRA = 16384  # number of spectra read at once
+
+    def __init__(self, smd_data: SimpledSMDParser, detector_id: int,
+                 settings: BandMapSettings) -> None:
+        """
+        Args:
+            smd_data (SimpledSMDParser): source smd data
+            detector_id (int): index of detector
+            settings (BandMapSettings): bands and maps of the detector
+        """
+        self.__smd_data = smd_data
+        self.__detector_id = detector_id
+        self.unit: SpectralUnit = settings.get('unit', 'nm')
+        self.__axis = smd_data.spectral_axis(detector_id, self.unit) \
+            .astype(np.float64)
+
+        bands: Dict[str, List[float]] = settings.get('bands', {})
+        for name in bands:
+            if not name.isidentifier() or name in FUNCTIONS:
+                raise ValueError(f"invalid band name ({name})")
+        self.__band_names = list(bands)
+        self.__masks = np.stack(
+            [self.__band_mask(*bands[name]) for name in self.__band_names],
+            axis=1) if bands else np.zeros((self.__axis.size, 0), bool)
+        self.__weights = np.stack(
+            [integration_weights(self.__axis, *bands[name])
+             for name in self.__band_names],
+            axis=1) if bands else np.zeros((self.__axis.size, 0))
+
+        self.__expressions = {name: BandExpression(text)
+                              for name, text in settings.get('maps',
+                                                             {}).items()}
+        if not self.__expressions:
+            raise ValueError("no map is defined")
+        self.__values = {value: self.__parse_value(value, name)
+                         for name, expression in self.__expressions.items()
+                         for value in expression.names}
+
+    def __band_mask(self, start: float, stop: float) -> np.ndarray:
+        low, high = min(start, stop), max(start, stop)
+        return (self.__axis >= low) & (self.__axis <= high)
+
+    def __parse_value(self, value: str, map_name: str) -> Tuple[int, str]:
+        """returns index of band and quantity of value name"""
+        if value in self.__band_names:
+            return self.__band_names.index(value), 'area'
+        band, _, quantity = value.rpartition('_')
+        if band in self.__band_names and quantity in QUANTITIES:
+            return self.__band_names.index(band), quantity
+        raise ValueError(f"unknown value in map {map_name} ({value})")
+
+    @property
+    def map_names(self) -> List[str]:
+        return list(self.__expressions)
+
+    def __band_values(self, spectra: np.ndarray) -> Dict[str, np.ndarray]:
+        """returns values used in expressions for chunk of spectra"""
+        quantities = set(quantity for _, quantity in self.__values.values())
+        areas = spectra @ self.__weights  # all bands at once
+        res: Dict[str, np.ndarray] = {}
+        with np.errstate(all='ignore'):
+            if 'centroid' in quantities:
+                moments = spectra @ (self.__weights * self.__axis[:, None])
+            for value, (idx, quantity) in self.__values.items():
+                if quantity == 'area':
+                    res[value] = areas[:, idx]
+                elif quantity == 'mean':
+                    res[value] = areas[:, idx] / self.__weights[:, idx].sum()
+                elif quantity == 'centroid':
+                    res[value] = moments[:, idx] / areas[:, idx]
+                else:
+                    band = spectra[:, self.__masks[:, idx]]
+                    if quantity == 'max':
+                        res[value] = band.max(axis=1)
+                    else:  # peak
+                        axis = self.__axis[self.__masks[:, idx]]
+                        res[value] = axis[band.argmax(axis=1)]
+        return res
+
+    def generate(self) -> Dict[str, np.ndarray]:
+        """returns maps (array[z][y][x]) of all expressions"""
+        spectra = self.__smd_data.detector_spectra(self.__detector_id)
+        pixel_num = spectra.shape[0]
+        res = {name: np.empty(pixel_num, dtype=np.float32)
+               for name in self.__expressions}
+        for start in range(0, pixel_num, self.CHUNK_SPECTRA):
+            stop = start + self.CHUNK_SPECTRA
+            chunk = spectra[start:stop].astype(np.float64)
+            values = self.__band_values(chunk)
+            for name, expression in self.__expressions.items():
+                res[name][start:stop] = np.broadcast_to(
+                    expression.evaluate(values), (chunk.shape[0],))
+        spatial_size = self.__smd_data.spatial_size
+        return {name: arr.reshape(spatial_size) for name, arr in res.items()}
+
+    def save(self, dst_dir: str, base_name: str,
+             writer: Union[OutputWriter, None] = None) -> List[str]:
+        """compute maps and save them as "<base_name>_<map name>.ibw"
+        (names are checked, and base_name is made valid and shortened if
+        needed, before maps are computed)
+
+        Returns:
+            List[str]: paths of saved maps
+        """
+        if writer is None:
+            with OutputWriter() as writer:
+                return self.save(dst_dir, base_name, writer)
+
+        wave_names = dict(zip(self.map_names, map_wave_names(
+            base_name, [f"_{name}" for name in self.map_names])))
+        paths = []
+        for name, arr in self.generate().items():
+            wave_name = wave_names[name]
+            path = os.path.join(dst_dir, f"{wave_name}.ibw")
+            note = make_map_note(self.__smd_data, self.__detector_id, {
+                "Value": name,
+                "Expression": self.__expressions[name].text,
+                "Unit of bands": self.unit})
+            save_map(path, wave_name, arr, self.__smd_data, note,
+                     writer=writer)
+            paths.append(path)
+        return paths
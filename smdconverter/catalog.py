@@ -0,0 +1,125 @@
+"""
+Catalog of converted outputs
+
+Outputs are recorded with a key made from the content fingerprint of the
+source smd file, the selected detector and the preprocessing steps, so that
+duplicated acquisitions (identical smd files saved under different names)
+are not converted again: existing outputs are hard-linked or copied (with
+the wave renamed) instead.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Union
+
+from .constants import CATALOG_PATH
+from .ibwio import (BIN_HEADER_SIZE, DATA_OFFSET, NAME_OFFSET, NAME_SIZE,
+                    IBWHeader, update_checksum)
+
+WAVE_NAME_OFFSET = BIN_HEADER_SIZE + NAME_OFFSET
+
+
+def read_wave_name(path: str) -> str:
+    """returns name of wave saved in ibw file"""
+    return IBWHeader.read(path).name
+
+
+def is_same_file(path: str, other_path: str) -> bool:
+    """returns whether paths refer to the same file (False if either of
+    them does not exist)"""
+    try:
+        return os.path.samefile(path, other_path)
+    except OSError:
+        return False
+
+
+def copy_renamed_wave(src_path: str, dst_path: str, name: str) -> None:
+    """copy ibw file and rename the wave in the copy
+    (checksum of the headers is updated)"""
+    encoded = name.encode('ascii')
+    if len(encoded) >= NAME_SIZE:
+        raise ValueError(f"wave name is too long ({name})")
+
+    shutil.copyfile(src_path, dst_path)
+    with open(dst_path, mode='r+b') as f:
+        header = bytearray(f.read(DATA_OFFSET))
+        byte_order = IBWHeader.from_bytes(bytes(header)).byte_order
+        header[WAVE_NAME_OFFSET:WAVE_NAME_OFFSET + NAME_SIZE] = \
+            encoded.ljust(NAME_SIZE, b'\x00')
+        update_checksum(header, byte_order)
+        f.seek(0)
+        f.write(header)
+
+
+class OutputCatalog:
+    """Catalog of outputs identified by contents of their sources
+    It is safe to look up and record outputs from multiple threads.
+    """
+    VERSION = 1
+
+    def __init__(self, path: str = CATALOG_PATH) -> None:
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, mode='r') as f:
+                catalog_dict = json.load(f)
+            if catalog_dict.get('version') == self.VERSION:
+                self.__entries = catalog_dict['entries']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @staticmethod
+    def make_key(fingerprint: str, detector_id: int,
+                 preprocess_steps: Union[List[Dict[str, Any]], None] = None
+                 ) -> str:
+        """returns key of output made from source of the fingerprint"""
+        key = json.dumps([fingerprint, detector_id, preprocess_steps or []],
+                         sort_keys=True)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str) -> Union[str, None]:
+        """returns path of output recorded with the key
+        (None if not recorded, or the output was removed or changed)"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(entry['path'])
+        except OSError:
+            return None
+        if [stat.st_size, stat.st_mtime_ns] != [entry['size'],
+                                                entry['mtime_ns']]:
+            return None
+        return entry['path']
+
+    def record(self, key: str, output_path: str) -> None:
+        output_path = os.path.abspath(output_path)
+        stat = os.stat(output_path)
+        with self.__lock:
+            self.__entries[key] = {'path': output_path,
+                                   'size': stat.st_size,
+                                   'mtime_ns': stat.st_mtime_ns}
+
+    def save(self) -> None:
+        """save catalog into json file (atomically)"""
+        dir_name = os.path.dirname(self.__path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        with self.__lock:
+            catalog_dict = {'version': self.VERSION,
+                            'entries': dict(self.__entries)}
+        tmp_path = f"{self.__path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode='w') as f:
+            json.dump(catalog_dict, f)
+        os.replace(tmp_path, self.__path)
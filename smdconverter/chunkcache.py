@@ -0,0 +1,98 @@
+"""
+LRU cache of decoded chunks of spectral data
+
+Random reads (e.g. spectra of pixels clicked in a viewer) often hit the same
+regions again and again. When a cache is set to SimpledSMDParser, spectra
+are read through chunks of rows (array[y][x][r] of a detector in a
+z-plane) which are copied into memory once and kept while the total size of
+cached chunks is within the limit, so that repeated access does not go back
+to the (possibly network-mounted) file.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ChunkCache:
+    """Byte-bounded LRU cache of arrays (thread-safe)
+    A cache can be shared by multiple parsers.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES,
+                 rows_per_chunk: int = 8) -> None:
+        """
+        Args:
+            max_bytes (int, optional): upper limit of total size of cached
+                chunks. Defaults to DEFAULT_MAX_BYTES.
+            rows_per_chunk (int, optional): number of y-rows in each chunk.
+                Defaults to 8.
+        """
+        if rows_per_chunk < 1:
+            raise ValueError(
+                f"rows per chunk must be positive (got {rows_per_chunk})")
+        self.max_bytes = max_bytes
+        self.rows_per_chunk = rows_per_chunk
+        self.hits = 0
+        self.misses = 0
+        self.__chunks: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """returns total size of cached chunks in bytes"""
+        return self.__size
+
+    def __len__(self) -> int:
+        return len(self.__chunks)
+
+    def get(self, key: Hashable,
+            loader: Callable[[], np.ndarray]) -> np.ndarray:
+        """returns cached chunk, or chunk loaded with loader (cached if it
+        is not larger than the limit). Returned arrays are read-only.
+        """
+        with self.__lock:
+            chunk = self.__chunks.get(key)
+            if chunk is not None:
+                self.__chunks.move_to_end(key)
+                self.hits += 1
+                return chunk
+            self.misses += 1
+
+        chunk = loader()  # loaded without lock (may be slow)
+        chunk.setflags(write=False)
+        if chunk.nbytes > self.max_bytes:
+            return chunk
+        with self.__lock:
+            if key not in self.__chunks:
+                self.__chunks[key] = chunk
+                self.__size += chunk.nbytes
+            while self.__size > self.max_bytes:
+                _, evicted = self.__chunks.popitem(last=False)
+                self.__size -= evicted.nbytes
+        return chunk
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__chunks.clear()
+            self.__size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """returns counts of hits and misses, and number and total size of
+        cached chunks"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'chunks': len(self.__chunks), 'bytes': self.__size}
+
+    def summary(self) -> str:
+        requests = self.hits + self.misses
+        rate = self.hits / requests * 100 if requests else 0.0
+        return (f"{self.hits} hit(s), {self.misses} miss(es) "
+                f"({rate:.1f}% hit), {len(self.__chunks)} chunk(s) "
+                f"({self.__size / 1024 / 1024:.1f} MiB) cached")
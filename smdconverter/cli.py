@@ -0,0 +1,486 @@
+"""
+Command line interface of SMD Converter
+
+Usage
+=====
+Make quick-look preview maps of smd files with:
+  >>> python -m smdconverter.cli preview file1.smd file2.smd ...
+
+Verify outputs of a conversion session (the last session by default) with:
+  >>> python -m smdconverter.cli verify [session.json]
+
+Stitch tiles (smd files acquired at adjacent areas) into one wave with:
+  >>> python -m smdconverter.cli stitch output.ibw tile1.smd tile2.smd ...
+
+Stack repeated acquisitions of the same region into one time-series wave:
+  >>> python -m smdconverter.cli stack output.ibw frame1.smd frame2.smd ...
+
+Save spectral axes of smd files (each distinct axis only once) with:
+  >>> python -m smdconverter.cli axes dst_dir file1.smd file2.smd ...
+
+Find smd files with identical contents (saved under different names) with:
+  >>> python -m smdconverter.cli fingerprint file1.smd file2.smd ...
+
+Fit Lorentzian to every spectrum and save maps of fitted parameters with:
+  >>> python -m smdconverter.cli fit dst_dir file1.smd file2.smd ...
+
+Denoise spectra by PCA (save low-rank data, scores and loadings) with:
+  >>> python -m smdconverter.cli denoise dst_dir file1.smd ... --rank 10
+
+Save maps of expressions over bands (set in "bandMaps" of settings) with:
+  >>> python -m smdconverter.cli maps dst_dir file1.smd file2.smd ...
+
+Print spectra at pixels (z y x) or along a line as CSV with:
+  >>> python -m smdconverter.cli spectrum file.smd --point 0 10 20
+  >>> python -m smdconverter.cli spectrum file.smd --line 0 0 0 0 10 20
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import sys
+from typing import Dict, List, Sequence, TextIO, Union
+
+from .appsettings import ApplicationSettingsHandler
+from .axisexport import SpectralAxisExport, existing_names
+from .bandmaps import BandMapGenerator
+from .chunkcache import ChunkCache
+from .constants import (HEADER_CACHE_DIR, PREVIEW_CACHE_DIR,
+                        SESSION_AUTOSAVE_PATH, SETTINGS_JSON_PATH)
+from .convertjob import ConvertJob
+from .denoise import PCADenoiser
+from .headercache import HeaderCache
+from .peakfit import PeakFitMapper
+from .preview import PreviewCache
+from .session import JobSession
+from .smdparser import SPECTRAL_UNITS, Coordinate, SimpledSMDParser
+from .stack import TimeSeriesStacker, group_by_geometry, numbered_paths
+from .stitch import TileStitcher
+
+
+def preview(args: argparse.Namespace) -> int:
+    settings = ApplicationSettingsHandler(args.settings).load()
+    cache = PreviewCache(args.cache_dir)
+    failed = False
+    for path in args.paths:
+        try:
+            smd_data = SimpledSMDParser.from_file(path)
+            entry_dir, previews = cache.get(
+                smd_data, path, settings.preview_bands)
+        except Exception as error:
+            print(f"Skipped (illegal format): {path} ({error})")
+            failed = True
+            continue
+
+        print(f"{path}:")
+        for detector_id, maps in enumerate(previews):
+            print(f"  {detector_id}: {smd_data.detector_names[detector_id]}")
+            for map_name, arr in maps.items():
+                thumbnail = cache.thumbnail_path(
+                    entry_dir, detector_id, map_name)
+                print(f"    {map_name}: {arr.min():.4g} ~ {arr.max():.4g} "
+                      f"({thumbnail})")
+    return 1 if failed else 0
+
+
+def stitch(args: argparse.Namespace) -> int:
+    try:
+        tiles = [SimpledSMDParser.from_file(path) for path in args.paths]
+        stitcher = TileStitcher(
+            tiles, [args.detector] * len(tiles),
+            [os.path.splitext(os.path.basename(path))[0]
+             for path in args.paths])
+        stitcher.save(args.output, args.name)
+    except Exception as error:
+        print(f"Error: Stitching failed ({error})")
+        return 1
+    stitcher.report.print_summary()
+    return 0
+
+
+def stack(args: argparse.Namespace) -> int:
+    try:
+        frames = [SimpledSMDParser.from_file(path) for path in args.paths]
+        detector_ids = [args.detector] * len(frames)
+        groups = group_by_geometry(frames, detector_ids)
+        paths = numbered_paths(args.output, len(groups))
+        for idx, (group, path) in enumerate(zip(groups, paths)):
+            if len(groups) > 1:
+                print(f"{path}: {len(group)} frame(s) of the same geometry")
+            stacker = TimeSeriesStacker(
+                [frames[frame_idx] for frame_idx in group],
+                [args.detector] * len(group),
+                [os.path.splitext(os.path.basename(args.paths[frame_idx]))[0]
+                 for frame_idx in group])
+            name = args.name if args.name is None or len(groups) == 1 \
+                else f"{args.name}_{idx}"
+            stacker.save(path, name)
+    except Exception as error:
+        print(f"Error: Stacking failed ({error})")
+        return 1
+    return 0
+
+
+def axes(args: argparse.Namespace) -> int:
+    settings = ApplicationSettingsHandler(args.settings).load()
+    jobs = []
+    failed = False
+    for path in args.paths:
+        try:
+            job = ConvertJob(path, "")
+            job.output_name = job.smd_name
+            jobs.append(job.select_detector(args.detector))
+        except Exception as error:
+            print(f"Skipped (illegal format): {path} ({error})")
+            failed = True
+
+    dst_dir = os.path.join(args.dst_dir, "")
+    export = SpectralAxisExport(jobs, args.units, settings,
+                                existing_names(dst_dir))
+    try:
+        export.save(dst_dir)
+    except Exception as error:
+        print(f"Failed: {dst_dir} ({error})")
+        return 1
+    print("\n".join(export.lines()))
+    return 1 if failed else 0
+
+
+def fingerprint(args: argparse.Namespace) -> int:
+    header_cache = HeaderCache(args.cache_dir)
+    groups: Dict[str, List[str]] = {}  # fingerprint -> paths
+    failed = False
+    for path in args.paths:
+        try:
+            fingerprint_ = header_cache.load_fingerprint(path)
+            if fingerprint_ is None:
+                smd_data = SimpledSMDParser.from_file(path, header_cache)
+                fingerprint_ = smd_data.content_fingerprint()
+                header_cache.save_fingerprint(path, fingerprint_)
+        except Exception as error:
+            print(f"Skipped (illegal format): {path} ({error})")
+            failed = True
+            continue
+        print(f"{fingerprint_}  {path}")
+        groups.setdefault(fingerprint_, []).append(path)
+
+    for paths in groups.values():
+        if len(paths) > 1:
+            print(f"Duplicates: {', '.join(paths)}")
+    return 1 if failed else 0
+
+
+def fit(args: argparse.Namespace) -> int:
+    failed = False
+    for path in args.paths:
+        try:
+            mapper = PeakFitMapper(
+                path, args.detector, args.unit, args.start, args.stop,
+                args.iterations, args.workers)
+            mapper.save(args.dst_dir,
+                        os.path.splitext(os.path.basename(path))[0])
+        except Exception as error:
+            print(f"Failed: {path} ({error})")
+            failed = True
+    return 1 if failed else 0
+
+
+def denoise(args: argparse.Namespace) -> int:
+    failed = False
+    for path in args.paths:
+        try:
+            denoiser = PCADenoiser(
+                SimpledSMDParser.from_file(path), args.detector, args.rank,
+                args.oversampling, args.power_iterations)
+            denoiser.save(args.dst_dir,
+                          os.path.splitext(os.path.basename(path))[0])
+        except Exception as error:
+            print(f"Failed: {path} ({error})")
+            failed = True
+            continue
+        ratios = denoiser.pca.explained_variance_ratio
+        print(f"Explained variance: {ratios.sum():.4g} "
+              f"({', '.join(f'{ratio:.3g}' for ratio in ratios)})")
+    return 1 if failed else 0
+
+
+def maps(args: argparse.Namespace) -> int:
+    settings = ApplicationSettingsHandler(args.settings).load()
+    failed = False
+    for path in args.paths:
+        try:
+            smd_data = SimpledSMDParser.from_file(path)
+            detector_name = smd_data.detector_names[args.detector]
+            if detector_name not in settings.band_maps:
+                raise ValueError(
+                    f"no band map is defined for {detector_name}")
+            generator = BandMapGenerator(
+                smd_data, args.detector, settings.band_maps[detector_name])
+            generator.save(args.dst_dir,
+                           os.path.splitext(os.path.basename(path))[0])
+        except Exception as error:
+            print(f"Failed: {path} ({error})")
+            failed = True
+    return 1 if failed else 0
+
+
+def read_coordinates(path: str) -> List[Coordinate]:
+    """read coordinates (z y x, separated with spaces or commas in each
+    line) from text file"""
+    res: List[Coordinate] = []
+    with open(path, mode='r', encoding='utf-8') as f:
+        for line in f:
+            values = line.replace(',', ' ').split()
+            if not values or values[0].startswith('#'):
+                continue
+            if len(values) != 3:
+                raise ValueError(f"invalid coordinate ({line.strip()})")
+            res.append((int(values[0]), int(values[1]), int(values[2])))
+    return res
+
+
+def write_spectra(f: TextIO, axis_label: str, axis: List[float],
+                  coordinates: List[Coordinate],
+                  spectra: Sequence[Sequence[float]]) -> None:
+    """write spectral axis and spectra (one column for each point)"""
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow([axis_label] + [f"({z} {y} {x})"
+                                    for z, y, x in coordinates])
+    for idx, value in enumerate(axis):
+        writer.writerow([f"{value:.6g}"] + [f"{spectrum[idx]:.7g}"
+                                            for spectrum in spectra])
+
+
+def spectrum(args: argparse.Namespace) -> int:
+    settings = ApplicationSettingsHandler(args.settings).load()
+    cache = ChunkCache(settings.read_cache_bytes, settings.read_cache_rows)
+    coordinates: List[Coordinate] = [tuple(point)  # type: ignore
+                                     for point in args.point or []]
+    try:
+        smd_data = SimpledSMDParser.from_file(args.path) \
+            .set_chunk_cache(cache)
+        if args.line:
+            coordinates += SimpledSMDParser.line_coordinates(
+                tuple(args.line[:3]), tuple(args.line[3:]))  # type: ignore
+        if args.coords:
+            coordinates += read_coordinates(args.coords)
+        if not coordinates:
+            raise ValueError("no point is specified")
+        spectra = smd_data.read_spectra(coordinates, args.detector)
+        axis = smd_data.spectral_axis(args.detector, args.unit)
+    except Exception as error:
+        print(f"Error: Reading spectra failed ({error})")
+        return 1
+
+    if args.output is None:
+        write_spectra(sys.stdout, args.unit, axis.tolist(), coordinates,
+                      spectra.tolist())
+    else:
+        with open(args.output, mode='w', encoding='utf-8', newline='') as f:
+            write_spectra(f, args.unit, axis.tolist(), coordinates,
+                          spectra.tolist())
+        print(f"Saved: {args.output}")
+        print(f"Information: Chunk cache: {cache.summary()}")
+    return 0
+
+
+def verify(args: argparse.Namespace) -> int:
+    settings = ApplicationSettingsHandler(args.settings).load()
+    try:
+        session = JobSession.load(args.session)
+    except (OSError, ValueError) as error:
+        print(f"Error: Loading session failed ({error})")
+        return 1
+    dst_dir = args.dst_dir if args.dst_dir is not None else session.dst_dir
+    if dst_dir and not dst_dir.endswith(('/', '\\')):
+        dst_dir += '/'
+
+    failed = False
+    for job in session.jobs:
+        if job.status != 'done' and not args.all:
+            continue
+        output_path = job.output_path(dst_dir)
+        try:
+            problems = job.verify(
+                dst_dir, settings.preprocessing_steps(
+                    job.selected_detector_name),
+                check_data=not args.checksum_only)
+        except Exception as error:
+            problems = [str(error)]
+        if problems:
+            print(f"Mismatch: {output_path} ({'; '.join(problems)})")
+            failed = True
+        else:
+            print(f"OK: {output_path}")
+    return 1 if failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m smdconverter.cli",
+        description="Command line tools of SMD Converter")
+    parser.add_argument(
+        '--settings', default=SETTINGS_JSON_PATH,
+        help="path of settings file (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    preview_parser = subparsers.add_parser(
+        'preview', help="make quick-look preview maps of smd files")
+    preview_parser.add_argument('paths', nargs='+', help="smd files")
+    preview_parser.add_argument(
+        '--cache-dir', default=PREVIEW_CACHE_DIR,
+        help="directory to store previews (default: %(default)s)")
+    preview_parser.set_defaults(func=preview)
+
+    verify_parser = subparsers.add_parser(
+        'verify', help="compare outputs of a session with their sources")
+    verify_parser.add_argument(
+        'session', nargs='?', default=SESSION_AUTOSAVE_PATH,
+        help="session file (default: %(default)s)")
+    verify_parser.add_argument(
+        '--dst-dir', default=None,
+        help="directory of outputs (default: destination in session)")
+    verify_parser.add_argument(
+        '--checksum-only', action='store_true',
+        help="check only checksums recorded when outputs were written")
+    verify_parser.add_argument(
+        '--all', action='store_true',
+        help="verify also jobs which are not completed")
+    verify_parser.set_defaults(func=verify)
+
+    stitch_parser = subparsers.add_parser(
+        'stitch', help="stitch tiles into one ibw file")
+    stitch_parser.add_argument('output', help="output ibw file")
+    stitch_parser.add_argument('paths', nargs='+', help="smd files of tiles")
+    stitch_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector stitched (default: %(default)s)")
+    stitch_parser.add_argument(
+        '--name', default=None,
+        help="name of wave (default: name of output file)")
+    stitch_parser.set_defaults(func=stitch)
+
+    stack_parser = subparsers.add_parser(
+        'stack', help="stack repeated acquisitions into time-series wave")
+    stack_parser.add_argument(
+        'output', help="output ibw file (numbered if multiple geometries)")
+    stack_parser.add_argument('paths', nargs='+', help="smd files of frames")
+    stack_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector stacked (default: %(default)s)")
+    stack_parser.add_argument(
+        '--name', default=None,
+        help="name of wave (default: name of output file)")
+    stack_parser.set_defaults(func=stack)
+
+    axes_parser = subparsers.add_parser(
+        'axes', help="save distinct spectral axes of smd files")
+    axes_parser.add_argument('dst_dir', help="destination directory")
+    axes_parser.add_argument('paths', nargs='+', help="smd files")
+    axes_parser.add_argument(
+        '--units', nargs='+', choices=SPECTRAL_UNITS,
+        default=list(SPECTRAL_UNITS),
+        help="units of axes (default: all units)")
+    axes_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector (default: %(default)s)")
+    axes_parser.set_defaults(func=axes)
+
+    fingerprint_parser = subparsers.add_parser(
+        'fingerprint',
+        help="print content fingerprints of smd files and find duplicates")
+    fingerprint_parser.add_argument('paths', nargs='+', help="smd files")
+    fingerprint_parser.add_argument(
+        '--cache-dir', default=HEADER_CACHE_DIR,
+        help="directory to cache headers and fingerprints "
+             "(default: %(default)s)")
+    fingerprint_parser.set_defaults(func=fingerprint)
+
+    fit_parser = subparsers.add_parser(
+        'fit', help="fit Lorentzian to all spectra and save parameter maps")
+    fit_parser.add_argument('dst_dir', help="destination directory")
+    fit_parser.add_argument('paths', nargs='+', help="smd files")
+    fit_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector (default: %(default)s)")
+    fit_parser.add_argument(
+        '--unit', choices=SPECTRAL_UNITS, default='GHz',
+        help="unit of spectral axis (default: %(default)s)")
+    fit_parser.add_argument(
+        '--start', type=float, default=None,
+        help="start of fitted range (default: start of axis)")
+    fit_parser.add_argument(
+        '--stop', type=float, default=None,
+        help="stop of fitted range (default: end of axis)")
+    fit_parser.add_argument(
+        '--iterations', type=int, default=50,
+        help="maximum number of iterations (default: %(default)s)")
+    fit_parser.add_argument(
+        '--workers', type=int, default=0,
+        help="number of worker processes (default: number of CPUs)")
+    fit_parser.set_defaults(func=fit)
+
+    denoise_parser = subparsers.add_parser(
+        'denoise', help="denoise spectra by PCA (randomized SVD)")
+    denoise_parser.add_argument('dst_dir', help="destination directory")
+    denoise_parser.add_argument('paths', nargs='+', help="smd files")
+    denoise_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector (default: %(default)s)")
+    denoise_parser.add_argument(
+        '--rank', type=int, default=10,
+        help="number of components kept (default: %(default)s)")
+    denoise_parser.add_argument(
+        '--oversampling', type=int, default=10,
+        help="number of additional random vectors (default: %(default)s)")
+    denoise_parser.add_argument(
+        '--power-iterations', type=int, default=2,
+        help="number of power iterations (default: %(default)s)")
+    denoise_parser.set_defaults(func=denoise)
+
+    maps_parser = subparsers.add_parser(
+        'maps', help="save maps of expressions over bands")
+    maps_parser.add_argument('dst_dir', help="destination directory")
+    maps_parser.add_argument('paths', nargs='+', help="smd files")
+    maps_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector (default: %(default)s)")
+    maps_parser.set_defaults(func=maps)
+
+    spectrum_parser = subparsers.add_parser(
+        'spectrum', help="print spectra at pixels as CSV")
+    spectrum_parser.add_argument('path', help="smd file")
+    spectrum_parser.add_argument(
+        '--point', type=int, nargs=3, action='append',
+        metavar=('Z', 'Y', 'X'), help="pixel (can be repeated)")
+    spectrum_parser.add_argument(
+        '--line', type=int, nargs=6,
+        metavar=('Z0', 'Y0', 'X0', 'Z1', 'Y1', 'X1'),
+        help="pixels on the line from (Z0, Y0, X0) to (Z1, Y1, X1)")
+    spectrum_parser.add_argument(
+        '--coords', default=None,
+        help="text file with a pixel (z y x) in each line")
+    spectrum_parser.add_argument(
+        '--detector', type=int, default=0,
+        help="index of detector (default: %(default)s)")
+    spectrum_parser.add_argument(
+        '--unit', choices=SPECTRAL_UNITS, default='nm',
+        help="unit of spectral axis (default: %(default)s)")
+    spectrum_parser.add_argument(
+        '--output', default=None,
+        help="output CSV file (default: standard output)")
+    spectrum_parser.set_defaults(func=spectrum)
+
+    return parser
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
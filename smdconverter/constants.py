@@ -1,4 +1,4 @@
-import pkg_resources
+import os
 from typing import Any, Dict
 
 from typing_extensions import Literal
@@ -8,15 +8,22 @@ GITHUB_URL = "https://github.com/MiLL4U/smd-converter/releases"
 
 # literals
 Direction = Literal['Up', 'Down']
+JobStatus = Literal['pending', 'done', 'failed']
 
 # layout options
 PADDING_OPTIONS: Dict[str, Any] = {'padx': 5, 'pady': 5}
 
 # assets
-IMAGE_PATH = pkg_resources.resource_filename('smdconverter', 'image/')
+# NOTE: IMAGE_PATH is resolved on first access (see __getattr__ below)
+# because only GUI uses it and importlib.resources is slow to import
 
 # file paths
 SETTINGS_JSON_PATH = "settings.json"
+CACHE_DIR = "cache"
+PREVIEW_CACHE_DIR = os.path.join(CACHE_DIR, "preview")
+HEADER_CACHE_DIR = os.path.join(CACHE_DIR, "header")
+SESSION_AUTOSAVE_PATH = os.path.join(CACHE_DIR, "last_session.json")
+CATALOG_PATH = os.path.join(CACHE_DIR, "catalog.json")
 
 # columns for tree
 SPECTRAL_DATA_FORMAT_COLUMNS = ('detector', 'name_fmt')
@@ -33,3 +40,19 @@ FORMAT_DESCRIPTION = """Format specifiers
   [Acquisition date]
     %Y: year (4 digits), %y: year (2 digits), %m: month, %d: day,
     %H: hour, %M: minute, %S: second"""
+
+
+def _image_path() -> str:
+    try:
+        from importlib.resources import files
+    except ImportError:  # Python < 3.9
+        return os.path.join(os.path.dirname(__file__), 'image', '')
+    return os.path.join(str(files('smdconverter') / 'image'), '')
+
+
+def __getattr__(name: str) -> Any:
+    if name == 'IMAGE_PATH':
+        image_path = _image_path()
+        globals()['IMAGE_PATH'] = image_path  # resolved only once
+        return image_path
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
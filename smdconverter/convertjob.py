@@ -1,34 +1,69 @@
 from __future__ import annotations
 
+import copy
 import datetime
+import json
 import os
-from typing import Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, Union
 
 import numpy as np
-from ibwpy import BinaryWave5
 
+from .catalog import copy_renamed_wave, is_same_file, read_wave_name
+from .constants import JobStatus
+from .datastats import DetectorStatistics
+from .outputwriter import CommitCallback, OutputWriter, file_checksum
+from .preprocess import SpectralPreprocessor
+from .preview import BandSettings, PreviewCache, PreviewMaps
 from .smdibwcnv import SimpledSMDIBWConverter
 from .smdparser import SimpledSMDParser, SpectralUnit
+from .verify import verify_output
+
+if TYPE_CHECKING:
+    from ibwpy import BinaryWave5
+
+    from .headercache import HeaderCache
 
 
 class ConvertJob:
-    def __init__(self, src_path: str, output_name: str) -> None:
+    def __init__(self, src_path: str, output_name: str,
+                 header_cache: Union[HeaderCache, None] = None) -> None:
         """Converter of smd data into ibw file.
         It contains source smd data and settings for conversion.
 
         Args:
             src_path (str): source data (smd data)
             output_name (str): name of output wave (used in igor)
+            header_cache (Union[HeaderCache, None], optional): cache of
+                parsed headers used to open source. Defaults to None.
         """
         self.__src_path = src_path
         self.output_name = output_name
 
-        with open(src_path, mode='rb') as f:
-            smd_buffer = f.read()
-        self.__smd_data = SimpledSMDParser(smd_buffer)
+        self.__header_cache = header_cache
+        self.__smd_data = SimpledSMDParser.from_file(src_path, header_cache)
         self.converter = SimpledSMDIBWConverter(self.__smd_data)
         self.__selected_detector = self.detector_ids[0]
 
+        # state of conversion (saved in session files)
+        self.status: JobStatus = 'pending'
+        self.output_checksum: Union[str, None] = None  # sha256 of output
+
+        # statistics of output data (raw values at or above saturation
+        # level are counted as saturated)
+        self.collect_statistics = True
+        self.saturation_level: Union[float, None] = None
+        self.statistics: Union[DetectorStatistics, None] = None
+        self.__statistics_key = ""  # key of statistics in header cache
+
+    def duplicate(self) -> ConvertJob:
+        """returns new job which shares source smd data with this job
+        (source data is memory-mapped and never copied)
+
+        Returns:
+            ConvertJob: duplicated job
+        """
+        return copy.copy(self)
+
     @property
     def smd_data(self) -> SimpledSMDParser:
         """getter of source smd data (SimpledSMDParser)
@@ -64,6 +99,23 @@ class ConvertJob:
         self.__selected_detector = id_
         return self
 
+    def content_fingerprint(self) -> str:
+        """returns fingerprint of contents of source smd file
+        (loaded from the header cache if it was computed before)
+
+        Returns:
+            str: hex digest of contents
+        """
+        if self.__header_cache is not None:
+            fingerprint = self.__header_cache.load_fingerprint(self.src_path)
+            if fingerprint is not None:
+                self.__smd_data.set_content_fingerprint(fingerprint)
+                return fingerprint
+            fingerprint = self.__smd_data.content_fingerprint()
+            self.__header_cache.save_fingerprint(self.src_path, fingerprint)
+            return fingerprint
+        return self.__smd_data.content_fingerprint()
+
     @property
     def src_path(self) -> str:
         """returns path of source smd file
@@ -142,16 +194,223 @@ class ConvertJob:
         return self.__smd_data.creation_datetime
 
     def spectral_axis_array(self, unit: SpectralUnit) -> np.ndarray:
+        """returns spectral axis of selected detector (read-only)"""
         return self.__smd_data.spectral_axis(self.selected_detector, unit)
 
+    def spectral_axis_arrays(self) -> Dict[SpectralUnit, np.ndarray]:
+        """returns spectral axes of selected detector in all units
+        (read-only)"""
+        return self.__smd_data.spectral_axes(self.selected_detector)
+
     def spectra_axis_ibw(self, unit: SpectralUnit, name: str) -> BinaryWave5:
         ibw = self.converter.make_spectral_axis(
             name=name, detector_id=self.selected_detector, unit=unit)
         return ibw
 
-    def convert(self, path: str) -> None:
+    def preview(self, bands: Dict[str, BandSettings],
+                cache: Union[PreviewCache, None] = None
+                ) -> Tuple[str, PreviewMaps]:
+        """returns preview maps of selected detector
+        (maps of all detectors are computed and cached at the first time)
+
+        Args:
+            bands (Dict[str, BandSettings]): band integrated in band map
+                for each detector name
+            cache (Union[PreviewCache, None], optional): cache of previews.
+                Defaults to None (cache in default directory is used).
+
+        Returns:
+            Tuple[str, PreviewMaps]: directory of cache entry (contains
+                thumbnails) and preview maps of selected detector
+        """
+        cache = cache or PreviewCache()
+        entry_dir, previews = cache.get(self.__smd_data, self.src_path, bands)
+        return entry_dir, previews[self.selected_detector]
+
+    def make_preprocessor(
+            self, steps_settings: List[Dict[str, Any]]
+    ) -> Union[SpectralPreprocessor, None]:
+        """make preprocessor of selected detector from settings of steps
+
+        Returns:
+            Union[SpectralPreprocessor, None]: preprocessor
+                (None if no step is specified)
+        """
+        if not steps_settings:
+            return None
+        return SpectralPreprocessor.from_settings(
+            steps_settings, self.__smd_data, self.selected_detector)
+
+    def convert(self, path: str,
+                preprocess_steps: Union[List[Dict[str, Any]], None] = None,
+                writer: Union[OutputWriter, None] = None) -> None:
+        """convert source into ibw file in the directory
+        Output is written atomically with writer. The job becomes 'done' when
+        the output is committed (it may be later than return of this method
+        when writer commits files in batches).
+
+        Args:
+            path (str): destination directory (ends with separator)
+            preprocess_steps (Union[List[Dict[str, Any]], None], optional):
+                settings of preprocessing steps. Defaults to None.
+            writer (Union[OutputWriter, None], optional): writer of output.
+                Defaults to None (output is committed immediately).
+        """
+        ibw = self.make_output(preprocess_steps)
+        self.write_output(ibw, path, writer)
+
+    def verify(self, path: str,
+               preprocess_steps: Union[List[Dict[str, Any]], None] = None,
+               check_data: bool = True) -> List[str]:
+        """compare output in the directory with source (and checksum
+        recorded when it was written)
+
+        Args:
+            path (str): destination directory (ends with separator)
+            preprocess_steps (Union[List[Dict[str, Any]], None], optional):
+                settings of preprocessing steps applied in conversion.
+                Defaults to None.
+            check_data (bool, optional): whether to compare data.
+                Defaults to True.
+
+        Returns:
+            List[str]: problems found (empty if output matches source)
+        """
+        return verify_output(
+            self.__smd_data, self.selected_detector, self.output_path(path),
+            checksum=self.output_checksum,
+            preprocessor=self.make_preprocessor(preprocess_steps or []),
+            check_data=check_data)
+
+    def output_path(self, path: str) -> str:
+        """returns path of output ibw file in the directory"""
+        return f"{path}{self.output_name}.ibw"
+
+    def make_output(
+            self, preprocess_steps: Union[List[Dict[str, Any]], None] = None
+    ) -> BinaryWave5:
+        """make ibw of selected detector (not written yet)
+
+        Args:
+            preprocess_steps (Union[List[Dict[str, Any]], None], optional):
+                settings of preprocessing steps. Defaults to None.
+
+        Returns:
+            BinaryWave5: output wave
+        If collect_statistics is True, statistics of data are accumulated
+        while the wave is made and saved in its note. They are saved in
+        header cache (if the job has one) when the output is committed.
+        """
+        statistics = DetectorStatistics(self.saturation_level) \
+            if self.collect_statistics else None
         ibw = self.converter.make_body(
-            name=self.output_name, detector_id=self.selected_detector)
-        save_path = f"{path}{self.output_name}.ibw"
-        ibw.save(save_path)
-        print(f"Saved: {save_path}")
+            name=self.output_name, detector_id=self.selected_detector,
+            preprocessor=self.make_preprocessor(preprocess_steps or []),
+            statistics=statistics)
+        self.statistics = statistics
+        self.__statistics_key = self.statistics_key(preprocess_steps)
+        return ibw
+
+    def statistics_key(
+            self, preprocess_steps: Union[List[Dict[str, Any]], None] = None
+    ) -> str:
+        """returns key of statistics in header cache (statistics depend on
+        detector and preprocessing)"""
+        return json.dumps([self.selected_detector, preprocess_steps or []],
+                          sort_keys=True)
+
+    def cached_statistics(
+            self, preprocess_steps: Union[List[Dict[str, Any]], None] = None
+    ) -> Union[Dict[str, Any], None]:
+        """returns statistics of output data recorded in header cache when
+        the job was converted (None if not recorded)"""
+        if self.__header_cache is None:
+            return None
+        return self.__header_cache.load_statistics(
+            self.src_path, self.statistics_key(preprocess_steps))
+
+    def write_output(self, ibw: BinaryWave5, path: str,
+                     writer: Union[OutputWriter, None] = None,
+                     on_commit: Union[CommitCallback, None] = None) -> None:
+        """write ibw made with make_output() into the directory
+
+        Args:
+            ibw (BinaryWave5): output wave
+            path (str): destination directory (ends with separator)
+            writer (Union[OutputWriter, None], optional): writer of output.
+                Defaults to None (output is committed immediately).
+            on_commit (Union[CommitCallback, None], optional): called after
+                the output is committed. Defaults to None.
+        """
+        def save(tmp_path: str) -> None:
+            ibw.save(tmp_path)
+            self.output_checksum = file_checksum(tmp_path)
+
+        statistics, key = self.statistics, self.__statistics_key
+
+        def on_output_commit() -> None:
+            if statistics is not None and self.__header_cache is not None:
+                self.__header_cache.save_statistics(
+                    self.src_path, key, statistics.to_dict())
+            if on_commit:
+                on_commit()
+
+        self.__write_with(save, path, writer, on_output_commit)
+
+    def reuse_output(self, output_path: str, path: str,
+                     writer: Union[OutputWriter, None] = None,
+                     on_commit: Union[CommitCallback, None] = None) -> None:
+        """write output by reusing existing output of identical contents
+        instead of converting source again. The existing file is
+        hard-linked if the wave name is the same, otherwise it is copied and
+        the wave is renamed. Nothing is written if the existing file is the
+        output itself (e.g. the same batch converted again).
+
+        Args:
+            output_path (str): path of existing ibw file
+            path (str): destination directory (ends with separator)
+            writer (Union[OutputWriter, None], optional): writer of output.
+                Defaults to None (output is committed immediately).
+            on_commit (Union[CommitCallback, None], optional): called after
+                the output is committed. Defaults to None.
+        """
+        save_path = self.output_path(path)
+        if is_same_file(output_path, save_path):
+            self.output_checksum = file_checksum(save_path)
+            self.__make_commit_callback(save_path, on_commit)()
+            return
+
+        def save(tmp_path: str) -> None:
+            if read_wave_name(output_path) == self.output_name:
+                try:
+                    os.remove(tmp_path)
+                    os.link(output_path, tmp_path)
+                except OSError:  # e.g. on different file systems
+                    copy_renamed_wave(output_path, tmp_path, self.output_name)
+            else:
+                copy_renamed_wave(output_path, tmp_path, self.output_name)
+            self.output_checksum = file_checksum(tmp_path)
+
+        self.__write_with(save, path, writer, on_commit)
+
+    def __make_commit_callback(
+            self, save_path: str,
+            on_job_commit: Union[CommitCallback, None]) -> CommitCallback:
+        """returns callback called when output of the job is committed"""
+        def on_commit() -> None:
+            self.status = 'done'
+            print(f"Saved: {save_path}")
+            if on_job_commit:
+                on_job_commit()
+        return on_commit
+
+    def __write_with(self, save: Callable[[str], None], path: str,
+                     writer: Union[OutputWriter, None],
+                     on_job_commit: Union[CommitCallback, None]) -> None:
+        save_path = self.output_path(path)
+        on_commit = self.__make_commit_callback(save_path, on_job_commit)
+        if writer is None:
+            with OutputWriter() as writer:
+                writer.write_with(save_path, save, on_commit)
+        else:
+            writer.write_with(save_path, save, on_commit)
@@ -0,0 +1,167 @@
+"""
+Streaming statistics of spectral data
+
+Statistics are accumulated chunk by chunk in two groups:
+    detector: counts of NaN, infinite and saturated values of raw data
+        (before preprocessing, where saturation level is meaningful)
+    output: min, max, mean, standard deviation and histogram of finite
+        values of output data (after preprocessing)
+Mean and variance of chunks are merged with Chan's parallel algorithm, and
+the histogram has a fixed number of bins whose range is doubled whenever
+values out of range are found (adjacent bins are merged), so that the
+range does not have to be known in advance.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+
+class DetectorStatistics:
+    """Accumulator of statistics of values of a detector
+    """
+    BINS = 64  # number of bins of histogram (even)
+
+    def __init__(self, saturation_level: Union[float, None] = None,
+                 bins: int = BINS) -> None:
+        """
+        Args:
+            saturation_level (Union[float, None], optional): raw values at
+                or above this are counted as saturated. Defaults to None
+                (saturation is not counted).
+            bins (int, optional): number of bins of histogram (even).
+                Defaults to BINS.
+        """
+        if bins < 2 or bins % 2:
+            raise ValueError(f"number of bins must be even (got {bins})")
+        self.saturation_level = saturation_level
+        # detector (raw data)
+        self.nan_count = 0
+        self.inf_count = 0
+        self.saturated_count = 0
+        # output data
+        self.count = 0  # number of finite values
+        self.min = np.nan
+        self.max = np.nan
+        self.mean = 0.0
+        self.__m2 = 0.0  # sum of squared deviations from mean
+        self.hist_start = 0.0
+        self.hist_width = 0.0  # width of each bin (0: no value yet)
+        self.hist_counts = np.zeros(bins, dtype=np.int64)
+
+    @property
+    def std(self) -> float:
+        """returns (population) standard deviation of finite values"""
+        return float(np.sqrt(self.__m2 / self.count)) if self.count \
+            else np.nan
+
+    @property
+    def hist_edges(self) -> np.ndarray:
+        return self.hist_start \
+            + self.hist_width * np.arange(self.hist_counts.size + 1)
+
+    def update(self, chunk: np.ndarray,
+               raw_chunk: Union[np.ndarray, None] = None) -> None:
+        """add values of chunk of output data and raw data of the same
+        pixels (arrays of any shape; raw_chunk defaults to chunk, i.e. data
+        is not preprocessed)"""
+        self.__count_raw(chunk if raw_chunk is None else raw_chunk)
+        self.__add_output(chunk)
+
+    def __count_raw(self, chunk: np.ndarray) -> None:
+        values = chunk.ravel()
+        nan_count = int(np.count_nonzero(np.isnan(values)))
+        self.nan_count += nan_count
+        self.inf_count += int(values.size
+                              - np.count_nonzero(np.isfinite(values))
+                              - nan_count)
+        if self.saturation_level is not None:
+            with np.errstate(invalid='ignore'):
+                self.saturated_count += int(np.count_nonzero(
+                    values >= self.saturation_level))
+
+    def __add_output(self, chunk: np.ndarray) -> None:
+        values = chunk.ravel()
+        finite_mask = np.isfinite(values)
+        finite = values[finite_mask] if not finite_mask.all() else values
+        if not finite.size:
+            return
+        finite = finite.astype(np.float64)
+        low, high = float(finite.min()), float(finite.max())
+        self.min = low if np.isnan(self.min) else min(self.min, low)
+        self.max = high if np.isnan(self.max) else max(self.max, high)
+
+        count = finite.size
+        mean = float(finite.mean())
+        m2 = float(np.square(finite - mean).sum())
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.__m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+        self.__update_histogram(finite, low, high)
+
+    def __update_histogram(self, values: np.ndarray, low: float,
+                           high: float) -> None:
+        bins = self.hist_counts.size
+        if not self.hist_width:
+            self.hist_start = low
+            self.hist_width = (high - low) / bins if high > low \
+                else max(abs(low), 1.0) / bins
+        while low < self.hist_start \
+                or high > self.hist_start + self.hist_width * bins:
+            merged = self.hist_counts.reshape(-1, 2).sum(axis=1)
+            padding = np.zeros(bins // 2, dtype=np.int64)
+            if low < self.hist_start:  # extend range downward
+                self.hist_counts = np.concatenate([padding, merged])
+                self.hist_start -= self.hist_width * bins
+            else:
+                self.hist_counts = np.concatenate([merged, padding])
+            self.hist_width *= 2
+        counts, _ = np.histogram(values, bins=bins, range=(
+            self.hist_start, self.hist_start + self.hist_width * bins))
+        self.hist_counts += counts
+
+    def to_dict(self) -> Dict[str, Any]:
+        """returns statistics as json-serializable dict"""
+        return {
+            'detector': {
+                'nanCount': self.nan_count, 'infCount': self.inf_count,
+                'saturatedCount': self.saturated_count,
+                'saturationLevel': self.saturation_level},
+            'output': {
+                'count': self.count,
+                'min': None if np.isnan(self.min) else self.min,
+                'max': None if np.isnan(self.max) else self.max,
+                'mean': self.mean if self.count else None,
+                'std': self.std if self.count else None,
+                'histStart': self.hist_start,
+                'histWidth': self.hist_width,
+                'histCounts': self.hist_counts.tolist()}}
+
+    def note_items(self) -> List[List[str]]:
+        """returns items written in note ([name, value] of each item)"""
+        def fmt(value: float) -> str:
+            return "NaN" if np.isnan(value) else f"{value:.6g}"
+
+        items = [["Detector NaN count", str(self.nan_count)],
+                 ["Detector Inf count", str(self.inf_count)]]
+        if self.saturation_level is not None:
+            items.append(["Detector saturated count", "{} (>= {:g})".format(
+                self.saturated_count, self.saturation_level)])
+        items += [["Output count (finite)", str(self.count)],
+                  ["Output min", fmt(self.min)],
+                  ["Output max", fmt(self.max)],
+                  ["Output mean", fmt(self.mean if self.count else np.nan)],
+                  ["Output std", fmt(self.std)],
+                  ["Output histogram range", "{} ~ {} ({} bins)".format(
+                      fmt(self.hist_start),
+                      fmt(self.hist_start
+                          + self.hist_width * self.hist_counts.size),
+                      self.hist_counts.size)],
+                  ["Output histogram",
+                   " ".join(map(str, self.hist_counts))]]
+        return items
@@ -16,5 +16,29 @@ DEFAULT_SETTINGS = {
         "nm": "Wavelength_%Y%m%d",
         "cm-1": "RamanShift_%Y%m%d",
         "GHz": "BrillouinShift_%Y%m%d"
+    },
+    "spectralAxisExportUnits": ["nm", "cm-1", "GHz"],
+    "preprocessing": {},
+    "previewBands": {},
+    "bandMaps": {},
+    "statistics": {
+        "enabled": True,
+        "saturationLevels": {}
+    },
+    "output": {
+        "fsync": True,
+        "fsyncBatchSize": 16,
+        "staging": "auto",
+        "stagingDir": "",
+        "copyWorkers": 2,
+        "dedup": True
+    },
+    "pipeline": {
+        "readAhead": 2,
+        "writeQueueSize": 1
+    },
+    "readCache": {
+        "maxMegabytes": 256,
+        "rowsPerChunk": 8
     }
 }
@@ -0,0 +1,231 @@
+"""
+Out-of-core PCA denoising of spectral data
+
+Principal components of all spectra of a detector (the [pixel][r] matrix)
+are found by randomized SVD without loading the whole matrix. Only products
+of the matrix with small (r x rank) matrices are needed, so the spectra are
+read chunk by chunk in a fixed number of passes:
+    1 + power iterations passes to find the subspace of components,
+    1 pass to find components in the subspace,
+    1 pass to write scores and the reconstructed (low-rank) spectra.
+Memory usage depends on chunk size and rank rather than the size of map.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import BinaryIO, Iterator, Tuple, Union
+
+import numpy as np
+
+from .ibwio import DATA_OFFSET, IBWStream, encode_note
+from .mapexport import make_map_note, map_wave_names, spatial_scaling
+from .outputwriter import OutputWriter
+from .smdparser import DTYPE, SimpledSMDParser
+
+RECONSTRUCTED_SUFFIX = "_pca"
+SCORES_SUFFIX = "_scores"
+LOADINGS_SUFFIX = "_loadings"
+
+
+class StreamingPCA:
+    """Class for finding principal components of spectra (array[pixel][r])
+    by randomized SVD over chunks of spectra
+    Non-finite values are treated as 0.
+    """
+    CHUNK_SPECTRA = 16384  # number of spectra read at once
+
+    def __init__(self, spectra: np.ndarray, rank: int,
+                 oversampling: int = 10, power_iterations: int = 2,
+                 seed: int = 0) -> None:
+        """
+        Args:
+            spectra (np.ndarray): spectra (array[pixel][r], can be
+                memory-mapped)
+            rank (int): number of components kept
+            oversampling (int, optional): number of additional random
+                vectors which improve accuracy. Defaults to 10.
+            power_iterations (int, optional): number of power iterations
+                (additional passes over spectra). Defaults to 2.
+            seed (int, optional): seed of random vectors. Defaults to 0.
+        """
+        if not 0 < rank <= spectra.shape[1]:
+            raise ValueError(f"rank must be 1 ~ {spectra.shape[1]} "
+                             f"(got {rank})")
+        self.__spectra = spectra
+        self.rank = rank
+        self.oversampling = oversampling
+        self.power_iterations = power_iterations
+        self.seed = seed
+
+        self.mean = np.zeros(spectra.shape[1])
+        self.loadings = np.zeros((spectra.shape[1], rank))  # array[r][comp]
+        self.singular_values = np.zeros(rank)
+        self.explained_variance_ratio = np.zeros(rank)
+
+    def iter_chunks(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """iterate over chunks of spectra (as float64, non-finite values
+        are replaced with 0)"""
+        for start in range(0, self.__spectra.shape[0], self.CHUNK_SPECTRA):
+            chunk = self.__spectra[start:start + self.CHUNK_SPECTRA]
+            yield start, np.nan_to_num(chunk.astype(np.float64),
+                                       nan=0.0, posinf=0.0, neginf=0.0)
+
+    def __gram_product(self, basis: np.ndarray
+                       ) -> Tuple[np.ndarray, np.ndarray, float]:
+        """one pass which returns (A^T A) basis, column sums and squared sum
+        of all values"""
+        product = np.zeros_like(basis)
+        sums = np.zeros(basis.shape[0])
+        squared_sum = 0.0
+        for _, chunk in self.iter_chunks():
+            product += chunk.T @ (chunk @ basis)
+            sums += chunk.sum(axis=0)
+            squared_sum += float(np.einsum('ij,ij->', chunk, chunk))
+        return product, sums, squared_sum
+
+    def fit(self) -> StreamingPCA:
+        """find principal components (mean is subtracted)"""
+        pixel_num, size_r = self.__spectra.shape
+        width = min(self.rank + self.oversampling, size_r)
+        rng = np.random.default_rng(self.seed)
+        basis = rng.standard_normal((size_r, width))
+
+        # range finder on the covariance (A - mean)^T (A - mean)
+        for _ in range(self.power_iterations + 1):
+            product, sums, squared_sum = self.__gram_product(basis)
+            mean = sums / pixel_num
+            product -= pixel_num * np.outer(mean, mean @ basis)
+            basis, _ = np.linalg.qr(product)
+
+        # components in the subspace: eigen decomposition of projected
+        # covariance (basis^T (A - mean)^T (A - mean) basis)
+        product, _, _ = self.__gram_product(basis)
+        projected_mean = mean @ basis
+        gram = basis.T @ product \
+            - pixel_num * np.outer(projected_mean, projected_mean)
+        eigenvalues, eigenvectors = np.linalg.eigh((gram + gram.T) / 2)
+        order = np.argsort(eigenvalues)[::-1][:self.rank]
+        eigenvalues = np.clip(eigenvalues[order], 0, None)
+
+        total = squared_sum - pixel_num * float(mean @ mean)
+        self.mean = mean
+        self.loadings = basis @ eigenvectors[:, order]
+        self.singular_values = np.sqrt(eigenvalues)
+        self.explained_variance_ratio = eigenvalues / total if total > 0 \
+            else np.zeros_like(eigenvalues)
+        return self
+
+    def transform(self, chunk: np.ndarray) -> np.ndarray:
+        """returns scores of spectra (array[pixel][comp])"""
+        return (chunk - self.mean) @ self.loadings
+
+    def reconstruct(self, scores: np.ndarray) -> np.ndarray:
+        """returns low-rank spectra from scores"""
+        return scores @ self.loadings.T + self.mean
+
+
+class PCADenoiser:
+    """Class for saving PCA denoised spectral data of a detector with its
+    scores and loadings
+    """
+    CHUNK_SIZE = 64 * 1024 * 1024  # bytes of source written at once
+
+    def __init__(self, smd_data: SimpledSMDParser, detector_id: int,
+                 rank: int, oversampling: int = 10,
+                 power_iterations: int = 2, seed: int = 0) -> None:
+        self.__smd_data = smd_data
+        self.__detector_id = detector_id
+        self.__pca = StreamingPCA(
+            smd_data.detector_spectra(detector_id), rank, oversampling,
+            power_iterations, seed)
+
+    @property
+    def pca(self) -> StreamingPCA:
+        return self.__pca
+
+    def __note(self, value: str) -> str:
+        ratios = ", ".join(
+            f"{ratio:.4g}" for ratio in self.__pca.explained_variance_ratio)
+        return make_map_note(self.__smd_data, self.__detector_id, {
+            "Value": value, "Rank": str(self.__pca.rank),
+            "Explained variance ratio": ratios})
+
+    def write(self, data_f: BinaryIO, scores_f: BinaryIO,
+              names: Tuple[str, str]) -> None:
+        """write reconstructed data and scores (array[x][y][z][comp]) into
+        files opened for writing"""
+        src = self.__smd_data.detector_array(self.__detector_id)
+        size_z, size_y, size_x, size_r = src.shape
+        scales, units = spatial_scaling(self.__smd_data)
+        created = self.__smd_data.creation_datetime
+        rank = self.__pca.rank
+        rows = max(1, self.CHUNK_SIZE // (size_x * size_r * DTYPE().itemsize))
+        with IBWStream(data_f, (size_x, size_y, size_z, size_r), names[0],
+                       dtype=DTYPE, scales=scales, units=units,
+                       note=self.__note("reconstructed"),
+                       creation_time=created) as data_stream, \
+                IBWStream(scores_f, (size_x, size_y, size_z, rank), names[1],
+                          dtype=DTYPE, scales=scales, units=units,
+                          note=self.__note("scores"),
+                          creation_time=created) as scores_stream:
+            for z in range(size_z):
+                for y in range(0, size_y, rows):
+                    block = src[z, y:y + rows]  # array[y][x][r]
+                    spectra = np.nan_to_num(
+                        block.reshape(-1, size_r).astype(np.float64),
+                        nan=0.0, posinf=0.0, neginf=0.0)
+                    scores = self.__pca.transform(spectra)
+                    reconstructed = self.__pca.reconstruct(scores)
+                    stop = y + block.shape[0]
+                    data_stream.data[:, y:stop, z, :] = np.transpose(
+                        reconstructed.reshape(block.shape), (1, 0, 2))
+                    scores_stream.data[:, y:stop, z, :] = np.transpose(
+                        scores.reshape(block.shape[:2] + (rank,)), (1, 0, 2))
+
+    def write_loadings(self, f: BinaryIO, name: str) -> None:
+        """write loadings (array[r][comp]) into a file opened for writing"""
+        with IBWStream(f, self.__pca.loadings.shape, name, dtype=DTYPE,
+                       note=self.__note("loadings"),
+                       creation_time=self.__smd_data.creation_datetime
+                       ) as stream:
+            stream.data[:] = self.__pca.loadings
+
+    def save(self, dst_dir: str, base_name: str,
+             writer: Union[OutputWriter, None] = None) -> None:
+        """find components and save reconstructed data, scores and
+        loadings as "<base_name>_pca.ibw", "<base_name>_scores.ibw" and
+        "<base_name>_loadings.ibw" (base_name is made valid and shortened
+        before components are found if needed)
+        """
+        if writer is None:
+            with OutputWriter() as writer:
+                self.save(dst_dir, base_name, writer)
+            return
+
+        names = map_wave_names(base_name, (
+            RECONSTRUCTED_SUFFIX, SCORES_SUFFIX, LOADINGS_SUFFIX))
+        self.__pca.fit()
+        size_z, size_y, size_x, size_r = \
+            self.__smd_data.detector_array_size(self.__detector_id)
+        pixel_num = size_z * size_y * size_x
+        rank = self.__pca.rank
+        paths = [os.path.join(dst_dir, f"{name}.ibw") for name in names]
+        sizes = [
+            DATA_OFFSET + size * DTYPE().itemsize + len(encode_note(note))
+            for size, note in zip(
+                (pixel_num * size_r, pixel_num * rank, size_r * rank),
+                (self.__note("reconstructed"), self.__note("scores"),
+                 self.__note("loadings")))]
+
+        def on_commit(path: str) -> None:
+            print(f"Saved: {path}")
+
+        with writer.open(paths[0], sizes[0],
+                         lambda: on_commit(paths[0])) as data_f, \
+                writer.open(paths[1], sizes[1],
+                            lambda: on_commit(paths[1])) as scores_f:
+            self.write(data_f, scores_f, (names[0], names[1]))
+        with writer.open(paths[2], sizes[2],
+                         lambda: on_commit(paths[2])) as f:
+            self.write_loadings(f, names[2])
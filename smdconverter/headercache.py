@@ -0,0 +1,111 @@
+"""
+Cache of parsed xml headers of smd files
+
+Parsing the xml header (especially long ChannelAxisArray) takes most of the
+time to open an smd file. Parsed headers are saved as json files with the
+size of the header, identified by path, size and modification time of the
+smd file. Content fingerprints and statistics of data (accumulated in
+conversion) of smd files are stored in the same entries.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Tuple, Union
+
+from .constants import HEADER_CACHE_DIR
+
+HeaderEntry = Tuple[int, Dict[str, Any]]  # (size of header, parsed header)
+
+
+class HeaderCache:
+    """Class for storing parsed xml headers in cache directory
+    """
+    VERSION = 1
+
+    def __init__(self, cache_dir: str = HEADER_CACHE_DIR) -> None:
+        self.__cache_dir = cache_dir
+
+    @property
+    def cache_dir(self) -> str:
+        return self.__cache_dir
+
+    def __key(self, src_path: str) -> str:
+        stat = os.stat(src_path)
+        return json.dumps([os.path.abspath(src_path), stat.st_size,
+                           stat.st_mtime_ns])
+
+    def entry_path(self, src_path: str) -> str:
+        """returns path of cache entry (json file) for the source file"""
+        name = hashlib.sha1(src_path.encode('utf-8')).hexdigest()
+        return os.path.join(self.__cache_dir, f"{name}.json")
+
+    def load(self, src_path: str) -> Union[HeaderEntry, None]:
+        """returns size and parsed data of header
+        (None if not cached or the source file was changed)"""
+        entry = self.__load_entry(src_path)
+        if entry is None or 'header' not in entry:
+            return None
+        return entry['header_size'], entry['header']
+
+    def save(self, src_path: str, header_size: int,
+             header: Dict[str, Any]) -> None:
+        """save size and parsed data of header"""
+        entry = {'version': self.VERSION, 'key': self.__key(src_path),
+                 'header_size': header_size, 'header': header}
+        self.__write_entry(src_path, entry)
+
+    def load_fingerprint(self, src_path: str) -> Union[str, None]:
+        """returns content fingerprint of the source file
+        (None if not cached or the source file was changed)"""
+        entry = self.__load_entry(src_path)
+        return entry.get('fingerprint') if entry else None
+
+    def save_fingerprint(self, src_path: str, fingerprint: str) -> None:
+        """add content fingerprint to the entry of the source file
+        (nothing is saved if header of the file is not cached)"""
+        entry = self.__load_entry(src_path)
+        if entry is None:
+            return
+        entry['fingerprint'] = fingerprint
+        self.__write_entry(src_path, entry)
+
+    def load_statistics(self, src_path: str,
+                        key: str) -> Union[Dict[str, Any], None]:
+        """returns statistics of data of the source file recorded with key
+        (None if not recorded or the source file was changed)"""
+        entry = self.__load_entry(src_path)
+        return entry.get('statistics', {}).get(key) if entry else None
+
+    def save_statistics(self, src_path: str, key: str,
+                        statistics: Dict[str, Any]) -> None:
+        """add statistics of data (identified by key, e.g. detector and
+        preprocessing) to the entry of the source file
+        (nothing is saved if header of the file is not cached)"""
+        entry = self.__load_entry(src_path)
+        if entry is None:
+            return
+        entry.setdefault('statistics', {})[key] = statistics
+        self.__write_entry(src_path, entry)
+
+    def __load_entry(self, src_path: str) -> Union[Dict[str, Any], None]:
+        try:
+            with open(self.entry_path(os.path.abspath(src_path)),
+                      mode='r') as f:
+                entry = json.load(f)
+            if entry['version'] != self.VERSION \
+                    or entry['key'] != self.__key(src_path):
+                return None
+            return entry
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def __write_entry(self, src_path: str, entry: Dict[str, Any]) -> None:
+        path = self.entry_path(os.path.abspath(src_path))
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode='w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)  # never leave incomplete entry
@@ -0,0 +1,273 @@
+"""
+Low-level access to Igor binary wave (version 5) files
+
+Headers are parsed and built directly and wave data is memory-mapped, so
+that large waves can be read or written chunk by chunk without holding the
+whole wave in memory.
+Layout of version 5 files is:
+    BinHeader5 (64 bytes), WaveHeader5 (320 bytes), wave data
+    (column-major, i.e. the first dimension changes fastest), and optional
+    sections (formula, note, units, labels, ...)
+"""
+
+from __future__ import annotations
+
+import datetime
+import struct
+from typing import BinaryIO, Dict, Sequence, Tuple, Union
+
+import numpy as np
+from typing_extensions import Literal
+
+IBW_VERSION = 5
+BIN_HEADER_SIZE = 64
+WAVE_HEADER_SIZE = 320
+DATA_OFFSET = BIN_HEADER_SIZE + WAVE_HEADER_SIZE
+MAX_DIMENSIONS = 4
+
+# offsets of fields in BinHeader5
+CHECKSUM_OFFSET = 2
+WFM_SIZE_OFFSET = 4
+NOTE_SIZE_OFFSET = 12
+
+# offsets of fields in WaveHeader5
+CREATION_DATE_OFFSET = 4
+MOD_DATE_OFFSET = 8
+NPNTS_OFFSET = 12
+TYPE_OFFSET = 16
+WH_VERSION_OFFSET = 26
+NAME_OFFSET = 28
+NAME_SIZE = 32
+NDIM_OFFSET = 68
+SFA_OFFSET = 84
+SFB_OFFSET = 116
+DATA_UNITS_OFFSET = 148
+DIM_UNITS_OFFSET = 152
+UNITS_SIZE = 4
+
+IGOR_EPOCH = datetime.datetime(1904, 1, 1)
+NOTE_NEWLINE = "\r"
+
+# wave type code -> dtype
+WAVE_TYPES: Dict[int, type] = {
+    0x02: np.float32, 0x04: np.float64,
+    0x08: np.int8, 0x10: np.int16, 0x20: np.int32,
+    0x48: np.uint8, 0x50: np.uint16, 0x60: np.uint32}
+
+
+class IBWHeader:
+    """Header information of Igor binary wave needed to access the data
+    """
+
+    def __init__(self, byte_order: str, dtype: np.dtype,
+                 shape: Tuple[int, ...], name: str) -> None:
+        """
+        Args:
+            byte_order (str): '<' (little endian) or '>' (big endian)
+            dtype (np.dtype): type of data (with byte order)
+            shape (Tuple[int, ...]): size of each dimension
+            name (str): name of wave
+        """
+        self.byte_order = byte_order
+        self.dtype = dtype
+        self.shape = shape
+        self.name = name
+
+    @property
+    def data_offset(self) -> int:
+        return DATA_OFFSET
+
+    @property
+    def data_size(self) -> int:
+        """returns size of wave data in bytes"""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes) -> IBWHeader:
+        """parse headers (first DATA_OFFSET bytes of ibw file)"""
+        if len(buffer) < DATA_OFFSET:
+            raise ValueError("ibw file is too short")
+        for byte_order in ('<', '>'):
+            if struct.unpack_from(f'{byte_order}h', buffer)[0] == IBW_VERSION:
+                break
+        else:
+            raise ValueError("not an Igor binary wave of version 5")
+
+        wave_header = buffer[BIN_HEADER_SIZE:DATA_OFFSET]
+        type_code = struct.unpack_from(
+            f'{byte_order}h', wave_header, TYPE_OFFSET)[0]
+        if type_code not in WAVE_TYPES:
+            raise ValueError(f"unsupported wave type ({type_code:#x})")
+        dtype = np.dtype(WAVE_TYPES[type_code]).newbyteorder(byte_order)
+
+        n_dims = struct.unpack_from(
+            f'{byte_order}{MAX_DIMENSIONS}i', wave_header, NDIM_OFFSET)
+        shape = tuple(size for size in n_dims if size > 0)
+        if not shape:  # 1D wave saved with npnts only
+            shape = struct.unpack_from(
+                f'{byte_order}i', wave_header, NPNTS_OFFSET)
+        name = wave_header[NAME_OFFSET:NAME_OFFSET + NAME_SIZE]
+        return cls(byte_order, dtype, shape,
+                   name.split(b'\x00', 1)[0].decode('ascii', errors='replace'))
+
+    @classmethod
+    def read(cls, path: str) -> IBWHeader:
+        with open(path, mode='rb') as f:
+            return cls.from_bytes(f.read(DATA_OFFSET))
+
+
+def update_checksum(headers: bytearray, byte_order: str = '<') -> None:
+    """set checksum of headers (shorts in BinHeader5 and WaveHeader5
+    including checksum must sum to zero)"""
+    struct.pack_into(f'{byte_order}h', headers, CHECKSUM_OFFSET, 0)
+    shorts = struct.unpack_from(f'{byte_order}{DATA_OFFSET // 2}h', headers)
+    struct.pack_into(f'{byte_order}H', headers, CHECKSUM_OFFSET,
+                     -sum(shorts) & 0xffff)
+
+
+def igor_time(dt: datetime.datetime) -> int:
+    """returns seconds since 1904/01/01 (used as date in ibw)"""
+    return int((dt - IGOR_EPOCH).total_seconds())
+
+
+def make_headers(shape: Tuple[int, ...], name: str, dtype: type = np.float32,
+                 scales: Sequence[Tuple[float, float]] = (),
+                 units: Sequence[str] = (), data_unit: str = "",
+                 note_size: int = 0,
+                 creation_time: Union[datetime.datetime, None] = None
+                 ) -> bytes:
+    """make BinHeader5 and WaveHeader5 of ibw (little endian)
+
+    Args:
+        shape (Tuple[int, ...]): size of each dimension (up to 4)
+        name (str): name of wave (up to 31 characters)
+        dtype (type, optional): type of data. Defaults to np.float32.
+        scales (Sequence[Tuple[float, float]], optional): (start, delta) of
+            each dimension. Defaults to () (start 0, delta 1).
+        units (Sequence[str], optional): unit of each dimension (up to 3
+            characters). Defaults to ().
+        data_unit (str, optional): unit of data. Defaults to "".
+        note_size (int, optional): size of note written after data in
+            bytes. Defaults to 0.
+        creation_time (Union[datetime.datetime, None], optional): creation
+            time of wave. Defaults to None (now).
+
+    Returns:
+        bytes: headers (DATA_OFFSET bytes)
+    """
+    type_codes = {np.dtype(type_): code for code, type_ in WAVE_TYPES.items()}
+    if len(shape) > MAX_DIMENSIONS:
+        raise ValueError(f"ibw can have up to {MAX_DIMENSIONS} dimensions")
+    encoded_name = name.encode('ascii')
+    if len(encoded_name) >= NAME_SIZE:
+        raise ValueError(f"wave name is too long ({name})")
+
+    points = int(np.prod(shape))
+    data_size = points * np.dtype(dtype).itemsize
+    headers = bytearray(DATA_OFFSET)
+    struct.pack_into('<h', headers, 0, IBW_VERSION)
+    struct.pack_into('<i', headers, WFM_SIZE_OFFSET,
+                     WAVE_HEADER_SIZE + data_size)
+    struct.pack_into('<i', headers, NOTE_SIZE_OFFSET, note_size)
+
+    date = igor_time(creation_time or datetime.datetime.now())
+    now = igor_time(datetime.datetime.now())
+    wave_fields = [
+        ('I', CREATION_DATE_OFFSET, (date,)), ('I', MOD_DATE_OFFSET, (now,)),
+        ('i', NPNTS_OFFSET, (points,)),
+        ('h', TYPE_OFFSET, (type_codes[np.dtype(dtype)],)),
+        ('h', WH_VERSION_OFFSET, (1,)),
+        (f'{NAME_SIZE}s', NAME_OFFSET, (encoded_name,)),
+        (f'{MAX_DIMENSIONS}i', NDIM_OFFSET,
+         tuple(shape) + (0,) * (MAX_DIMENSIONS - len(shape))),
+        (f'{MAX_DIMENSIONS}d', SFA_OFFSET,
+         tuple(delta for _, delta in scales)
+         + (1.0,) * (MAX_DIMENSIONS - len(scales))),
+        (f'{MAX_DIMENSIONS}d', SFB_OFFSET,
+         tuple(start for start, _ in scales)
+         + (0.0,) * (MAX_DIMENSIONS - len(scales))),
+        (f'{UNITS_SIZE}s', DATA_UNITS_OFFSET, (encode_unit(data_unit),))]
+    for dim, unit in enumerate(units):
+        wave_fields.append((f'{UNITS_SIZE}s', DIM_UNITS_OFFSET
+                            + dim * UNITS_SIZE, (encode_unit(unit),)))
+    for fmt, offset, values in wave_fields:
+        struct.pack_into(f'<{fmt}', headers, BIN_HEADER_SIZE + offset,
+                         *values)
+    update_checksum(headers)
+    return bytes(headers)
+
+
+def encode_unit(unit: str) -> bytes:
+    """encode unit saved in header (longer units are truncated)"""
+    return unit.encode('latin-1', errors='replace')[:UNITS_SIZE - 1]
+
+
+def encode_note(note: str) -> bytes:
+    return note.replace("\r\n", "\n").replace("\n", NOTE_NEWLINE) \
+        .encode('utf-8')
+
+
+class IBWStream:
+    """Ibw file whose data is written block by block through memory mapping
+    Headers (and note) are written first, and the file is extended to the
+    full size, so that blocks can be written in any order.
+    """
+
+    def __init__(self, f: BinaryIO, shape: Tuple[int, ...], name: str,
+                 dtype: type = np.float32,
+                 scales: Sequence[Tuple[float, float]] = (),
+                 units: Sequence[str] = (), data_unit: str = "",
+                 note: str = "",
+                 creation_time: Union[datetime.datetime, None] = None
+                 ) -> None:
+        """
+        Args:
+            f (BinaryIO): file opened for writing (with 'r+b' or 'w+b')
+            other arguments are the same as make_headers()
+        """
+        note_bytes = encode_note(note)
+        self.__f = f
+        self.__file_size = DATA_OFFSET \
+            + int(np.prod(shape)) * np.dtype(dtype).itemsize \
+            + len(note_bytes)
+        f.seek(0)
+        f.write(make_headers(shape, name, dtype, scales, units, data_unit,
+                             len(note_bytes), creation_time))
+        f.truncate(self.__file_size)
+        f.seek(self.__file_size - len(note_bytes))
+        f.write(note_bytes)
+        f.flush()
+        self.__data: Union[np.memmap, None] = np.memmap(
+            f, dtype=np.dtype(dtype).newbyteorder('<'), mode='r+',
+            offset=DATA_OFFSET, shape=shape, order='F')
+
+    @property
+    def data(self) -> np.memmap:
+        """returns writable data (indexed in the same order as dimensions
+        of the wave)"""
+        if self.__data is None:
+            raise ValueError("stream is already closed")
+        return self.__data
+
+    def close(self) -> None:
+        """flush data (file position is moved to the end of file)"""
+        if self.__data is not None:
+            self.__data.flush()
+            self.__data = None
+        self.__f.seek(self.__file_size)
+
+    def __enter__(self) -> IBWStream:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def open_data(path: str, mode: Literal['r', 'r+', 'c'] = 'r') -> np.memmap:
+    """returns memory-mapped data of ibw file
+    (indexed in the same order as dimensions of the wave, e.g.
+    array[x][y][z][r])"""
+    header = IBWHeader.read(path)
+    return np.memmap(path, dtype=header.dtype, mode=mode,
+                     offset=header.data_offset, shape=header.shape,
+                     order='F')
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .appsettings import ApplicationSettings
+from .convertjob import ConvertJob
+from .nameformatter import NameRegistry, NameReport, format_data_names
+
+
+class JobCollection:
+    """Ordered collection of convert jobs which owns the registry of their
+    output names
+    """
+
+    def __init__(self) -> None:
+        self.__jobs: List[ConvertJob] = []
+        self.__names = NameRegistry()
+        # output name of each job currently registered in self.__names
+        self.__registered_names: Dict[ConvertJob, str] = {}
+
+    def __iter__(self) -> Iterator[ConvertJob]:
+        return iter(self.__jobs)
+
+    def __len__(self) -> int:
+        return len(self.__jobs)
+
+    def __getitem__(self, idx: int) -> ConvertJob:
+        return self.__jobs[idx]
+
+    def __contains__(self, job: object) -> bool:
+        return job in self.__registered_names
+
+    @property
+    def names(self) -> NameRegistry:
+        return self.__names
+
+    @property
+    def output_names(self) -> Tuple[str, ...]:
+        return tuple(job.output_name for job in self.__jobs)
+
+    def index(self, job: ConvertJob) -> int:
+        return self.__jobs.index(job)
+
+    def append(self, job: ConvertJob) -> None:
+        self.__jobs.append(job)
+        self.__register(job)
+
+    def extend(self, jobs: Iterable[ConvertJob]) -> None:
+        for job in jobs:
+            self.append(job)
+
+    def add_jobs(self, jobs: Iterable[ConvertJob],
+                 settings: ApplicationSettings) -> None:
+        """name jobs with name formats in settings (names are made unique
+        among all jobs in the collection) and append them.
+        Warnings about names are printed as a summary."""
+        jobs = list(jobs)
+        report = NameReport()
+        names = format_data_names(jobs, settings, report)
+        for job, name in zip(jobs, names):
+            job.output_name = self.__names.unique_name(name)
+            if job.output_name != name:
+                report.add(name, "got output name already exist")
+            self.append(job)
+        report.print_summary()
+
+    def remove(self, job: ConvertJob) -> None:
+        self.__jobs.remove(job)
+        self.__names.remove(self.__registered_names.pop(job))
+
+    def clear(self) -> None:
+        self.__jobs.clear()
+        self.__names.clear()
+        self.__registered_names.clear()
+
+    def __register(self, job: ConvertJob) -> None:
+        self.__registered_names[job] = job.output_name
+        self.__names.add(job.output_name)
+
+    def update_name(self, job: ConvertJob) -> None:
+        """reflect output name of the job changed outside of the collection
+        into the registry"""
+        old_name = self.__registered_names[job]
+        if old_name != job.output_name:
+            self.__names.remove(old_name)
+            self.__register(job)
+
+    def revalidate(self) -> List[str]:
+        """rebuild the registry from current output names of all jobs
+        (e.g. after settings are changed) and returns duplicate names"""
+        self.__names.clear()
+        self.__registered_names.clear()
+        for job in self.__jobs:
+            self.__register(job)
+        return self.__names.duplicates
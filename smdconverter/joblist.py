@@ -1,10 +1,15 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter.messagebox import showinfo
-from typing import Callable, Dict, List
+from typing import Callable, Dict, Set, Tuple
 
+from .appsettings import ApplicationSettings
+from .constants import Direction
 from .convertjob import ConvertJob
+from .jobcollection import JobCollection
 from .notegen import IBWNoteGenerator
+from .previewwndw import PreviewWindow
+from .viewerwndw import SpectrumViewerWindow
 
 
 class JobList(ttk.Treeview):
@@ -18,30 +23,48 @@ class JobList(ttk.Treeview):
     STRETCHABLE_COLUMN = 'src_file'
     DATETIME_FMT = "%Y/%m/%d %H:%M"
 
-    def __init__(self, master: tk.Misc, jobs: List[ConvertJob],
-                 select_cmd: Callable[[ConvertJob], None], *args, **kwargs):
+    def __init__(self, master: tk.Misc, jobs: JobCollection,
+                 select_cmd: Callable[[ConvertJob], None],
+                 settings: ApplicationSettings, *args, **kwargs):
         """Treeview which displays convert jobs
 
         Args:
             master (tk.Misc): container of this widget
-            jobs (List[ConvertJob]): reference to list of jobs
+            jobs (JobCollection): reference to collection of jobs
             select_cmd (Callable[[ConvertJob], None]):
                 command run on select item
+            settings (ApplicationSettings): settings of application
         """
         kwargs['master'] = master
         super().__init__(columns=self.COLUMN_NAMES, selectmode=tk.BROWSE,
                          show='headings', *args, **kwargs)
         self.bind('<<TreeviewSelect>>', self.__handle_item_select)
         self.bind('<Double-Button-1>', self.__handle_doubleclick)
+        self.bind('<Button-3>', self.__handle_rightclick)
 
         # variables
         self.jobs = jobs
         self.select_cmd = select_cmd
-        self.jobs_dict: Dict[str, ConvertJob] = {}
+        self.__settings = settings
+        # items are identified by stable IDs (never change while displayed)
+        self.jobs_dict: Dict[str, ConvertJob] = {}  # item ID -> job
+        self.__item_ids: Dict[ConvertJob, str] = {}  # job -> item ID
+        self.__rows: Dict[str, Tuple[str, ...]] = {}  # item ID -> values
+        self.__next_item_num = 0
+        self.__pending_jobs: Set[ConvertJob] = set()  # rows to be redrawn
+        self.__redraw_scheduled = False
 
         self.__layout_columns()
+        self.__create_menu()
         self.update_contents()
 
+    def __create_menu(self) -> None:
+        self.menu = tk.Menu(self, tearoff=False)
+        self.menu.add_command(label="Information...",
+                              command=self.show_information)
+        self.menu.add_command(label="Preview...", command=self.show_preview)
+        self.menu.add_command(label="Viewer...", command=self.show_viewer)
+
     def __layout_columns(self) -> None:
         for column in self.COLUMN_NAMES:
             self.heading(column, text=self.COLUMN_TEXTS[column])
@@ -50,23 +73,70 @@ class JobList(ttk.Treeview):
         self.column(   # let one column stretchable
             self.STRETCHABLE_COLUMN, stretch=True)
 
-    def update_contents(self) -> None:
-        """update display"""
-        self.reset_contents()
+    def make_row(self, job: ConvertJob) -> Tuple[str, ...]:
+        return (job.src_path, job.selected_detector_name_with_id,
+                str(job.shape),
+                job.creation_time.strftime(self.DATETIME_FMT),
+                job.output_name)
 
-        # show contents
-        self.jobs_dict.clear()
-        for job in self.jobs:
-            row = (job.src_path, job.selected_detector_name_with_id,
-                   str(job.shape),
-                   job.creation_time.strftime(
-                       self.DATETIME_FMT),
-                   job.output_name)
-            id_ = self.insert('', tk.END, values=row)
-            self.jobs_dict[id_] = job
+    def update_contents(self) -> None:
+        """update display to follow the list of jobs
+        Only rows of added or removed jobs are changed
+        (jobs are assumed to be only appended or removed).
+        """
+        current_jobs = set(self.jobs)
+        removed_items = [item_id for job, item_id in self.__item_ids.items()
+                         if job not in current_jobs]
+        if removed_items:
+            self.delete(*removed_items)
+            for item_id in removed_items:
+                job = self.jobs_dict.pop(item_id)
+                del self.__item_ids[job]
+                del self.__rows[item_id]
+                self.__pending_jobs.discard(job)
+
+        for idx, job in enumerate(self.jobs):
+            if job not in self.__item_ids:
+                self.__insert_job(idx, job)
+
+    def __insert_job(self, index: int, job: ConvertJob) -> None:
+        item_id = f"job{self.__next_item_num}"
+        self.__next_item_num += 1
+
+        row = self.make_row(job)
+        self.insert('', index, iid=item_id, values=row)
+        self.jobs_dict[item_id] = job
+        self.__item_ids[job] = item_id
+        self.__rows[item_id] = row
+
+    def update_job(self, job: ConvertJob) -> None:
+        """schedule redraw of the row of the job
+        Rows are redrawn together when Tk becomes idle, so consecutive
+        changes (e.g. typing output name) redraw each row only once.
+        """
+        self.__pending_jobs.add(job)
+        if not self.__redraw_scheduled:
+            self.__redraw_scheduled = True
+            self.after_idle(self.__redraw_pending_jobs)
+
+    def __redraw_pending_jobs(self) -> None:
+        self.__redraw_scheduled = False
+        pending_jobs, self.__pending_jobs = self.__pending_jobs, set()
+        for job in pending_jobs:
+            item_id = self.__item_ids.get(job)
+            if item_id is None:  # removed before redraw
+                continue
+            row = self.make_row(job)
+            if row != self.__rows[item_id]:
+                self.item(item_id, values=row)
+                self.__rows[item_id] = row
 
     def reset_contents(self) -> None:
         self.delete(*self.get_children())
+        self.jobs_dict.clear()
+        self.__item_ids.clear()
+        self.__rows.clear()
+        self.__pending_jobs.clear()
 
     @property
     def selected_job(self) -> ConvertJob:
@@ -74,15 +144,35 @@ class JobList(ttk.Treeview):
         return self.jobs_dict[selected_id]
 
     def select_job(self, job: ConvertJob) -> None:
-        self.selection_remove(self.selection())
-        item_id_idx = list(self.jobs_dict.values()).index(job)
-        item_id = list(self.jobs_dict.keys())[item_id_idx]
-        self.selection_add(item_id)
+        item_id = self.__item_ids[job]
+        self.selection_set(item_id)
+        self.see(item_id)
+
+    def neighbor_job(self, job: ConvertJob,
+                     direction: Direction) -> ConvertJob:
+        """returns job displayed above or below the job
+        (loops at the top and bottom of the list)"""
+        item_id = self.__item_ids[job]
+        if direction == 'Up':
+            neighbor_id = self.prev(item_id) or self.get_children()[-1]
+        else:
+            neighbor_id = self.next(item_id) or self.get_children()[0]
+        return self.jobs_dict[neighbor_id]
 
     def __handle_item_select(self, event: tk.Event) -> None:
         self.select_cmd(self.selected_job)
 
     def __handle_doubleclick(self, event: tk.Event) -> None:
+        self.show_information()
+
+    def __handle_rightclick(self, event: tk.Event) -> None:
+        item_id = self.identify_row(event.y)
+        if not item_id:
+            return
+        self.selection_set(item_id)
+        self.menu.tk_popup(event.x_root, event.y_root)
+
+    def show_information(self) -> None:
         try:
             selected_job = self.selected_job
         except IndexError:
@@ -92,3 +182,17 @@ class JobList(ttk.Treeview):
         note = note_gen.generate()
 
         showinfo(title="Information", message=note)
+
+    def show_preview(self) -> None:
+        try:
+            selected_job = self.selected_job
+        except IndexError:
+            return  # if job is not selected
+        PreviewWindow(self, selected_job, self.__settings.preview_bands)
+
+    def show_viewer(self) -> None:
+        try:
+            selected_job = self.selected_job
+        except IndexError:
+            return  # if job is not selected
+        SpectrumViewerWindow(self, selected_job, self.__settings)
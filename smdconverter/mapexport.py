@@ -0,0 +1,107 @@
+"""
+Export of 2D/3D maps derived from spectral data
+
+Maps (array[z][y][x], one value per pixel) are saved as 3-dimensional ibw
+files (array[x][y][z]) with the same spatial scaling and note as converted
+spectral data.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .ibwio import DATA_OFFSET, NAME_SIZE, IBWStream, encode_note
+from .nameformatter import IBWNameFormatter
+from .notegen import IBWNoteGenerator
+from .outputwriter import OutputWriter
+from .smdparser import DTYPE, SimpledSMDParser, SpatialAxisName
+
+IBW_SPATIAL_AXIS: Tuple[SpatialAxisName, ...] = ('X', 'Y', 'Z')
+MAP_AXIS_ORDER = (2, 1, 0)  # array[z][y][x] -> array[x][y][z]
+MAX_NAME_LENGTH = NAME_SIZE - 1  # characters of wave name
+
+
+def map_wave_names(base_name: str, suffixes: Sequence[str]) -> List[str]:
+    """returns valid names of waves "<base_name><suffix>" for each suffix
+    Invalid characters of base_name (e.g. of file name) are replaced or
+    removed with the rules of IBWNameFormatter, and base_name is shortened
+    so that all names fit in MAX_NAME_LENGTH. Names should be checked with
+    this before maps are computed, so that export never fails after them.
+
+    Raises:
+        ValueError: if a suffix is invalid or too long
+    """
+    longest = max((len(suffix) for suffix in suffixes), default=0)
+    for suffix in suffixes:
+        if IBWNameFormatter.INVALID_CHR_PATTERN.search(suffix):
+            raise ValueError(f"invalid character in name of map ({suffix})")
+    if longest >= MAX_NAME_LENGTH:
+        raise ValueError(
+            f"name of map is too long ({max(suffixes, key=len)})")
+
+    name = base_name.translate(IBWNameFormatter.SPACE_TABLE)
+    name = IBWNameFormatter.INVALID_CHR_PATTERN.sub("", name)
+    if not name[:1].isalpha():
+        name = IBWNameFormatter.DEFAULT_NAME_FMT.format(name)
+    if len(name) + longest > MAX_NAME_LENGTH:
+        name = name[:MAX_NAME_LENGTH - longest]
+    if name != base_name:
+        print(f"Warning: wave names are based on {name} (made from "
+              f"{base_name} to be valid within {MAX_NAME_LENGTH} "
+              f"characters)")
+    return [name + suffix for suffix in suffixes]
+
+
+def spatial_scaling(smd_data: SimpledSMDParser
+                    ) -> Tuple[List[Tuple[float, float]], List[str]]:
+    """returns scales (start, delta) and units of x, y and z of ibw"""
+    return ([smd_data.spatial_scales[axis] for axis in IBW_SPATIAL_AXIS],
+            [smd_data.spatial_units[axis] for axis in IBW_SPATIAL_AXIS])
+
+
+def make_map_note(smd_data: SimpledSMDParser, detector_id: int,
+                  items: Union[Dict[str, str], None] = None) -> str:
+    """note of map (information of source and additional items)"""
+    generator = IBWNoteGenerator(smd_data)
+    generator.set_detector_id(detector_id)
+    note = generator.generate()
+    if items:
+        note += "\n" + IBWNoteGenerator.HEADING_FMT.format("Map") + "".join(
+            IBWNoteGenerator.ITEM_LV1_FMT.format(key, value)
+            for key, value in items.items())
+    return note
+
+
+def save_map(path: str, name: str, arr: np.ndarray,
+             smd_data: SimpledSMDParser, note: str = "",
+             data_unit: str = "",
+             writer: Union[OutputWriter, None] = None) -> None:
+    """save map into ibw file atomically
+
+    Args:
+        path (str): path of output ibw file
+        name (str): name of wave
+        arr (np.ndarray): map (array[z][y][x])
+        smd_data (SimpledSMDParser): source smd data (spatial scales, units
+            and creation date are copied)
+        note (str, optional): note of wave. Defaults to "".
+        data_unit (str, optional): unit of values. Defaults to "".
+        writer (Union[OutputWriter, None], optional): writer of output.
+            Defaults to None (output is committed immediately).
+    """
+    if writer is None:
+        with OutputWriter() as writer:
+            save_map(path, name, arr, smd_data, note, data_unit, writer)
+        return
+
+    shape = tuple(arr.shape[dim] for dim in MAP_AXIS_ORDER)
+    scales, units = spatial_scaling(smd_data)
+    size = DATA_OFFSET + int(np.prod(shape)) * DTYPE().itemsize \
+        + len(encode_note(note))
+    with writer.open(path, size, lambda: print(f"Saved: {path}")) as f:
+        with IBWStream(f, shape, name, dtype=DTYPE, scales=scales,
+                       units=units, data_unit=data_unit, note=note,
+                       creation_time=smd_data.creation_datetime) as stream:
+            stream.data[:] = np.transpose(arr, MAP_AXIS_ORDER)
@@ -1,22 +1,175 @@
 import datetime
-import os
-from typing import Tuple
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Tuple, Union
 
 from .appsettings import ApplicationSettings
 from .convertjob import ConvertJob
 
 
+class NameRegistry:
+    """Registry of output names which finds unique names in constant time
+    It holds the number of jobs which use each name, and the next suffix
+    to try for each base name.
+    """
+    SUFFIX_FMT = "{}_{}"  # base name, number
+
+    def __init__(self) -> None:
+        self.__counts: Counter[str] = Counter()
+        self.__next_suffixes: Dict[str, int] = {}
+
+    def __contains__(self, name: object) -> bool:
+        return self.__counts[name] > 0 if isinstance(name, str) else False
+
+    def add(self, name: str) -> None:
+        self.__counts[name] += 1
+
+    def remove(self, name: str) -> None:
+        self.__counts[name] -= 1
+        if self.__counts[name] <= 0:
+            del self.__counts[name]
+
+    def clear(self) -> None:
+        self.__counts.clear()
+        self.__next_suffixes.clear()
+
+    def unique_name(self, name: str) -> str:
+        """returns name which is not registered yet
+        (name itself, or name with suffix "_1", "_2", ...)"""
+        if name not in self:
+            return name
+        suffix = self.__next_suffixes.get(name, 1)
+        res = self.SUFFIX_FMT.format(name, suffix)
+        while res in self:
+            suffix += 1
+            res = self.SUFFIX_FMT.format(name, suffix)
+        self.__next_suffixes[name] = suffix + 1
+        return res
+
+    @property
+    def duplicates(self) -> List[str]:
+        """returns names used by multiple jobs"""
+        return [name for name, count in self.__counts.items() if count > 1]
+
+
+class NameReport:
+    """Structured report of warnings raised while names are formatted
+    Each warning is recorded with the name which caused it, so that
+    warnings of many jobs can be summarized instead of printed one by one.
+    """
+
+    def __init__(self) -> None:
+        self.__warnings: List[Tuple[str, str]] = []  # (name, message)
+
+    def __bool__(self) -> bool:
+        return bool(self.__warnings)
+
+    def __len__(self) -> int:
+        return len(self.__warnings)
+
+    @property
+    def warnings(self) -> List[Tuple[str, str]]:
+        return self.__warnings
+
+    def add(self, name: str, message: str) -> None:
+        self.__warnings.append((name, message))
+
+    def summary(self) -> Dict[str, List[str]]:
+        """returns names which caused each warning message"""
+        res: Dict[str, List[str]] = {}
+        for name, message in self.__warnings:
+            res.setdefault(message, []).append(name)
+        return res
+
+    def print_summary(self) -> None:
+        for message, names in self.summary().items():
+            print(f"Warning: {message} ({len(names)} name(s): "
+                  f"{', '.join(names)})")
+
+
+class NameFormatTemplate:
+    """Name format parsed once into literal texts and format specifiers
+    It formats names of many jobs without parsing the format again.
+    %O is replaced with original name of smd file, and other specifiers
+    are replaced with acquisition date (same as strftime).
+    """
+    SPECIFIER_PATTERN = re.compile(r'%(.)', re.DOTALL)
+    DATETIME_FIELDS: Dict[str, Callable[[datetime.datetime], str]] = {
+        'Y': lambda dt: f"{dt.year:04d}",
+        'y': lambda dt: f"{dt.year % 100:02d}",
+        'm': lambda dt: f"{dt.month:02d}", 'd': lambda dt: f"{dt.day:02d}",
+        'H': lambda dt: f"{dt.hour:02d}", 'M': lambda dt: f"{dt.minute:02d}",
+        'S': lambda dt: f"{dt.second:02d}", '%': lambda dt: "%"}
+
+    def __init__(self, name_fmt: str) -> None:
+        self.__name_fmt = name_fmt
+        # list of literal texts (str) and specifiers (callable)
+        self.__parts: List[Union[str, Callable[[datetime.datetime], str]]] = []
+        self.__original_name_idx: List[int] = []  # positions of %O
+
+        pos = 0
+        for match in self.SPECIFIER_PATTERN.finditer(name_fmt):
+            if match.start() > pos:
+                self.__parts.append(name_fmt[pos:match.start()])
+            code = match.group(1)
+            if code == 'O':
+                self.__original_name_idx.append(len(self.__parts))
+                self.__parts.append("")
+            else:
+                self.__parts.append(self.DATETIME_FIELDS.get(
+                    code, lambda dt, fmt=match.group(0): dt.strftime(fmt)))
+            pos = match.end()
+        if pos < len(name_fmt):
+            self.__parts.append(name_fmt[pos:])
+
+    @property
+    def name_fmt(self) -> str:
+        return self.__name_fmt
+
+    def format(self, original_name: str,
+               creation_time: datetime.datetime) -> str:
+        parts = [part if isinstance(part, str) else part(creation_time)
+                 for part in self.__parts]
+        for idx in self.__original_name_idx:
+            parts[idx] = original_name
+        return "".join(parts)
+
+    def format_jobs(self, jobs: Iterable[ConvertJob]) -> List[str]:
+        """format names of jobs"""
+        return [self.format(job.smd_name, job.creation_time) for job in jobs]
+
+
+@lru_cache(maxsize=None)
+def compile_name_format(name_fmt: str) -> NameFormatTemplate:
+    """returns template of name format (compiled only once for each format)"""
+    return NameFormatTemplate(name_fmt)
+
+
 class IBWNameFormatter:
     """Class that validates the name of an Igor binary wave and formats it to
     the appropriate name
     """
     DEFAULT_NAME_FMT = "wave{}"
+    INVALID_CHR_PATTERN = re.compile(r'[^0-9A-Za-z_]')
+    SPACE_TABLE = str.maketrans(" ", "_")
 
     def __init__(self, job: ConvertJob, settings: ApplicationSettings,
-                 print_warning: bool = True) -> None:
+                 print_warning: bool = True,
+                 report: Union[NameReport, None] = None) -> None:
+        """
+        Args:
+            job (ConvertJob): job whose output name is formatted
+            settings (ApplicationSettings): settings which contain formats
+            print_warning (bool, optional): whether to print warnings.
+                Defaults to True.
+            report (Union[NameReport, None], optional): report which
+                collects warnings instead of printing them. Defaults to None.
+        """
         self.__job = job
         self.__settings = settings
         self.__print_warning = print_warning
+        self.__report = report
 
     @property
     def job(self) -> ConvertJob:
@@ -33,44 +186,35 @@ class IBWNameFormatter:
     def updatesettings(self, settings: ApplicationSettings) -> None:
         self.__settings = settings
 
-    def format_original_name(self, name_fmt: str) -> str:
-        org_name, _ = os.path.splitext(
-            os.path.basename(self.job.src_path))
-        return name_fmt.replace("%O", org_name)
-
-    def format_acq_datetime(self, name_fmt: str) -> str:
-        dt = self.job.creation_time
-        return datetime.datetime.strftime(dt, name_fmt)
+    def warn(self, name: str, message: str) -> None:
+        if self.__report is not None:
+            self.__report.add(name, message)
+        elif self.print_warning:
+            print(f"Warning: {message}")
 
     def validate_first_character(self, name: str) -> str:
         if not name[0].isalpha():
+            self.warn(name, "wave name must start with an alphabet")
             name = self.DEFAULT_NAME_FMT.format(name)
-            if self.print_warning:
-                print("Warning: wave name must start with an alphabet")
         return name
 
     def replace_space(self, name: str) -> str:
-        res = name.replace(" ", "_")
-        if res != name and self.print_warning:
-            print("Warning: space(s) in wave name were "
-                  "replaced with underscore(s)")
+        res = name.translate(self.SPACE_TABLE)
+        if res != name:
+            self.warn(name, "space(s) in wave name were "
+                      "replaced with underscore(s)")
         return res
 
     def remove_invalid_chr(self, name: str) -> str:
-        valid_characters = [chr_ for chr_ in name
-                            if chr_.encode('utf-8').isalnum()
-                            or chr_ == '_']
-        res = "".join(valid_characters)
-        if res != name and self.print_warning:
-            print("Warning: all characters in name must be"
-                  "alphabet, digit, or underscore")
+        res = self.INVALID_CHR_PATTERN.sub("", name)
+        if res != name:
+            self.warn(name, "all characters in name must be "
+                      "alphabet, digit, or underscore")
         return res
 
     def format_name(self, name_fmt: str) -> str:
-        res = self.format_original_name(name_fmt)  # %O
-        res = self.format_acq_datetime(res)
-
-        return res
+        return compile_name_format(name_fmt).format(
+            self.job.smd_name, self.job.creation_time)
 
     def validate_name(self, name: str) -> str:
         name = self.validate_first_character(name)
@@ -82,8 +226,9 @@ class IBWNameFormatter:
 
 class SpectralAxisIBWNameFormatter(IBWNameFormatter):
     def __init__(self, job: ConvertJob, settings: ApplicationSettings,
-                 print_warning: bool = True) -> None:
-        super().__init__(job, settings, print_warning)
+                 print_warning: bool = True,
+                 report: Union[NameReport, None] = None) -> None:
+        super().__init__(job, settings, print_warning, report)
 
     def get_name(self, unit: str) -> str:
         name_fmt = self.settings.spectral_axis_name_formats[unit]
@@ -95,32 +240,73 @@ class SpectralAxisIBWNameFormatter(IBWNameFormatter):
 
 class SpectralDataIBWNameFormatter(IBWNameFormatter):
     def __init__(self, job: ConvertJob, settings: ApplicationSettings,
-                 print_warning: bool = True) -> None:
-        super().__init__(job, settings, print_warning)
+                 print_warning: bool = True,
+                 report: Union[NameReport, None] = None) -> None:
+        super().__init__(job, settings, print_warning, report)
 
-    def get_name(self, exist_names: Tuple[str, ...] = None) -> str:
+    def get_name(self, exist_names: Union[NameRegistry, None] = None) -> str:
         detector_name = self.job.selected_detector_name
         try:
             name_fmt = self.settings.data_name_formats[detector_name]
             res = self.format_name(name_fmt)
         except KeyError:  # if format is not registered
-            print(f"Warning: Name format for {self.job.selected_detector_name} "
-                  "is not found")
+            self.warn(self.job.smd_name,
+                      f"Name format for {detector_name} is not found")
             res = self.job.smd_name  # use original name of smd
         res = self.validate_name(res)
-        if exist_names:
+        if exist_names is not None:
             res = self.unique_name(res, exist_names)
 
         return res
 
-    def unique_name(self, name: str, exist_names: Tuple[str, ...]) -> str:
-        res = name
-
-        conflict_count = 0
-        while res in exist_names:
-            res = f"{name}_{conflict_count + 1}"
-            conflict_count += 1
-        if conflict_count != 0 and self.print_warning:
-            print("Warning: got output name already exist")
+    def unique_name(self, name: str, exist_names: NameRegistry) -> str:
+        res = exist_names.unique_name(name)
+        if res != name:
+            self.warn(name, "got output name already exist")
 
         return res
+
+
+def format_data_names(jobs: Iterable[ConvertJob],
+                      settings: ApplicationSettings,
+                      report: Union[NameReport, None] = None) -> List[str]:
+    """format and validate output names of many jobs at once
+    Jobs are grouped by detector, and the name format of each detector is
+    compiled only once. Warnings are collected into report (summary is
+    printed when report is not specified). Names are not made unique.
+
+    Args:
+        jobs (Iterable[ConvertJob]): jobs to be named
+        settings (ApplicationSettings): settings which contain formats
+        report (Union[NameReport, None], optional): report which collects
+            warnings. Defaults to None.
+
+    Returns:
+        List[str]: output names of jobs (in the same order as jobs)
+    """
+    jobs = list(jobs)
+    job_report = report if report is not None else NameReport()
+
+    groups: Dict[str, List[int]] = {}  # detector name -> indices of jobs
+    for idx, job in enumerate(jobs):
+        groups.setdefault(job.selected_detector_name, []).append(idx)
+
+    res = [""] * len(jobs)
+    for detector_name, indices in groups.items():
+        group = [jobs[idx] for idx in indices]
+        name_fmt = settings.data_name_formats.get(detector_name)
+        if name_fmt is None:  # use original name of smd
+            names = [job.smd_name for job in group]
+            for name in names:
+                job_report.add(
+                    name, f"Name format for {detector_name} is not found")
+        else:
+            names = compile_name_format(name_fmt).format_jobs(group)
+
+        validator = IBWNameFormatter(group[0], settings, report=job_report)
+        for idx, name in zip(indices, names):
+            res[idx] = validator.validate_name(name)
+
+    if report is None:
+        job_report.print_summary()
+    return res
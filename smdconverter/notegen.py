@@ -1,3 +1,6 @@
+from typing import Union
+
+from .datastats import DetectorStatistics
 from .smdparser import ChannelInfo, SimpledSMDParser
 
 
@@ -14,11 +17,16 @@ class IBWNoteGenerator:
     def __init__(self, smd_data: SimpledSMDParser) -> None:
         self.__smd_data = smd_data
         self.__detector_id: int = self.DEFAULT_DETECTOR_ID
+        self.__statistics: Union[DetectorStatistics, None] = None
 
     def set_detector_id(self, detector_id: int) -> None:
         """setter of ID of detector from which information is collected"""
         self.__detector_id = detector_id
 
+    def set_statistics(self, statistics: DetectorStatistics) -> None:
+        """setter of statistics of data (written in note if set)"""
+        self.__statistics = statistics
+
     @property
     def selected_detector(self) -> ChannelInfo:
         return self.__smd_data.detectors[self.__detector_id]
@@ -30,6 +38,8 @@ class IBWNoteGenerator:
             self.excitation_wavelength,
             self.grating_infos,
             self.channel_infos]
+        if self.__statistics is not None:
+            contents.append(self.statistics_infos)
 
         res = "\n".join(contents)
         return res
@@ -88,3 +98,16 @@ class IBWNoteGenerator:
         content = "\n".join(rows)
         res = heading + content
         return res
+
+    @property
+    def statistics_infos(self) -> str:
+        """return string of statistics of data"""
+        heading = self.HEADING_FMT.format("Statistics")
+        if self.__statistics is None:
+            return heading
+
+        items = self.__statistics.note_items()
+        content = "".join(self.ITEM_LV1_FMT.format(name, value)
+                          for name, value in items)
+        res = heading + content
+        return res
@@ -4,8 +4,6 @@ from tkinter.filedialog import asksaveasfilename
 from tkinter.messagebox import showerror
 from typing import Callable, Union, cast
 
-from ibwpy import BinaryWaveHeader5
-
 from .appsettings import ApplicationSettings
 from .constants import IMAGE_PATH, PADDING_OPTIONS, Direction
 from .convertjob import ConvertJob
@@ -203,6 +201,7 @@ class OutputOptionsFrame(ttk.LabelFrame):
         self.update_spaxis_region()
 
     def handle_spsave_btn(self) -> None:
+        from ibwpy import BinaryWaveHeader5  # imported on first use
         try:
             BinaryWaveHeader5.is_valid_name(self.sp_outname.get())
         except ValueError as error:
@@ -0,0 +1,398 @@
+"""
+Atomic writing of output files
+
+Outputs are written into temporary files in the destination directory and
+renamed to their final names only after they are completely written (and
+optionally synced to the disk), so that incomplete files never appear with
+the final names even if writing is interrupted.
+
+For slow (network) destinations, StagedOutputWriter writes outputs into a
+local staging directory and copies finished files to the destination in
+background threads, so that conversion and network I/O overlap.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterator, List, Set, Tuple, Union
+
+CommitCallback = Callable[[], None]
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+class OutputWriter:
+    """Class for writing output files atomically
+    Written files are committed (fsync and rename) in batches of
+    fsync_batch_size files, and commit() must be called (or the writer must
+    be used as a context manager) to commit files remaining in the batch.
+    """
+    DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024  # bytes
+    TMP_PREFIX = "."
+    TMP_SUFFIX = ".tmp"
+
+    def __init__(self, fsync: bool = True, fsync_batch_size: int = 1,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE) -> None:
+        """
+        Args:
+            fsync (bool, optional): whether to sync files to the disk before
+                they are renamed. Defaults to True.
+            fsync_batch_size (int, optional): number of files committed
+                together. Defaults to 1.
+            buffer_size (int, optional): size of write buffer of files
+                opened with open(). Defaults to DEFAULT_BUFFER_SIZE.
+        """
+        self.fsync = fsync
+        self.fsync_batch_size = max(1, fsync_batch_size)
+        self.buffer_size = buffer_size
+        # (temporary path, destination path, callback)
+        self.__pending: List[Tuple[str, str, Union[CommitCallback, None]]] = []
+
+    def __enter__(self) -> OutputWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        # files in the batch are complete even if an error occurred later
+        self.commit()
+
+    def make_tmp_path(self, dst_path: str) -> str:
+        """create empty temporary file next to dst_path and return its path
+        (NOTE: tempfile.mkstemp is not used because it makes the file
+        readable only by the owner)"""
+        dir_name, base_name = os.path.split(os.path.abspath(dst_path))
+        tmp_path = os.path.join(
+            dir_name, f"{self.TMP_PREFIX}{base_name}."
+                      f"{uuid.uuid4().hex[:8]}{self.TMP_SUFFIX}")
+        with open(tmp_path, mode='xb'):
+            pass
+        return tmp_path
+
+    def write_with(self, dst_path: str, save_func: Callable[[str], None],
+                   on_commit: Union[CommitCallback, None] = None) -> None:
+        """write output with a function which saves a file to given path
+        (e.g. BinaryWave5.save)
+
+        Args:
+            dst_path (str): final path of output
+            save_func (Callable[[str], None]): function which writes output
+                to the temporary path
+            on_commit (Union[CommitCallback, None], optional): called after
+                output is renamed to dst_path. Defaults to None.
+        """
+        tmp_path = self.make_tmp_path(dst_path)
+        try:
+            save_func(tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.__add_pending(tmp_path, dst_path, on_commit)
+
+    @contextlib.contextmanager
+    def open(self, dst_path: str, size: Union[int, None] = None,
+             on_commit: Union[CommitCallback, None] = None
+             ) -> Iterator[BinaryIO]:
+        """open temporary file of output for writing with large buffer
+
+        Args:
+            dst_path (str): final path of output
+            size (Union[int, None], optional): size of output in bytes.
+                If specified, disk space is preallocated. Defaults to None.
+            on_commit (Union[CommitCallback, None], optional): called after
+                output is renamed to dst_path. Defaults to None.
+        """
+        tmp_path = self.make_tmp_path(dst_path)
+        try:
+            with open(tmp_path, mode='r+b', buffering=self.buffer_size) as f:
+                if size:
+                    preallocate(f, size)
+                yield f
+                if size:  # remove preallocated space which is not used
+                    f.truncate()
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.__add_pending(tmp_path, dst_path, on_commit)
+
+    def __add_pending(self, tmp_path: str, dst_path: str,
+                      on_commit: Union[CommitCallback, None]) -> None:
+        self.__pending.append((tmp_path, dst_path, on_commit))
+        if not self.fsync or len(self.__pending) >= self.fsync_batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        """sync (if enabled) and rename all written files to their final
+        names"""
+        pending, self.__pending = self.__pending, []
+        if self.fsync:
+            for tmp_path, _, _ in pending:
+                sync_file(tmp_path)
+        dir_names = set()
+        for tmp_path, dst_path, _ in pending:
+            os.replace(tmp_path, dst_path)
+            # replace() does nothing if both are links to the same file
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            dir_names.add(os.path.dirname(os.path.abspath(dst_path)))
+        if self.fsync:
+            for dir_name in dir_names:
+                sync_directory(dir_name)
+        for _, _, on_commit in pending:
+            if on_commit:
+                on_commit()
+
+    def discard(self) -> None:
+        """remove written files which are not committed yet"""
+        pending, self.__pending = self.__pending, []
+        for tmp_path, _, _ in pending:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+
+class StagedOutputWriter(OutputWriter):
+    """Class for writing outputs into local staging directory and copying
+    finished files to their destinations with limited concurrency
+    Each file is copied into a temporary file in the destination with large
+    buffer, synced (if enabled) and renamed. Callbacks on commit are called
+    in the thread which uses the writer (in write_with(), open() or
+    commit()). A failed copy does not affect other outputs: its callback is
+    never called, and its error is raised from commit() after all copies
+    end.
+    """
+    DEFAULT_COPY_WORKERS = 2
+    DEFAULT_COPY_BUFFER_SIZE = 16 * 1024 * 1024  # bytes
+    STAGED_FILES_PER_WORKER = 2  # staged files waiting for copy per worker
+
+    def __init__(self, staging_dir: str = "",
+                 copy_workers: int = DEFAULT_COPY_WORKERS,
+                 fsync: bool = True,
+                 buffer_size: int = OutputWriter.DEFAULT_BUFFER_SIZE,
+                 copy_buffer_size: int = DEFAULT_COPY_BUFFER_SIZE) -> None:
+        """
+        Args:
+            staging_dir (str, optional): local directory where outputs are
+                written first. Defaults to "" (directory in system
+                temporary directory).
+            copy_workers (int, optional): number of files copied to
+                destinations concurrently. Defaults to DEFAULT_COPY_WORKERS.
+            fsync (bool, optional): whether to sync copied files before
+                they are renamed (by copy workers one by one).
+                Defaults to True.
+            buffer_size (int, optional): size of write buffer of staged
+                files. Defaults to OutputWriter.DEFAULT_BUFFER_SIZE.
+            copy_buffer_size (int, optional): size of buffer used to copy
+                files. Defaults to DEFAULT_COPY_BUFFER_SIZE.
+        """
+        super().__init__(fsync, buffer_size=buffer_size)
+        self.staging_dir = staging_dir or os.path.join(
+            tempfile.gettempdir(), "smdconverter_staging")
+        self.copy_buffer_size = copy_buffer_size
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+        workers = max(1, copy_workers)
+        self.__executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="output-copier")
+        # limit staged files to bound usage of local disk
+        self.__staged_slots = threading.Semaphore(
+            workers * self.STAGED_FILES_PER_WORKER)
+        self.__futures: List[Future] = []
+        self.__errors: List[BaseException] = []  # errors of failed copies
+        self.__dst_dirs: Set[str] = set()  # directories synced on commit
+
+    def __exit__(self, *args) -> None:
+        try:
+            self.commit()
+        finally:
+            self.__executor.shutdown(wait=True)
+
+    def write_with(self, dst_path: str, save_func: Callable[[str], None],
+                   on_commit: Union[CommitCallback, None] = None) -> None:
+        stage_path = self.__make_stage_path(dst_path)
+        try:
+            save_func(stage_path)
+        except BaseException:
+            os.remove(stage_path)
+            self.__staged_slots.release()
+            raise
+        self.__submit(stage_path, dst_path, on_commit)
+
+    @contextlib.contextmanager
+    def open(self, dst_path: str, size: Union[int, None] = None,
+             on_commit: Union[CommitCallback, None] = None
+             ) -> Iterator[BinaryIO]:
+        stage_path = self.__make_stage_path(dst_path)
+        try:
+            with open(stage_path, mode='r+b',
+                      buffering=self.buffer_size) as f:
+                if size:
+                    preallocate(f, size)
+                yield f
+                if size:
+                    f.truncate()
+        except BaseException:
+            os.remove(stage_path)
+            self.__staged_slots.release()
+            raise
+        self.__submit(stage_path, dst_path, on_commit)
+
+    def __make_stage_path(self, dst_path: str) -> str:
+        self.__call_finished_callbacks()
+        self.__staged_slots.acquire()  # wait until copy of older file ends
+        stage_path = os.path.join(
+            self.staging_dir,
+            f"{uuid.uuid4().hex[:8]}_{os.path.basename(dst_path)}")
+        try:
+            with open(stage_path, mode='xb'):
+                pass
+        except BaseException:
+            self.__staged_slots.release()
+            raise
+        return stage_path
+
+    def __submit(self, stage_path: str, dst_path: str,
+                 on_commit: Union[CommitCallback, None]) -> None:
+        self.__dst_dirs.add(os.path.dirname(os.path.abspath(dst_path)))
+        future = self.__executor.submit(self.__copy, stage_path, dst_path)
+        future.add_done_callback(lambda _: self.__staged_slots.release())
+        setattr(future, 'stage_path', stage_path)
+        setattr(future, 'dst_path', dst_path)
+        setattr(future, 'on_commit', on_commit)
+        self.__futures.append(future)
+
+    def __copy(self, stage_path: str, dst_path: str) -> None:
+        """copy staged file to destination atomically (run in worker)"""
+        try:
+            tmp_path = self.make_tmp_path(dst_path)
+            try:
+                with open(stage_path, mode='rb') as src, \
+                        open(tmp_path, mode='r+b') as dst:
+                    preallocate(dst, os.fstat(src.fileno()).st_size)
+                    shutil.copyfileobj(src, dst, self.copy_buffer_size)
+                    dst.truncate()
+                    if self.fsync:
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                os.replace(tmp_path, dst_path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(stage_path)
+
+    def __finish(self, futures: List[Future]) -> None:
+        """call callbacks of copied files (errors of failed copies are kept
+        until commit)"""
+        for future in futures:
+            if future.cancelled():
+                continue
+            error = future.exception()  # wait until the copy ends
+            if error:
+                print(f"Failed: {getattr(future, 'dst_path')} ({error})")
+                self.__errors.append(error)
+                continue
+            on_commit = getattr(future, 'on_commit')
+            if on_commit:
+                on_commit()
+
+    def __call_finished_callbacks(self) -> None:
+        """call callbacks of files whose copies ended (succeeded or not)"""
+        finished = [future for future in self.__futures if future.done()]
+        self.__futures = [future for future in self.__futures
+                          if not future.done()]
+        self.__finish(finished)
+
+    def commit(self) -> None:
+        """wait for all copies and call their callbacks
+        (error of the first failed copy is raised)"""
+        futures, self.__futures = self.__futures, []
+        self.__finish(futures)
+        if self.fsync:
+            for dir_name in self.__dst_dirs:
+                sync_directory(dir_name)
+        self.__dst_dirs.clear()
+        errors, self.__errors = self.__errors, []
+        if errors:
+            raise errors[0]
+
+    def discard(self) -> None:
+        """cancel copies which are not started yet (their staged files are
+        removed)"""
+        for future in self.__futures:
+            if future.cancel():  # __copy never runs to remove staged file
+                with contextlib.suppress(OSError):
+                    os.remove(getattr(future, 'stage_path'))
+        self.commit()
+
+
+NETWORK_FILE_SYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs',
+                        '9p', 'fuse.sshfs', 'davfs', 'ncpfs')
+
+
+def is_network_path(path: str) -> bool:
+    """returns whether path is on a network file system
+    (mount table of Linux or drive type of Windows is used; always False
+    on the other systems)"""
+    path = os.path.abspath(path)
+    if sys.platform == 'win32':
+        if path.startswith('\\\\'):  # UNC path
+            return True
+        import ctypes
+        drive_remote = 4
+        drive = os.path.splitdrive(path)[0] + '\\'
+        return ctypes.windll.kernel32.GetDriveTypeW(drive) == drive_remote
+
+    try:
+        with open('/proc/mounts', mode='r') as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return False
+    mount_point, fs_type = "", ""
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        point = fields[1].replace('\\040', ' ')
+        if (path == point or path.startswith(point.rstrip('/') + '/')) \
+                and len(point) > len(mount_point):
+            mount_point, fs_type = point, fields[2]
+    return fs_type in NETWORK_FILE_SYSTEMS
+
+
+def file_checksum(path: str) -> str:
+    """returns sha256 hex digest of a file (read chunk by chunk)"""
+    hash_ = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b''):
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
+def preallocate(f: BinaryIO, size: int) -> None:
+    """reserve disk space of file (ignored when not supported)"""
+    if hasattr(os, 'posix_fallocate'):
+        with contextlib.suppress(OSError):  # e.g. unsupported file system
+            os.posix_fallocate(f.fileno(), 0, size)
+
+
+def sync_file(path: str) -> None:
+    with open(path, mode='r+b') as f:
+        os.fsync(f.fileno())
+
+
+def sync_directory(path: str) -> None:
+    """sync directory entries (renames) to the disk (POSIX only)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,288 @@
+"""
+Batch fitting of Lorentzian peaks to all spectra of a detector
+
+A Lorentzian with constant offset
+    f(x) = amplitude * (width / 2)^2 / ((x - position)^2 + (width / 2)^2)
+           + offset
+is fitted to every spectrum by Levenberg-Marquardt method. Thousands of
+spectra are fitted at once with vectorised NumPy operations (normal
+equations of all spectra in a chunk are solved in one call), and chunks are
+distributed to worker processes, each of which memory-maps the smd file by
+itself. Fitted parameters and RMS residuals are saved as maps.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from .mapexport import make_map_note, map_wave_names, save_map
+from .outputwriter import OutputWriter
+from .smdparser import SimpledSMDParser, SpectralUnit
+
+PARAM_NAMES = ('position', 'width', 'amplitude', 'offset')
+MAP_NAMES = PARAM_NAMES + ('residual',)
+MIN_POINTS = len(PARAM_NAMES) + 1  # spectra with fewer valid points are NaN
+
+
+class LorentzianFitter:
+    """Class for fitting Lorentzian to chunks of spectra at once
+    """
+
+    def __init__(self, axis: np.ndarray, start: Union[float, None] = None,
+                 stop: Union[float, None] = None, iterations: int = 50,
+                 tolerance: float = 1e-6) -> None:
+        """
+        Args:
+            axis (np.ndarray): spectral axis
+            start (Union[float, None], optional): start of fitted range.
+                Defaults to None (start of axis).
+            stop (Union[float, None], optional): stop of fitted range.
+                Defaults to None (end of axis).
+            iterations (int, optional): maximum number of iterations.
+                Defaults to 50.
+            tolerance (float, optional): fitting of a spectrum is finished
+                when relative decrease of squared residual is smaller than
+                this. Defaults to 1e-6.
+        """
+        start = axis.min() if start is None else start
+        stop = axis.max() if stop is None else stop
+        low, high = min(start, stop), max(start, stop)
+        self.mask = (axis >= low) & (axis <= high)
+        if np.count_nonzero(self.mask) < MIN_POINTS:
+            raise ValueError(
+                f"fitted range ({low} ~ {high}) has too few points")
+        self.x = axis[self.mask].astype(np.float64)
+        self.iterations = iterations
+        self.tolerance = tolerance
+
+    @staticmethod
+    def model(x: np.ndarray, params: np.ndarray
+              ) -> Tuple[np.ndarray, np.ndarray]:
+        """returns values and Jacobian of model
+        (array[spectrum][r] and array[spectrum][r][param])"""
+        position, width, amplitude, offset = \
+            (params[:, idx, None] for idx in range(len(PARAM_NAMES)))
+        half = width / 2
+        dx = x - position
+        denom = dx ** 2 + half ** 2
+        shape = half ** 2 / denom
+        peak = amplitude * shape
+        jacobian = np.stack(
+            [peak * 2 * dx / denom,
+             peak * dx ** 2 / (denom * half),
+             shape,
+             np.ones_like(shape)], axis=-1)
+        return peak + offset, jacobian
+
+    def initial_guess(self, spectra: np.ndarray) -> np.ndarray:
+        """returns initial parameters estimated from maximum and half
+        width of each spectrum"""
+        filled = np.where(np.isfinite(spectra), spectra, -np.inf)
+        peak_idx = filled.argmax(axis=1)
+        maximum = filled[np.arange(spectra.shape[0]), peak_idx]
+        # NOTE: np.nanmin warns (not suppressed by errstate) for spectra
+        # without finite values, whose offset is NaN
+        offset = np.where(np.isfinite(spectra), spectra, np.inf).min(axis=1)
+        offset[np.isinf(offset)] = np.nan
+        step = np.abs(np.diff(self.x)).mean()
+        with np.errstate(invalid='ignore'):
+            amplitude = maximum - offset
+            above = np.count_nonzero(
+                filled - offset[:, None] > amplitude[:, None] / 2, axis=1)
+        width = np.maximum(above, 1) * step
+        return np.stack([self.x[peak_idx], width, amplitude, offset], axis=1)
+
+    def fit(self, spectra: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """fit model to spectra (array[spectrum][r] on the whole axis)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: parameters
+                (array[spectrum][param]) and RMS residual of each spectrum
+                (NaN for spectra which cannot be fitted)
+        """
+        y = spectra[:, self.mask].astype(np.float64)
+        valid = np.isfinite(y)
+        weights = valid.astype(np.float64)
+        y = np.where(valid, y, 0.0)
+        counts = valid.sum(axis=1)
+        params = self.initial_guess(np.where(valid, y, np.nan))
+
+        def cost_of(target: np.ndarray, params_: np.ndarray,
+                    rows: np.ndarray) -> np.ndarray:
+            values, _ = self.model(self.x, params_)
+            return (((target - values) * weights[rows]) ** 2).sum(axis=1)
+
+        fittable = (counts >= MIN_POINTS) & np.isfinite(params).all(axis=1)
+        active = np.nonzero(fittable)[0]
+        cost = np.full(y.shape[0], np.nan)
+        cost[active] = cost_of(y[active], params[active], active)
+        damping = np.full(y.shape[0], 1e-3)
+        identity = np.eye(len(PARAM_NAMES))
+        with np.errstate(all='ignore'):
+            for _ in range(self.iterations):
+                if not active.size:
+                    break
+                values, jacobian = self.model(self.x, params[active])
+                jacobian *= weights[active, :, None]
+                residual = (y[active] - values) * weights[active]
+                jtj = np.einsum('nri,nrj->nij', jacobian, jacobian)
+                gradient = np.einsum('nri,nr->ni', jacobian, residual)
+                diagonal = jtj * identity
+                system = jtj + damping[active, None, None] * diagonal \
+                    + identity * 1e-12
+                try:
+                    step = np.linalg.solve(system, gradient[..., None])[..., 0]
+                except np.linalg.LinAlgError:  # singular (degenerate) rows
+                    step = (np.linalg.pinv(system)
+                            @ gradient[..., None])[..., 0]
+
+                trial = params[active] + step
+                trial_cost = cost_of(y[active], trial, active)
+                accepted = np.isfinite(trial_cost) \
+                    & (trial_cost < cost[active])
+                decrease = cost[active] - trial_cost
+                accepted_rows = active[accepted]
+                params[accepted_rows] = trial[accepted]
+                cost[accepted_rows] = trial_cost[accepted]
+                damping[active] = np.where(accepted, damping[active] / 10,
+                                           damping[active] * 10)
+
+                converged = (accepted & (decrease <= self.tolerance
+                                         * trial_cost)) \
+                    | (damping[active] > 1e10)
+                active = active[~converged]
+
+        params[:, 1] = np.abs(params[:, 1])
+        params[~fittable] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rms = np.sqrt(cost / counts)
+        return params, rms
+
+
+# state of worker process (set by _init_worker)
+_worker_state: Dict[str, object] = {}
+
+
+def _init_worker(path: str, detector_id: int,
+                 fitter: LorentzianFitter) -> None:
+    """open smd file in worker process"""
+    _worker_state['spectra'] = \
+        SimpledSMDParser.from_file(path).detector_spectra(detector_id)
+    _worker_state['fitter'] = fitter
+
+
+def _fit_range(start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+    spectra: np.ndarray = _worker_state['spectra']  # type: ignore
+    fitter: LorentzianFitter = _worker_state['fitter']  # type: ignore
+    return fitter.fit(spectra[start:stop])
+
+
+class PeakFitMapper:
+    """Class for fitting all spectra of a detector in smd file and saving
+    maps of fitted parameters
+    """
+    CHUNK_SPECTRA = 2048  # number of spectra fitted at once
+
+    def __init__(self, path: str, detector_id: int,
+                 unit: SpectralUnit = 'GHz',
+                 start: Union[float, None] = None,
+                 stop: Union[float, None] = None, iterations: int = 50,
+                 workers: int = 0) -> None:
+        """
+        Args:
+            path (str): path of smd file
+            detector_id (int): index of fitted detector
+            unit (SpectralUnit, optional): unit of spectral axis.
+                Defaults to 'GHz'.
+            start, stop (Union[float, None], optional): fitted range in
+                unit. Defaults to None (whole axis).
+            iterations (int, optional): maximum number of iterations.
+                Defaults to 50.
+            workers (int, optional): number of worker processes (0: number
+                of CPUs, 1: fitted in this process). Defaults to 0.
+        """
+        self.__path = path
+        self.__smd_data = SimpledSMDParser.from_file(path)
+        self.__detector_id = detector_id
+        self.__unit = unit
+        self.__fitter = LorentzianFitter(
+            self.__smd_data.spectral_axis(detector_id, unit),
+            start, stop, iterations)
+        self.__workers = workers or os.cpu_count() or 1
+
+    @property
+    def smd_data(self) -> SimpledSMDParser:
+        return self.__smd_data
+
+    def __ranges(self, pixel_num: int) -> List[Tuple[int, int]]:
+        return [(start, min(start + self.CHUNK_SPECTRA, pixel_num))
+                for start in range(0, pixel_num, self.CHUNK_SPECTRA)]
+
+    def fit(self) -> Dict[str, np.ndarray]:
+        """fit all spectra and returns maps (array[z][y][x]) of parameters
+        and residual"""
+        spectra = self.__smd_data.detector_spectra(self.__detector_id)
+        pixel_num = spectra.shape[0]
+        params = np.empty((pixel_num, len(PARAM_NAMES)), dtype=np.float32)
+        residual = np.empty(pixel_num, dtype=np.float32)
+        ranges = self.__ranges(pixel_num)
+        results: Iterator[Tuple[np.ndarray, np.ndarray]]
+        if self.__workers == 1 or len(ranges) == 1:
+            results = (self.__fitter.fit(spectra[start:stop])
+                       for start, stop in ranges)
+            self.__store(ranges, results, params, residual)
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=self.__workers, initializer=_init_worker,
+                    initargs=(self.__path, self.__detector_id,
+                              self.__fitter)) as executor:
+                results = executor.map(
+                    _fit_range, *zip(*ranges))
+                self.__store(ranges, results, params, residual)
+
+        spatial_size = self.__smd_data.spatial_size
+        maps = {name: params[:, idx].reshape(spatial_size)
+                for idx, name in enumerate(PARAM_NAMES)}
+        maps['residual'] = residual.reshape(spatial_size)
+        return maps
+
+    @staticmethod
+    def __store(ranges, results, params: np.ndarray,
+                residual: np.ndarray) -> None:
+        for (start, stop), (params_, residual_) in zip(ranges, results):
+            params[start:stop] = params_
+            residual[start:stop] = residual_
+
+    def save(self, dst_dir: str, base_name: str,
+             writer: Union[OutputWriter, None] = None) -> List[str]:
+        """fit all spectra and save maps as "<base_name>_<map name>.ibw"
+        (base_name is made valid and shortened before fitting if needed)
+
+        Returns:
+            List[str]: paths of saved maps
+        """
+        if writer is None:
+            with OutputWriter() as writer:
+                return self.save(dst_dir, base_name, writer)
+
+        wave_names = dict(zip(MAP_NAMES, map_wave_names(
+            base_name, [f"_{name}" for name in MAP_NAMES])))
+        maps = self.fit()
+        fitted_range = "{:g} ~ {:g} {}".format(
+            self.__fitter.x.min(), self.__fitter.x.max(), self.__unit)
+        units = {'position': self.__unit, 'width': self.__unit}
+        paths = []
+        for name, arr in maps.items():
+            wave_name = wave_names[name]
+            path = os.path.join(dst_dir, f"{wave_name}.ibw")
+            note = make_map_note(self.__smd_data, self.__detector_id, {
+                "Value": name, "Model": "Lorentzian + offset",
+                "Fitted range": fitted_range})
+            save_map(path, wave_name, arr, self.__smd_data, note,
+                     units.get(name, ""), writer)
+            paths.append(path)
+        return paths
@@ -0,0 +1,252 @@
+"""
+Pipeline of batch conversion
+
+Jobs are converted in three stages running concurrently:
+    reader: reads source files ahead into the page cache of the OS
+    transform: makes output waves from (already cached) source data
+    writer: writes output waves with OutputWriter
+Stages are connected by bounded queues, so that disk (or network) I/O of
+one job overlaps with computation of other jobs while the number of
+prefetched sources and output waves in memory stays small.
+
+Each output wave holds a full copy of data of a detector in memory, so
+transform waits before making an output until the number of output waves
+being made, waiting for writer or being written is below
+write_queue_size. Peak memory is therefore about write_queue_size output
+waves (1 by default, as in sequential conversion). Sources read ahead are
+only kept in the page cache of the OS (up to read_ahead sources), which is
+reclaimed when memory is needed.
+
+If a catalog of outputs is given, jobs whose sources have the same contents
+as sources converted before (or earlier in the same batch) reuse existing
+outputs instead of being converted again.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, List,
+                    Tuple, Union)
+
+from .catalog import OutputCatalog
+from .convertjob import ConvertJob
+from .outputwriter import CommitCallback, OutputWriter
+
+if TYPE_CHECKING:
+    from ibwpy import BinaryWave5
+
+StepsGetter = Callable[[ConvertJob], List[Dict[str, Any]]]
+JobCallback = Callable[[ConvertJob, Union[Exception, None]], None]
+# output wave, path of existing output, or job in the batch whose output is
+# reused
+StageOutput = Union['BinaryWave5', str, ConvertJob, None]
+# (job, output, key in catalog or None, error or None)
+StageItem = Tuple[ConvertJob, StageOutput, Union[str, None],
+                  Union[Exception, None]]
+
+READ_BUFFER_SIZE = 8 * 1024 * 1024  # bytes
+
+
+def prefetch_file(path: str, buffer: bytearray) -> None:
+    """read whole file through buffer so that it is cached by the OS
+    (the OS is also advised to read the file ahead sequentially)"""
+    view = memoryview(buffer)
+    with open(path, mode='rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while f.readinto(view):
+            pass
+
+
+def is_wave(output: StageOutput) -> bool:
+    """returns whether output is a wave made by transform (not an existing
+    output reused)"""
+    return output is not None and not isinstance(output, (str, ConvertJob))
+
+
+class ConversionPipeline:
+    """Class for converting jobs with reader, transform and writer stages
+    Reader and transform stages run in their own threads, and the writer
+    stage runs in the thread which calls run() (callbacks are also called
+    in that thread).
+    """
+    DEFAULT_READ_AHEAD = 2  # sources read ahead of transform
+    DEFAULT_WRITE_QUEUE_SIZE = 1  # output waves in memory at once
+    POLL_INTERVAL = 0.1  # seconds
+
+    def __init__(self, writer: OutputWriter,
+                 read_ahead: int = DEFAULT_READ_AHEAD,
+                 write_queue_size: int = DEFAULT_WRITE_QUEUE_SIZE,
+                 read_buffer_size: int = READ_BUFFER_SIZE,
+                 catalog: Union[OutputCatalog, None] = None) -> None:
+        """
+        Args:
+            writer (OutputWriter): writer of outputs
+            read_ahead (int, optional): number of sources prefetched before
+                they are transformed. Defaults to DEFAULT_READ_AHEAD.
+            write_queue_size (int, optional): maximum number of output
+                waves in memory at once (being made, waiting for writer or
+                being written). Transform overlaps with writer only if it
+                is 2 or more. Defaults to DEFAULT_WRITE_QUEUE_SIZE.
+            read_buffer_size (int, optional): size of buffer used to read
+                sources. Defaults to READ_BUFFER_SIZE.
+            catalog (Union[OutputCatalog, None], optional): catalog of
+                outputs used to find duplicated sources (outputs written by
+                the pipeline are recorded in it, but it is not saved).
+                Defaults to None (duplicates are not checked).
+        """
+        self.writer = writer
+        self.read_ahead = max(1, read_ahead)
+        self.write_queue_size = max(1, write_queue_size)
+        self.read_buffer_size = read_buffer_size
+        self.catalog = catalog
+        self.__stop = threading.Event()
+        self.__output_slots = threading.Semaphore(self.write_queue_size)
+
+    def run(self, jobs: Iterable[ConvertJob], path: str,
+            steps_getter: Union[StepsGetter, None] = None,
+            on_job_end: Union[JobCallback, None] = None) -> None:
+        """convert jobs into ibw files in the directory
+
+        Args:
+            jobs (Iterable[ConvertJob]): jobs to be converted
+            path (str): destination directory (ends with separator)
+            steps_getter (Union[StepsGetter, None], optional): function
+                which returns settings of preprocessing steps for the job.
+                Defaults to None (no preprocessing).
+            on_job_end (Union[JobCallback, None], optional): called with
+                the job and the error (None if succeeded) after each job is
+                written. Defaults to None.
+        """
+        self.__stop.clear()
+        self.__output_slots = threading.Semaphore(self.write_queue_size)
+        read_queue: queue.Queue[Union[StageItem, None]] = \
+            queue.Queue(maxsize=self.read_ahead)
+        write_queue: queue.Queue[Union[StageItem, None]] = \
+            queue.Queue(maxsize=self.write_queue_size)
+        threads = [
+            threading.Thread(target=self.__read, args=(jobs, read_queue),
+                             name="pipeline-reader", daemon=True),
+            threading.Thread(target=self.__transform,
+                             args=(read_queue, write_queue, steps_getter),
+                             name="pipeline-transform", daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for job, output, key, error in iter(write_queue.get, None):
+                holds_slot = is_wave(output)
+                if error is None:
+                    try:
+                        self.__write(job, output, key, path, steps_getter)
+                    except Exception as write_error:
+                        error = write_error
+                output = None  # free written wave before next one is made
+                if holds_slot:
+                    self.__output_slots.release()
+                if on_job_end:
+                    on_job_end(job, error)
+        finally:
+            self.__stop.set()  # stop other stages when writer stops
+            for thread in threads:
+                thread.join()
+
+    def __write(self, job: ConvertJob, output: StageOutput,
+                key: Union[str, None], path: str,
+                steps_getter: Union[StepsGetter, None]) -> None:
+        on_commit: Union[CommitCallback, None] = None
+        if self.catalog is not None and key is not None:
+            catalog = self.catalog
+
+            def record() -> None:
+                catalog.record(key, job.output_path(path))
+            on_commit = record
+
+        if isinstance(output, ConvertJob):  # duplicate in this batch
+            if output.status != 'done':
+                self.writer.commit()
+            if output.status == 'done':
+                output = output.output_path(path)
+            else:  # the other job failed (made while no wave is written)
+                output = job.make_output(
+                    steps_getter(job) if steps_getter else None)
+        if isinstance(output, str):
+            print(f"Reused: {output} (same contents as {job.src_path})")
+            job.reuse_output(output, path, self.writer, on_commit)
+        else:
+            job.write_output(output, path, self.writer, on_commit)
+
+    def __put(self, dst: queue.Queue, item: Union[StageItem, None]) -> bool:
+        """put item into queue unless the pipeline is stopped"""
+        while not self.__stop.is_set():
+            try:
+                dst.put(item, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __acquire_output_slot(self) -> bool:
+        """wait until another output wave can be made unless the pipeline
+        is stopped"""
+        while not self.__stop.is_set():
+            if self.__output_slots.acquire(timeout=self.POLL_INTERVAL):
+                return True
+        return False
+
+    def __get(self, src: queue.Queue) -> Union[StageItem, None]:
+        """get item from queue (None if the pipeline is stopped)"""
+        while not self.__stop.is_set():
+            try:
+                return src.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    def __read(self, jobs: Iterable[ConvertJob], dst: queue.Queue) -> None:
+        buffer = bytearray(self.read_buffer_size)
+        prefetched = set()  # jobs of the same source are read only once
+        for job in jobs:
+            error = None
+            if job.src_path not in prefetched:
+                try:
+                    prefetch_file(job.src_path, buffer)
+                    prefetched.add(job.src_path)
+                except Exception as read_error:
+                    error = read_error
+            if not self.__put(dst, (job, None, None, error)):
+                return
+        self.__put(dst, None)
+
+    def __transform(self, src: queue.Queue, dst: queue.Queue,
+                    steps_getter: Union[StepsGetter, None]) -> None:
+        originals: Dict[str, ConvertJob] = {}  # key -> first job in batch
+        for job, _, _, error in iter(lambda: self.__get(src), None):
+            output: StageOutput = None
+            key = None
+            if error is None:
+                try:
+                    steps = steps_getter(job) if steps_getter else None
+                    if self.catalog is not None:
+                        key = OutputCatalog.make_key(
+                            job.content_fingerprint(), job.selected_detector,
+                            steps)
+                        output = self.catalog.lookup(key) \
+                            or originals.get(key)
+                        originals.setdefault(key, job)
+                    if output is None:
+                        if not self.__acquire_output_slot():
+                            return
+                        try:
+                            output = job.make_output(steps)
+                        except BaseException:
+                            self.__output_slots.release()
+                            raise
+                except Exception as transform_error:
+                    error = transform_error
+            if not self.__put(dst, (job, output, key, error)):
+                return
+        self.__put(dst, None)
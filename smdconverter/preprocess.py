@@ -0,0 +1,267 @@
+"""
+Preprocessing of spectral data applied before conversion into ibw
+
+Each step is a callable which receives a chunk of spectra as a 2-dimensional
+array (array[pixel][r]) and returns the processed chunk of the same shape.
+Only resampling onto a uniform spectral axis changes the size of spectra, so
+it must be the last step.
+Steps are configured for each detector in settings (key: "preprocessing"),
+for example:
+
+    "preprocessing": {
+        "Andor CCD": [
+            {"name": "subtractBackground", "value": 600.0},
+            {"name": "despike", "width": 5, "threshold": 8.0},
+            {"name": "baseline", "degree": 3, "iterations": 10},
+            {"name": "normalize", "unit": "cm-1", "start": 1550.0,
+             "stop": 1650.0},
+            {"name": "resample", "unit": "cm-1", "start": 100.0,
+             "stop": 3000.0, "points": 1024}
+        ]
+    }
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .datastats import DetectorStatistics
+from .smdparser import DTYPE, SimpledSMDParser, SpectralUnit
+
+PreprocessStep = Callable[[np.ndarray], np.ndarray]
+StepSettings = Dict[str, Any]
+
+
+class BackgroundSubtraction:
+    """subtract constant dark/background level from all spectra"""
+
+    def __init__(self, value: float) -> None:
+        self.value = value
+
+    def __call__(self, spectra: np.ndarray) -> np.ndarray:
+        return spectra - self.value
+
+
+class Despiking:
+    """remove cosmic ray spikes with median filter along spectral axis
+    Points which deviate from the median filtered spectrum by more than
+    threshold * (robust standard deviation of the residual) are replaced
+    with the median filtered values.
+    """
+    MAD_TO_SIGMA = 1.4826
+
+    def __init__(self, width: int = 5, threshold: float = 8.0) -> None:
+        if width < 3 or width % 2 == 0:
+            raise ValueError(
+                f"width of median filter must be odd and >= 3 (got {width})")
+        self.width = width
+        self.threshold = threshold
+
+    def median_filter(self, spectra: np.ndarray) -> np.ndarray:
+        half = self.width // 2
+        padded = np.pad(spectra, ((0, 0), (half, half)), mode='edge')
+        windows = sliding_window_view(padded, self.width, axis=1)
+        return np.median(windows, axis=2)
+
+    def __call__(self, spectra: np.ndarray) -> np.ndarray:
+        if spectra.shape[1] < self.width:
+            return spectra
+        filtered = self.median_filter(spectra)
+        residual = spectra - filtered
+        mad = np.median(np.abs(residual), axis=1, keepdims=True)
+        sigma = np.maximum(mad * self.MAD_TO_SIGMA, np.finfo(DTYPE).tiny)
+        is_spike = residual > self.threshold * sigma
+        return np.where(is_spike, filtered, spectra)
+
+
+class PolynomialBaseline:
+    """subtract polynomial baseline from each spectrum
+    Baselines of all spectra in a chunk are fitted at once by least squares
+    with the pseudo inverse of Vandermonde matrix. In each iteration,
+    points above the baseline are clipped to it so that peaks are excluded
+    from the fitting.
+    """
+
+    def __init__(self, axis: np.ndarray,
+                 degree: int = 3, iterations: int = 10) -> None:
+        self.degree = degree
+        self.iterations = iterations
+
+        # normalize axis into [-1, 1] for numerical stability
+        span = axis.max() - axis.min()
+        x = (axis - axis.min()) / span * 2 - 1 if span else axis * 0
+        self.__vander = np.vander(x.astype(np.float64), degree + 1)
+        self.__vander_pinv = np.linalg.pinv(self.__vander)
+
+    def fit(self, spectra: np.ndarray) -> np.ndarray:
+        """returns baselines of spectra (array[pixel][r])"""
+        target = spectra.astype(np.float64)
+        for _ in range(self.iterations + 1):
+            baseline = (target @ self.__vander_pinv.T) @ self.__vander.T
+            target = np.minimum(target, baseline)
+        return baseline
+
+    def __call__(self, spectra: np.ndarray) -> np.ndarray:
+        return spectra - self.fit(spectra)
+
+
+class BandNormalization:
+    """divide each spectrum by its integrated intensity in reference band"""
+
+    def __init__(self, axis: np.ndarray, start: float, stop: float) -> None:
+        low, high = min(start, stop), max(start, stop)
+        self.mask = (axis >= low) & (axis <= high)
+        if not self.mask.any():
+            raise ValueError(
+                f"reference band ({start} ~ {stop}) is out of spectral axis")
+
+    def __call__(self, spectra: np.ndarray) -> np.ndarray:
+        reference = spectra[:, self.mask].sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return spectra / reference
+
+
+class SpectralResampling:
+    """interpolate each spectrum linearly onto uniform spectral axis
+    Indices of neighbouring points and interpolation weights are computed
+    once from the source axis and shared by all spectra, so that a chunk of
+    spectra is resampled by fancy indexing and one multiply-add.
+    Points out of the source axis are NaN.
+    """
+
+    def __init__(self, axis: np.ndarray, unit: SpectralUnit = 'nm',
+                 start: Union[float, None] = None,
+                 stop: Union[float, None] = None,
+                 points: Union[int, None] = None) -> None:
+        if axis.size < 2:
+            raise ValueError("spectral axis is too short to resample")
+        start = float(axis.min()) if start is None else float(start)
+        stop = float(axis.max()) if stop is None else float(stop)
+        points = axis.size if points is None else int(points)
+        if points < 2 or start == stop:
+            raise ValueError(f"invalid resampling range ({start} ~ {stop}, "
+                             f"{points} points)")
+        self.unit = unit
+        self.start = start
+        self.delta = (stop - start) / (points - 1)
+        target = start + self.delta * np.arange(points)
+
+        order = np.argsort(axis, kind='stable')
+        src = axis[order].astype(np.float64)
+        upper = np.clip(np.searchsorted(src, target), 1, src.size - 1)
+        lower = upper - 1
+        span = src[upper] - src[lower]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(span > 0, (target - src[lower]) / span, 0.0)
+        self.__lower = order[lower]
+        self.__upper = order[upper]
+        self.__weights = weights.astype(DTYPE)
+        self.__outside = (target < src[0]) | (target > src[-1])
+
+    @property
+    def size(self) -> int:
+        """returns number of points of resampled spectra"""
+        return self.__weights.size
+
+    @property
+    def scale(self) -> Tuple[float, float]:
+        """returns (start, delta) of resampled axis"""
+        return self.start, self.delta
+
+    def __call__(self, spectra: np.ndarray) -> np.ndarray:
+        lower = spectra[:, self.__lower]
+        res = lower + (spectra[:, self.__upper] - lower) * self.__weights
+        res[:, self.__outside] = np.nan
+        return res
+
+
+class SpectralPreprocessor:
+    """Class for applying preprocessing steps to spectral data of a detector
+    chunk by chunk
+    """
+    CHUNK_SPECTRA = 4096  # number of spectra processed at once
+
+    def __init__(self, steps: List[PreprocessStep]) -> None:
+        self.__steps = steps
+
+    @classmethod
+    def from_settings(cls, steps_settings: List[StepSettings],
+                      smd_data: SimpledSMDParser,
+                      detector_id: int) -> SpectralPreprocessor:
+        """make preprocessor from settings of steps for the detector"""
+        steps = [cls.make_step(step_settings, smd_data, detector_id)
+                 for step_settings in steps_settings]
+        if any(isinstance(step, SpectralResampling) for step in steps[:-1]):
+            raise ValueError("resampling must be the last preprocessing step")
+        return cls(steps)
+
+    @staticmethod
+    def make_step(step_settings: StepSettings, smd_data: SimpledSMDParser,
+                  detector_id: int) -> PreprocessStep:
+        """make a preprocessing step from its settings"""
+        params = dict(step_settings)
+        name = params.pop('name', None)
+        if name == 'subtractBackground':
+            return BackgroundSubtraction(**params)
+        elif name == 'despike':
+            return Despiking(**params)
+        elif name == 'baseline':
+            axis = smd_data.spectral_axis(detector_id)
+            return PolynomialBaseline(axis, **params)
+        elif name == 'normalize':
+            unit: SpectralUnit = params.pop('unit', 'nm')
+            axis = smd_data.spectral_axis(detector_id, unit)
+            return BandNormalization(axis, **params)
+        elif name == 'resample':
+            unit = params.pop('unit', 'nm')
+            axis = smd_data.spectral_axis(detector_id, unit)
+            return SpectralResampling(axis, unit, **params)
+        else:
+            raise ValueError(f"got invalid preprocessing step ({name})")
+
+    @property
+    def steps(self) -> List[PreprocessStep]:
+        return self.__steps
+
+    @property
+    def resampling(self) -> Union[SpectralResampling, None]:
+        """returns resampling step (None if spectra are not resampled)"""
+        if self.steps and isinstance(self.steps[-1], SpectralResampling):
+            return self.steps[-1]
+        return None
+
+    def output_size(self, size_r: int) -> int:
+        """returns number of points of processed spectra"""
+        resampling = self.resampling
+        return resampling.size if resampling else size_r
+
+    def process_chunk(self, spectra: np.ndarray) -> np.ndarray:
+        """apply all steps to a chunk of spectra (array[pixel][r])"""
+        res = spectra
+        for step in self.steps:
+            res = step(res)
+        return res
+
+    def process(self, src: np.ndarray,
+                statistics: Union[DetectorStatistics, None] = None
+                ) -> np.ndarray:
+        """returns new array made by applying all steps to each spectrum of
+        src (array[z][y][x][r]). Source array is read chunk by chunk.
+        If statistics is specified, statistics of each chunk of source and
+        output are accumulated while the output is filled (src is returned
+        without statistics if there is no step).
+        """
+        if not self.steps:
+            return src
+        spectra = src.reshape(-1, src.shape[-1])
+        size_r = self.output_size(src.shape[-1])
+        res = np.empty((spectra.shape[0], size_r), dtype=DTYPE)
+        for start in range(0, spectra.shape[0], self.CHUNK_SPECTRA):
+            stop = start + self.CHUNK_SPECTRA
+            res[start:stop] = self.process_chunk(spectra[start:stop])
+            if statistics is not None:
+                statistics.update(res[start:stop], spectra[start:stop])
+        return res.reshape(src.shape[:-1] + (size_r,))
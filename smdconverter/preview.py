@@ -0,0 +1,207 @@
+"""
+Quick-look preview maps of smd files
+
+Summed intensity, peak position and integrated band intensity of every
+detector are computed in a single chunked pass over the spectral data,
+and cached as npz arrays and PNG thumbnails.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .constants import PREVIEW_CACHE_DIR
+from .smdparser import SimpledSMDParser, SpectralUnit
+
+BandSettings = Dict[str, Any]  # {"unit": ..., "start": ..., "stop": ...}
+PreviewMaps = Dict[str, np.ndarray]  # {map name: array[z][y][x]}
+
+MAP_NAMES = ('intensity', 'peak', 'band')
+
+
+class PreviewGenerator:
+    """Class for computing preview maps of all detectors in one pass
+    """
+    CHUNK_SPECTRA = 16384  # number of pixels read at once
+    DEFAULT_UNIT: SpectralUnit = 'nm'
+
+    def __init__(self, smd_data: SimpledSMDParser,
+                 bands: Dict[str, BandSettings]) -> None:
+        """
+        Args:
+            smd_data (SimpledSMDParser): source smd data
+            bands (Dict[str, BandSettings]): band integrated in band map
+                for each detector name. Unit of the band is also used for
+                peak position. Band map is not made for detectors
+                which are not contained.
+        """
+        self.__smd_data = smd_data
+        self.__bands = bands
+
+    def __unit(self, detector_id: int) -> SpectralUnit:
+        band = self.__bands.get(self.__smd_data.detector_names[detector_id])
+        return band['unit'] if band else self.DEFAULT_UNIT
+
+    def __band_mask(self, detector_id: int) -> np.ndarray:
+        band = self.__bands.get(self.__smd_data.detector_names[detector_id])
+        if not band:
+            return np.zeros(0, dtype=bool)
+        axis = self.__smd_data.spectral_axis(detector_id, band['unit'])
+        low = min(band['start'], band['stop'])
+        high = max(band['start'], band['stop'])
+        return (axis >= low) & (axis <= high)
+
+    def generate(self) -> List[PreviewMaps]:
+        """returns preview maps of each detector"""
+        smd_data = self.__smd_data
+        full_array = smd_data.full_array
+        spectra = full_array.reshape(-1, full_array.shape[-1])
+        pixel_num = spectra.shape[0]
+
+        bounds = np.cumsum((0,) + smd_data.detector_sizes)
+        axes = [smd_data.spectral_axis(id_, self.__unit(id_))
+                for id_ in range(smd_data.detector_count)]
+        masks = [self.__band_mask(id_)
+                 for id_ in range(smd_data.detector_count)]
+        res: List[Dict[str, np.ndarray]] = [
+            {name: np.empty(pixel_num, dtype=np.float32)
+             for name in MAP_NAMES if name != 'band' or masks[id_].any()}
+            for id_ in range(smd_data.detector_count)]
+
+        for start in range(0, pixel_num, self.CHUNK_SPECTRA):
+            stop = start + self.CHUNK_SPECTRA
+            chunk = spectra[start:stop]  # read source only once
+            for id_, maps in enumerate(res):
+                block = chunk[:, bounds[id_]:bounds[id_ + 1]]
+                maps['intensity'][start:stop] = block.sum(axis=1)
+                maps['peak'][start:stop] = axes[id_][block.argmax(axis=1)]
+                if 'band' in maps:
+                    maps['band'][start:stop] = \
+                        block[:, masks[id_]].sum(axis=1)
+
+        spatial_size = smd_data.spatial_size
+        return [{name: arr.reshape(spatial_size) for name, arr in maps.items()}
+                for maps in res]
+
+
+class PreviewCache:
+    """Class for storing preview maps and their thumbnails in cache directory.
+    Cache is identified by path, size and modification time of smd file, and
+    settings of bands.
+    """
+    MAPS_FILE_NAME = "maps.npz"
+    THUMBNAIL_FMT = "{}_{}.png"  # detector ID, map name
+
+    def __init__(self, cache_dir: str = PREVIEW_CACHE_DIR) -> None:
+        self.__cache_dir = cache_dir
+
+    def entry_dir(self, src_path: str, bands: Dict[str, BandSettings]) -> str:
+        """returns directory of cache entry for the source file"""
+        stat = os.stat(src_path)
+        key_src = json.dumps(
+            [os.path.abspath(src_path), stat.st_size, stat.st_mtime_ns,
+             bands], sort_keys=True)
+        key = hashlib.sha1(key_src.encode('utf-8')).hexdigest()
+        return os.path.join(self.__cache_dir, key)
+
+    def thumbnail_path(self, entry_dir: str, detector_id: int,
+                       map_name: str) -> str:
+        return os.path.join(
+            entry_dir, self.THUMBNAIL_FMT.format(detector_id, map_name))
+
+    def load(self, entry_dir: str) -> List[PreviewMaps]:
+        """load preview maps from cache entry
+        (raises FileNotFoundError if not cached)"""
+        res: List[PreviewMaps] = []
+        with np.load(os.path.join(entry_dir, self.MAPS_FILE_NAME)) as npz:
+            for key in npz.files:  # "{detector ID}_{map name}"
+                detector_id, map_name = key.split('_', 1)
+                while len(res) <= int(detector_id):
+                    res.append({})
+                res[int(detector_id)][map_name] = npz[key]
+        return res
+
+    def save(self, entry_dir: str, previews: List[PreviewMaps]) -> None:
+        """save preview maps and their thumbnails into cache entry"""
+        os.makedirs(entry_dir, exist_ok=True)
+        for detector_id, maps in enumerate(previews):
+            for map_name, arr in maps.items():
+                save_png(self.thumbnail_path(entry_dir, detector_id, map_name),
+                         make_thumbnail(arr))
+        # maps are saved at last (it indicates that the entry is complete)
+        # values are typed Any because savez also takes keyword options
+        arrays: Dict[str, Any] = {f"{detector_id}_{map_name}": arr
+                                  for detector_id, maps in enumerate(previews)
+                                  for map_name, arr in maps.items()}
+        np.savez(os.path.join(entry_dir, self.MAPS_FILE_NAME), **arrays)
+
+    def get(self, smd_data: SimpledSMDParser, src_path: str,
+            bands: Dict[str, BandSettings]
+            ) -> Tuple[str, List[PreviewMaps]]:
+        """returns cache entry directory and preview maps of the source file.
+        Preview maps are generated and cached if not cached yet.
+        """
+        entry_dir = self.entry_dir(src_path, bands)
+        try:
+            return entry_dir, self.load(entry_dir)
+        except (FileNotFoundError, ValueError):
+            previews = PreviewGenerator(smd_data, bands).generate()
+            self.save(entry_dir, previews)
+            return entry_dir, previews
+
+
+THUMBNAIL_SIZE = 160  # minimum length of the longer side (pixels)
+
+
+def make_thumbnail(arr: np.ndarray,
+                   size: int = THUMBNAIL_SIZE) -> np.ndarray:
+    """make 8-bit grayscale image (array[y][x]) from map (array[z][y][x]
+    or array[y][x]). Map is averaged along z-axis and enlarged with nearest
+    neighbor interpolation when it is smaller than size.
+    """
+    if arr.ndim == 3:
+        # NOTE: np.nanmean warns for pixels without finite values (NaN)
+        finite = np.isfinite(arr)
+        count = finite.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            image = np.where(finite, arr, 0.).sum(axis=0) / count
+    else:
+        image = arr
+    finite = np.isfinite(image)
+    low = image[finite].min() if finite.any() else 0.
+    high = image[finite].max() if finite.any() else 0.
+    scale = 255 / (high - low) if high > low else 0.
+    image = np.where(finite, (image - low) * scale, 0.).astype(np.uint8)
+
+    ratio = max(1, size // max(image.shape))
+    return np.repeat(np.repeat(image, ratio, axis=0), ratio, axis=1)
+
+
+def save_png(path: str, image: np.ndarray) -> None:
+    """save 8-bit grayscale image (array[y][x]) as PNG file"""
+    with open(path, mode='wb') as f:
+        f.write(encode_png(image))
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """encode 8-bit grayscale image (array[y][x]) into PNG"""
+    height, width = image.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        body = tag + data
+        return struct.pack('>I', len(data)) + body \
+            + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8),  # filter: None
+                      np.ascontiguousarray(image, dtype=np.uint8)])
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) \
+        + chunk(b'IDAT', zlib.compress(rows.tobytes())) \
+        + chunk(b'IEND', b'')
@@ -0,0 +1,55 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import Dict, List
+
+import numpy as np
+
+from .constants import PADDING_OPTIONS
+from .convertjob import ConvertJob
+from .preview import MAP_NAMES, BandSettings, PreviewCache
+
+
+class PreviewWindow(tk.Toplevel):
+    """Window to display quick-look preview maps of a job
+    """
+    MAP_TEXTS = {'intensity': "Summed intensity", 'peak': "Peak position",
+                 'band': "Band intensity"}
+
+    def __init__(self, master: tk.Misc, job: ConvertJob,
+                 bands: Dict[str, BandSettings], *args, **kwargs) -> None:
+        kwargs['master'] = master
+        super().__init__(*args, **kwargs)
+
+        self.title(f"Preview: {job.smd_name} "
+                   f"({job.selected_detector_name_with_id})")
+        self.resizable(False, False)
+        self.bind('<Escape>', lambda event: self.destroy())
+
+        # variables
+        self.__job = job
+        self.__bands = bands
+        self.__images: List[tk.PhotoImage] = []  # keep references of images
+
+        self.__create_widgets()
+        self.focus()
+
+    def __create_widgets(self) -> None:
+        cache = PreviewCache()
+        entry_dir, maps = self.__job.preview(self.__bands, cache)
+
+        for column, map_name in enumerate(
+                name for name in MAP_NAMES if name in maps):
+            arr = maps[map_name]
+            label = ttk.Label(self, text=self.MAP_TEXTS[map_name])
+            label.grid(column=column, row=0, **PADDING_OPTIONS)
+
+            image = tk.PhotoImage(file=cache.thumbnail_path(
+                entry_dir, self.__job.selected_detector, map_name))
+            self.__images.append(image)
+            image_label = ttk.Label(self, image=image)
+            image_label.grid(column=column, row=1, **PADDING_OPTIONS)
+
+            range_text = f"{np.nanmin(arr):.4g} ~ {np.nanmax(arr):.4g}" \
+                if np.isfinite(arr).any() else "<<no data>>"
+            range_label = ttk.Label(self, text=range_text)
+            range_label.grid(column=column, row=2, **PADDING_OPTIONS)
@@ -0,0 +1,96 @@
+"""
+Session files of convert jobs
+
+A session file (json) stores source paths, selected detectors, output names,
+status and checksums of outputs of all jobs, and the destination directory,
+so that a large batch can be resumed after the application is closed.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Union
+
+from .constants import SESSION_AUTOSAVE_PATH
+from .convertjob import ConvertJob
+from .headercache import HeaderCache
+
+JSON_INDENT = 4
+
+
+class JobSession:
+    """Class for saving and loading states of convert jobs
+    """
+    VERSION = 1
+    JOB_STATUSES = ('pending', 'done', 'failed')
+
+    def __init__(self, jobs: List[ConvertJob], dst_dir: str) -> None:
+        self.jobs = jobs
+        self.dst_dir = dst_dir
+
+    @property
+    def pending_jobs(self) -> List[ConvertJob]:
+        """returns jobs which are not completed yet"""
+        return [job for job in self.jobs if job.status != 'done']
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': self.VERSION,
+            'dst_dir': self.dst_dir,
+            'jobs': [{'src_path': job.src_path,
+                      'detector': job.selected_detector,
+                      'output_name': job.output_name,
+                      'status': job.status,
+                      'checksum': job.output_checksum}
+                     for job in self.jobs]}
+
+    def save(self, path: str = SESSION_AUTOSAVE_PATH) -> None:
+        """save session into json file
+        (written into a temporary file and renamed, so that the session
+        file is never broken even if the application stops while saving)"""
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode='w') as f:
+            json.dump(self.to_dict(), f, indent=JSON_INDENT)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = SESSION_AUTOSAVE_PATH,
+             header_cache: Union[HeaderCache, None] = None) -> JobSession:
+        """load session from json file
+        Jobs of the same source file share one opened source. Jobs whose
+        source cannot be opened are skipped.
+        """
+        with open(path, mode='r') as f:
+            session_dict = json.load(f)
+        if session_dict.get('version') != cls.VERSION:
+            raise ValueError(
+                f"unsupported session version ({session_dict.get('version')})")
+
+        header_cache = header_cache or HeaderCache()
+        opened: Dict[str, ConvertJob] = {}  # source path -> opened job
+        jobs: List[ConvertJob] = []
+        for job_dict in session_dict['jobs']:
+            src_path = job_dict['src_path']
+            try:
+                if src_path in opened:
+                    job = opened[src_path].duplicate()
+                else:
+                    job = ConvertJob(src_path, job_dict['output_name'],
+                                     header_cache=header_cache)
+                    opened[src_path] = job
+                job.select_detector(job_dict['detector'])
+            except Exception as error:
+                print(f"Skipped (illegal format): {src_path} ({error})")
+                continue
+
+            job.output_name = job_dict['output_name']
+            status = job_dict.get('status', 'pending')
+            job.status = status if status in cls.JOB_STATUSES else 'pending'
+            job.output_checksum = job_dict.get('checksum')
+            jobs.append(job)
+
+        return cls(jobs, session_dict.get('dst_dir', ""))
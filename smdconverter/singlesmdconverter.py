@@ -3,26 +3,35 @@ from __future__ import annotations
 import os
 import re
 import tkinter as tk
-from copy import deepcopy
 from tkinter import ttk
-from tkinter.filedialog import askopenfilenames
+from tkinter.filedialog import (askopenfilename, askopenfilenames,
+                                asksaveasfilename)
 from tkinter.messagebox import askyesno, showerror, showinfo
 from typing import Callable, Dict, List, Tuple, Union
 
 import tkinterdnd2 as tkdnd
-from ibwpy import BinaryWaveHeader5
 from typing_extensions import Literal
 
 from .appsettings import ApplicationSettingsHandler
-from .constants import (GITHUB_URL, PADDING_OPTIONS, SETTINGS_JSON_PATH,
-                        VERSION, Direction)
+from .axisexport import SpectralAxisExport, existing_names
+from .bandmaps import BandMapGenerator
+from .catalog import OutputCatalog
+from .constants import (GITHUB_URL, PADDING_OPTIONS, SESSION_AUTOSAVE_PATH,
+                        SETTINGS_JSON_PATH, VERSION, Direction)
 from .convertjob import ConvertJob
 from .dstselector import DestinationSelector
+from .headercache import HeaderCache
+from .jobcollection import JobCollection
 from .joblist import JobList
-from .nameformatter import SpectralDataIBWNameFormatter
+from .nameformatter import IBWNameFormatter
 from .opbtnarray import OperationButtonArray
 from .outputoptionsframe import OutputOptionsFrame
+from .outputwriter import OutputWriter, StagedOutputWriter, is_network_path
+from .pipeline import ConversionPipeline
+from .session import JobSession
 from .settingwndw import SettingsWindow
+from .stack import TimeSeriesStacker, group_jobs, numbered_paths
+from .stitch import TileStitcher, group_jobs_by_detector
 
 
 class App(tkdnd.Tk):
@@ -35,6 +44,12 @@ class App(tkdnd.Tk):
     FILE_TYPES = (
         ("SMD spectral data", '*.smd'),
         ("All files", '*.*'))
+    SESSION_FILE_TYPES = (
+        ("Session file", '*.json'),
+        ("All files", '*.*'))
+    IBW_FILE_TYPES = (
+        ("Igor binary wave", '*.ibw'),
+        ("All files", '*.*'))
 
     # layout options
     SCRLBAR_COLUMN = 1  # column which contains scroll bar in main window
@@ -72,12 +87,14 @@ class App(tkdnd.Tk):
         self.rowconfigure(3, weight=0)  # destination selector
 
         # variables
-        self.jobs: List[ConvertJob] = []
+        self.jobs = JobCollection()
         self.dst_dir = tk.StringVar(value="")
         settings_handler = ApplicationSettingsHandler(
             SETTINGS_JSON_PATH)
         self.__settings = settings_handler.load()
+        self.__header_cache = HeaderCache()
 
+        self.__create_menu()
         self.__create_widgets()
         self.update_idletasks()  # required for set minsize dynamically
         self.minsize(width=self.winfo_width(), height=self.winfo_height())
@@ -88,6 +105,32 @@ class App(tkdnd.Tk):
 
         print("\nPlease open smd files.")
 
+    def __create_menu(self) -> None:
+        self.menubar = tk.Menu(self)
+        file_menu = tk.Menu(self.menubar, tearoff=False)
+        file_menu.add_command(label="Open...", command=self.open_smd)
+        file_menu.add_separator()
+        file_menu.add_command(label="Load session...",
+                              command=self.load_session)
+        file_menu.add_command(label="Save session...",
+                              command=self.save_session)
+        file_menu.add_command(label="Resume conversion", command=self.resume)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.destroy)
+        self.menubar.add_cascade(label="File", menu=file_menu)
+        tools_menu = tk.Menu(self.menubar, tearoff=False)
+        tools_menu.add_command(label="Stitch tiles...",
+                               command=self.stitch_jobs)
+        tools_menu.add_command(label="Stack time series...",
+                               command=self.stack_jobs)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Export spectral axes",
+                               command=self.export_spectral_axes)
+        tools_menu.add_command(label="Export band maps",
+                               command=self.export_band_maps)
+        self.menubar.add_cascade(label="Tools", menu=tools_menu)
+        self.config(menu=self.menubar)
+
     def __create_widgets(self) -> None:
         # main operation buttons
         op_commands: Dict[str, Callable[[], None]] = {
@@ -107,7 +150,8 @@ class App(tkdnd.Tk):
             sticky=tk.NSEW, **PADDING_OPTIONS)
 
         # list of jobs
-        self.job_list = JobList(self, self.jobs, self.handle_select_job)
+        self.job_list = JobList(self, self.jobs, self.handle_select_job,
+                                settings=self.__settings)
         self.job_list.grid(
             column=0, row=1, sticky=tk.NSEW, **PADDING_OPTIONS)
 
@@ -162,20 +206,21 @@ class App(tkdnd.Tk):
             smd_path = os.path.abspath(smd_path)
             try:  # load job with temporal name
                 convert_job = ConvertJob(
-                    os.path.abspath(smd_path), smd_name)
+                    os.path.abspath(smd_path), smd_name,
+                    header_cache=self.__header_cache)
             except Exception as error:
                 print(f"Skipped (illegal format): {smd_path} ({error})")
                 continue
 
-            convert_job = self.__format_output_name(convert_job)
-            self.jobs.append(convert_job)
-            print(f"Opened: {convert_job.output_name} "
-                  f"from {convert_job.src_path}")
-            opened = True
-
+            new_jobs = [convert_job]
             # add multiple jobs when multiple detectors are found
             if self.__settings.multi_jobs_flag:
-                self.__add_other_detectors(convert_job)
+                new_jobs += self.__other_detector_jobs(convert_job)
+
+            self.jobs.add_jobs(new_jobs, self.__settings)
+            for job in new_jobs:
+                print(f"Opened: {job.output_name} from {job.src_path}")
+            opened = True
 
         if not opened:  # if valid file is not loaded
             return
@@ -194,28 +239,18 @@ class App(tkdnd.Tk):
         last_job = self.jobs[-1]
         self.job_list.select_job(last_job)
 
-    def __format_output_name(self, job: ConvertJob) -> ConvertJob:
-        formatter = SpectralDataIBWNameFormatter(
-            job=job, settings=self.__settings)
-        job.output_name = formatter.get_name(
-            exist_names=self.output_names)
-
-        return job
-
-    def __add_other_detectors(self, convert_job: ConvertJob) -> None:
-        # HACK: Depending on jobs already loaded is ineffective?
-        detector_ids = convert_job.detector_ids
-        for detector_id in detector_ids[1:]:
-            additive_job = deepcopy(convert_job)
+    def __other_detector_jobs(
+            self, convert_job: ConvertJob) -> List[ConvertJob]:
+        res: List[ConvertJob] = []
+        for detector_id in convert_job.detector_ids[1:]:
+            additive_job = convert_job.duplicate()
             additive_job.select_detector(detector_id)
-            self.__format_output_name(additive_job)
-            self.jobs.append(additive_job)
-            print(f"Opened: {additive_job.output_name} "
-                  f"from {additive_job.src_path}")
+            res.append(additive_job)
+        return res
 
     @property
     def output_names(self) -> Tuple[str, ...]:
-        return tuple(job.output_name for job in self.jobs)
+        return self.jobs.output_names
 
     def remove_job(self) -> None:
         selected_job = self.job_list.selected_job
@@ -239,8 +274,22 @@ class App(tkdnd.Tk):
         pass
 
     def convert(self) -> None:
+        self.__convert_jobs(list(self.jobs))
+
+    def resume(self) -> None:
+        """convert only jobs which are not completed yet"""
+        pending_jobs = [job for job in self.jobs if job.status != 'done']
+        if not pending_jobs:
+            showinfo("Information", message="No job remains to be converted.")
+            return
+        self.__convert_jobs(pending_jobs)
+
+    def __convert_jobs(self, jobs: List[ConvertJob]) -> None:
+        from ibwpy import BinaryWaveHeader5  # imported on first use
+
+        output_names = tuple(job.output_name for job in jobs)
         # validate all output names
-        for name in self.output_names:
+        for name in output_names:
             try:
                 BinaryWaveHeader5.is_valid_name(name)
             except ValueError as error:
@@ -250,8 +299,7 @@ class App(tkdnd.Tk):
                 return
 
         # check name confliction
-        conflicted_names = [x for x in set(self.output_names)
-                            if self.output_names.count(x) > 1]
+        conflicted_names = self.jobs.revalidate()
         if conflicted_names:
             msg = "Error: Duplicate output name(s) exists ({}).".format(
                 ", ".join(conflicted_names))
@@ -260,9 +308,9 @@ class App(tkdnd.Tk):
 
         # ask if overwrite
         files_and_dirs = os.listdir(self.dst_dir.get())
-        files = [f for f in files_and_dirs
-                 if os.path.isfile(os.path.join(self.dst_dir.get(), f))]
-        exist_names = [f"{name}.ibw" for name in self.output_names
+        files = {f for f in files_and_dirs
+                 if os.path.isfile(os.path.join(self.dst_dir.get(), f))}
+        exist_names = [f"{name}.ibw" for name in output_names
                        if f"{name}.ibw" in files]
         if exist_names:
             msg = "ibw file(s) already exists in destination ({}). " \
@@ -272,8 +320,55 @@ class App(tkdnd.Tk):
             if ans is False:
                 return
 
-        for job in self.jobs:
-            job.convert(path=self.dst_dir.get())
+        # session is saved after each job, so that conversion can be
+        # resumed even if the application stops
+        # (jobs become 'done' when their outputs are committed by writer)
+        session = JobSession(list(self.jobs), self.dst_dir.get())
+        failed_names: List[str] = []
+
+        def on_job_end(job: ConvertJob, error: Union[Exception, None]
+                       ) -> None:
+            if error is not None:
+                job.status = 'failed'
+                failed_names.append(job.output_name)
+                print(f"Failed: {job.output_name} ({error})")
+            session.save(SESSION_AUTOSAVE_PATH)
+
+        for job in jobs:
+            job.collect_statistics = self.__settings.statistics_flag
+            job.saturation_level = self.__settings.saturation_level(
+                job.selected_detector_name)
+
+        # sources are read ahead while other jobs are converted and written
+        # (outputs of sources with identical contents are reused)
+        catalog = OutputCatalog() if self.__settings.dedup_flag else None
+        try:
+            with self.__make_writer(self.dst_dir.get()) as writer:
+                pipeline = ConversionPipeline(
+                    writer, read_ahead=self.__settings.read_ahead,
+                    write_queue_size=self.__settings.write_queue_size,
+                    catalog=catalog)
+                pipeline.run(
+                    jobs, path=self.dst_dir.get(),
+                    steps_getter=lambda job: self.__settings
+                    .preprocessing_steps(job.selected_detector_name),
+                    on_job_end=on_job_end)
+        except Exception as error:  # failed to commit (or copy) outputs
+            for job in jobs:
+                if job.status == 'pending':
+                    job.status = 'failed'
+                    failed_names.append(job.output_name)
+            print(f"Failed: outputs were not written ({error})")
+        session.save(SESSION_AUTOSAVE_PATH)
+        if catalog is not None:
+            catalog.save()
+
+        if failed_names:
+            msg = "Error: Conversion failed ({}). Failed jobs can be " \
+                  "converted again with \"Resume conversion\".".format(
+                      ", ".join(failed_names))
+            showerror("Error", message=msg)
+            return
         showinfo("Information", message="Conversion completed.")
         print("Information: Conversion completed.")
 
@@ -281,31 +376,183 @@ class App(tkdnd.Tk):
         if self.__settings.clear_jobs_flag:
             self.clear_jobs()
 
+    def __make_writer(self, dst_dir: str) -> OutputWriter:
+        """returns writer of outputs
+        (outputs are staged in local directory and copied in background
+        when the destination is slow network file system)"""
+        mode = self.__settings.staging_mode
+        if mode == "always" or (mode == "auto" and is_network_path(dst_dir)):
+            return StagedOutputWriter(
+                staging_dir=self.__settings.staging_dir,
+                copy_workers=self.__settings.copy_workers,
+                fsync=self.__settings.fsync_flag)
+        return OutputWriter(
+            fsync=self.__settings.fsync_flag,
+            fsync_batch_size=self.__settings.fsync_batch_size)
+
+    def __ask_ibw_path(self, title: str) -> Tuple[str, str]:
+        """ask path of output ibw and returns it with (validated) wave
+        name ("" if canceled)"""
+        path = asksaveasfilename(
+            title=title, initialdir=self.dst_dir.get() or './',
+            filetypes=self.IBW_FILE_TYPES, defaultextension='.ibw')
+        if not path:
+            return "", ""
+        name = os.path.splitext(os.path.basename(path))[0]
+        name = IBWNameFormatter(self.jobs[0], self.__settings) \
+            .validate_name(name)
+        return path, name
+
+    def stitch_jobs(self) -> None:
+        """stitch selected detectors of all jobs (tiles) into waves
+        (one wave for each detector)"""
+        if not len(self.jobs):
+            showinfo("Information", message="No job to be stitched.")
+            return
+        path, name = self.__ask_ibw_path("Stitch tiles")
+        if not path:
+            return
+        try:
+            groups = group_jobs_by_detector(list(self.jobs))
+            paths = numbered_paths(path, len(groups))
+            stitchers = [TileStitcher.from_jobs(group) for group in groups]
+            with self.__make_writer(os.path.dirname(path)) as writer:
+                for idx, (stitcher, group_path) in enumerate(
+                        zip(stitchers, paths)):
+                    group_name = name if len(groups) == 1 \
+                        else f"{name}_{idx}"
+                    stitcher.save(group_path, group_name, writer)
+        except Exception as error:
+            showerror("Error", message=f"Error: Stitching failed ({error}).")
+            return
+        lines: List[str] = []
+        for group, stitcher, group_path in zip(groups, stitchers, paths):
+            lines.append(f"{os.path.basename(group_path)} "
+                         f"({group[0].selected_detector_name}):")
+            lines += stitcher.report.lines()
+        print("\n".join(lines))
+        showinfo("Information", message="\n".join(lines))
+
+    def stack_jobs(self) -> None:
+        """stack selected detectors of all jobs into time-series waves
+        (one wave for each group of jobs with the same geometry)"""
+        if not len(self.jobs):
+            showinfo("Information", message="No job to be stacked.")
+            return
+        path, name = self.__ask_ibw_path("Stack time series")
+        if not path:
+            return
+        try:
+            groups = group_jobs(list(self.jobs))
+            paths = numbered_paths(path, len(groups))
+            with self.__make_writer(os.path.dirname(path)) as writer:
+                for idx, (group, group_path) in enumerate(zip(groups, paths)):
+                    group_name = name if len(groups) == 1 \
+                        else f"{name}_{idx}"
+                    TimeSeriesStacker.from_jobs(group).save(
+                        group_path, group_name, writer)
+        except Exception as error:
+            showerror("Error", message=f"Error: Stacking failed ({error}).")
+            return
+        msg = "\n".join(f"{os.path.basename(group_path)}: "
+                        f"{len(group)} frame(s)"
+                        for group, group_path in zip(groups, paths))
+        showinfo("Information", message=msg)
+
+    def export_spectral_axes(self) -> None:
+        """save spectral axes of all jobs into destination directory
+        (each distinct axis is saved only once)"""
+        if not len(self.jobs):
+            showinfo("Information", message="No job to be exported.")
+            return
+        if not self.dst_dir.get():
+            showerror("Error", message="Error: Destination is not set.")
+            return
+        try:
+            export = SpectralAxisExport(
+                self.jobs, self.__settings.spectral_axis_export_units,
+                self.__settings, existing_names(self.dst_dir.get()))
+            with self.__make_writer(self.dst_dir.get()) as writer:
+                export.save(self.dst_dir.get(), writer)
+        except Exception as error:
+            showerror("Error", message=f"Error: Export failed ({error}).")
+            return
+        print("\n".join(export.lines()))
+        showinfo("Information",
+                 message=f"{len(export.axes)} axis wave(s) were saved for "
+                         f"{len(export.names)} job(s).")
+
+    def export_band_maps(self) -> None:
+        """save maps of expressions over bands (set in settings) of all
+        jobs into destination directory"""
+        band_maps = self.__settings.band_maps
+        jobs = [job for job in self.jobs
+                if job.selected_detector_name in band_maps]
+        if not jobs:
+            showinfo("Information",
+                     message="No job has band maps defined in settings.")
+            return
+        if not self.dst_dir.get():
+            showerror("Error", message="Error: Destination is not set.")
+            return
+        saved = 0
+        with self.__make_writer(self.dst_dir.get()) as writer:
+            for job in jobs:
+                try:
+                    generator = BandMapGenerator(
+                        job.smd_data, job.selected_detector,
+                        band_maps[job.selected_detector_name])
+                    saved += len(generator.save(
+                        self.dst_dir.get(), job.output_name, writer))
+                except Exception as error:
+                    print(f"Failed: {job.smd_name} ({error})")
+        showinfo("Information",
+                 message=f"{saved} map(s) were saved for {len(jobs)} "
+                         f"job(s).")
+
+    def save_session(self) -> None:
+        path = asksaveasfilename(
+            title="Save session", initialdir='./',
+            filetypes=self.SESSION_FILE_TYPES, defaultextension='.json')
+        if path:
+            JobSession(list(self.jobs), self.dst_dir.get()).save(path)
+            print(f"Saved: {path}")
+
+    def load_session(self) -> None:
+        path = askopenfilename(
+            title="Load session", initialdir='./',
+            filetypes=self.SESSION_FILE_TYPES)
+        if not path:
+            return
+        try:
+            session = JobSession.load(path, self.__header_cache)
+        except (OSError, ValueError, KeyError) as error:
+            showerror("Error", message=f"Error: Invalid session ({error}).")
+            return
+
+        self.clear_jobs()
+        self.jobs.extend(session.jobs)
+        self.dst_dir.set(session.dst_dir)
+        print(f"Information: Loaded {len(session.jobs)} job(s) "
+              f"({len(session.pending_jobs)} not completed) from {path}")
+        if session.jobs:
+            self.__update_widgets_on_open(
+                tuple(job.src_path for job in session.jobs))
+
     def handle_select_job(self, job: ConvertJob) -> None:
         self.opbutton_arr.enable('remove')
         self.outputopt_frame.update_target_job(job)
 
     def seek_job(self, direction: Direction) -> None:
-        cur_job_idx = self.jobs.index(self.job_list.selected_job)
-        last_job_idx = len(self.jobs) - 1
-
-        # loop index
-        if direction == 'Up':
-            seeked_idx = cur_job_idx - 1
-            seeked_idx = last_job_idx if seeked_idx == -1 else seeked_idx
-        elif direction == 'Down':
-            seeked_idx = cur_job_idx + 1
-            seeked_idx = 0 if seeked_idx == last_job_idx + 1 else seeked_idx
-        self.job_list.select_job(self.jobs[seeked_idx])
+        seeked_job = self.job_list.neighbor_job(
+            self.job_list.selected_job, direction)
+        self.job_list.select_job(seeked_job)
 
     def update_options(self) -> None:
-        # backup selection of JobList (because id changes)
+        # only the row of selected job is redrawn
         selected_job = self.job_list.selected_job
-
-        self.job_list.update_contents()
-
-        # restore selection
-        self.job_list.select_job(selected_job)
+        self.jobs.update_name(selected_job)
+        self.job_list.update_job(selected_job)
 
     def show_settings_window(self) -> None:
         self.setting_window = SettingsWindow(self, self.__settings)
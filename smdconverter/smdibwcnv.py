@@ -1,17 +1,23 @@
-from typing import Tuple
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Tuple, Union
 
-import ibwpy as ip
 import numpy as np
-from ibwpy import BinaryWave5
 
+from .datastats import DetectorStatistics
 from .notegen import IBWNoteGenerator
-from .smdparser import SimpledSMDParser, SpatialAxisName, SpectralUnit
+from .preprocess import SpectralPreprocessor
+from .smdparser import DTYPE, SimpledSMDParser, SpatialAxisName, SpectralUnit
+
+if TYPE_CHECKING:
+    from ibwpy import BinaryWave5
 
 
 class SimpledSMDIBWConverter:
     """Class for converting SMD file measurement data to IBW data
     """
     IBW_SPATIAL_AXIS: Tuple[SpatialAxisName, ...] = ('X', 'Y', 'Z')
+    CHUNK_SIZE = 64 * 1024 * 1024  # bytes of raw data in statistics pass
 
     def __init__(self, smd_data: SimpledSMDParser) -> None:
         self.__smd_data = smd_data
@@ -20,10 +26,29 @@ class SimpledSMDIBWConverter:
     def smd_data(self) -> SimpledSMDParser:
         return self.__smd_data
 
-    def make_body(self, name: str, detector_id: int) -> BinaryWave5:
-        """generate ibw of hyperspectral image data"""
-        arr = self.smd_data.detector_array(detector_id)
+    def make_body(
+            self, name: str, detector_id: int,
+            preprocessor: Union[SpectralPreprocessor, None] = None,
+            statistics: Union[DetectorStatistics, None] = None
+    ) -> BinaryWave5:
+        """generate ibw of hyperspectral image data
+        (preprocessor is applied to spectral data if specified).
+        If statistics is specified, statistics of raw and output data are
+        accumulated chunk by chunk (written in note).
+        """
+        raw = self.smd_data.detector_array(detector_id)
+        if preprocessor and preprocessor.steps:
+            # accumulated while preprocessed output is filled
+            arr = preprocessor.process(raw, statistics)
+        else:
+            # raw data is passed to ibw as a view (never copied), so
+            # statistics need their own pass over it
+            arr = raw
+            if statistics is not None:
+                self.__accumulate_statistics(raw, statistics)
         arr = self.__transpose_spatial_axis(arr)
+
+        import ibwpy as ip  # imported on first use (slow to import)
         ibw = ip.from_nparray(arr, name)
 
         # copy creation date from smd to ibw
@@ -36,9 +61,14 @@ class SimpledSMDIBWConverter:
         for i, axis in enumerate(self.IBW_SPATIAL_AXIS):
             ibw.set_axis_unit(i, spatial_units[axis])
             ibw.set_axis_scale(i, *spatial_scales[axis])
+        resampling = preprocessor.resampling if preprocessor else None
+        if resampling:  # spectral axis is uniform after resampling
+            ibw.set_axis_unit(3, resampling.unit)
+            ibw.set_axis_scale(3, *resampling.scale)
 
         # set note to ibw
-        ibw.set_note(self.__make_note(detector_id=detector_id))
+        ibw.set_note(self.__make_note(detector_id=detector_id,
+                                      statistics=statistics))
 
         return ibw
 
@@ -46,17 +76,24 @@ class SimpledSMDIBWConverter:
             self, name: str,
             detector_id: int, unit: SpectralUnit) -> BinaryWave5:
         """generate ibw of spectral axis data"""
-        arr = self.smd_data.spectral_axis(detector_id, unit)
+        # copied because cached axis is read-only
+        arr = np.array(self.smd_data.spectral_axis(detector_id, unit))
+
+        import ibwpy as ip  # imported on first use (slow to import)
         ibw = ip.from_nparray(arr, name)
 
         # ibw.set_data_unit(unit)
         return ibw
 
-    def __make_note(self, detector_id: int = None) -> str:
+    def __make_note(
+            self, detector_id: int = None,
+            statistics: Union[DetectorStatistics, None] = None) -> str:
         """generate note of ibw"""
         generator = IBWNoteGenerator(self.smd_data)
         if detector_id:
             generator.set_detector_id(detector_id)
+        if statistics is not None:
+            generator.set_statistics(statistics)
         note = generator.generate()
         return note
 
@@ -66,3 +103,13 @@ class SimpledSMDIBWConverter:
         while x, y, z in ibw file.
         """
         return np.transpose(src, (2, 1, 0, 3))
+
+    def __accumulate_statistics(self, raw: np.ndarray,
+                                statistics: DetectorStatistics) -> None:
+        """accumulate statistics of raw data (array[z][y][x][r], also the
+        output) over blocks of y-rows"""
+        size_z, size_y, size_x, size_r = raw.shape
+        rows = max(1, self.CHUNK_SIZE // (size_x * size_r * DTYPE().itemsize))
+        for z in range(size_z):
+            for y in range(0, size_y, rows):
+                statistics.update(raw[z, y:y + rows])
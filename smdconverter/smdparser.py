@@ -1,19 +1,35 @@
 from __future__ import annotations
 
 import datetime
-from typing import Dict, List, OrderedDict, Tuple
+import hashlib
+import itertools
+import mmap
+from typing import (TYPE_CHECKING, BinaryIO, Callable, Dict, Iterator, List,
+                    OrderedDict, Sequence, Tuple, Type, TypeVar, Union)
 
 import numpy as np
 import xmltodict
 from typing_extensions import Literal
 
+from .outputwriter import OutputWriter
+
+if TYPE_CHECKING:
+    from .chunkcache import ChunkCache
+    from .headercache import HeaderCache
+
 SpatialAxisName = Literal['Z', 'Y', 'X']
 SpectralUnit = Literal['nm', 'cm-1', 'GHz']
 
-SPECTRAL_UNITS = ('nm', 'cm-1', 'GHz')
+SPECTRAL_UNITS: Tuple[SpectralUnit, ...] = ('nm', 'cm-1', 'GHz')
 
 DTYPE = np.float32
 
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+SourceBuffer = Union[bytes, bytearray, mmap.mmap]  # supports find()
+ChunkSlices = Tuple[slice, ...]
+Coordinate = Tuple[int, int, int]  # (z, y, x)
+ParserType = TypeVar('ParserType', bound='SMDParser')
+
 
 class HeaderDict:
     """handle hierarchical structure of xml header"""
@@ -29,9 +45,18 @@ class HeaderDict:
 class SMDHeader(HeaderDict):
     """handle xml header of smd file"""
 
-    def __init__(self, header_buffer: bytes) -> None:
+    def __init__(self, header_buffer: bytes,
+                 data_dict: Union[OrderedDict, None] = None) -> None:
+        """
+        Args:
+            header_buffer (bytes): xml header
+            data_dict (Union[OrderedDict, None], optional): parsed header
+                (e.g. loaded from cache). Defaults to None (header_buffer
+                is parsed).
+        """
         self.__buffer = header_buffer
-        data_dict = xmltodict.parse(header_buffer)['SCANDATA']
+        if data_dict is None:
+            data_dict = xmltodict.parse(header_buffer)['SCANDATA']
         super().__init__(data_dict)
 
         frame_params = self.data['ScannedFrameParameters']
@@ -222,6 +247,7 @@ class ChannelInfo(HeaderDict):
 
     def __init__(self, data_dict: OrderedDict) -> None:
         super().__init__(data_dict)
+        self.__axis_array: Union[np.ndarray, None] = None
 
     @property
     def device_name(self) -> str:
@@ -241,8 +267,12 @@ class ChannelInfo(HeaderDict):
 
     @property
     def axis_array(self) -> np.ndarray:
-        array_str = self.data['ChannelAxisArray']
-        return np.fromstring(array_str, sep=" ", dtype=DTYPE)
+        """returns axis array (parsed only once, and read-only)"""
+        if self.__axis_array is None:
+            array_str = self.data['ChannelAxisArray']
+            self.__axis_array = np.fromstring(array_str, sep=" ", dtype=DTYPE)
+            self.__axis_array.setflags(write=False)
+        return self.__axis_array
 
     @property
     def informations(self) -> List[str]:
@@ -269,12 +299,55 @@ class SMDParser:
     not all data formats can be represented as NumPy array.
     """
 
-    def __init__(self, smd_buffer: bytes) -> None:
-        header_buf, body_buf = smd_buffer.split(self.XML_BORDER)
-        header_buf = header_buf + self.XML_BORDER
+    WRITE_CHUNK_SIZE = 64 * 1024 * 1024  # bytes written per call in write()
+    FINGERPRINT_CHUNK_SIZE = 16 * 1024 * 1024  # bytes hashed per call
+    FINGERPRINT_SIZE = 16  # bytes of digest
 
-        self.header = SMDHeader(header_buf)
-        self.__body_buffer = body_buf
+    def __init__(self, smd_buffer: SourceBuffer,
+                 header: Union[SMDHeader, None] = None) -> None:
+        """
+        Args:
+            smd_buffer (SourceBuffer): whole data of smd file
+            header (Union[SMDHeader, None], optional): header which is
+                already parsed. Defaults to None (parsed from smd_buffer).
+        """
+        if header is None:
+            # NOTE: slicing of memoryview does not copy the body
+            border_idx = smd_buffer.find(self.XML_BORDER)
+            if border_idx < 0:
+                raise ValueError("XML header is not found in smd data")
+            body_offset = border_idx + len(self.XML_BORDER)
+            header = SMDHeader(bytes(smd_buffer[:body_offset]))
+
+        self.header = header
+        self.__body_buffer: Buffer = \
+            memoryview(smd_buffer)[len(header.buffer):]
+        self.__fingerprint: Union[str, None] = None
+
+    @classmethod
+    def from_file(cls: Type[ParserType], path: str,
+                  header_cache: Union[HeaderCache, None] = None
+                  ) -> ParserType:
+        """open smd file with memory mapping
+        Spectral data is not read into memory until it is accessed.
+        If header_cache is specified, parsed header is loaded from
+        (or saved to) the cache.
+        """
+        with open(path, mode='rb') as f:
+            smd_buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if header_cache is None:
+            return cls(smd_buffer)
+
+        cached = header_cache.load(path)
+        if cached is not None:
+            header_size, data_dict = cached
+            header = SMDHeader(bytes(smd_buffer[:header_size]),
+                               OrderedDict(data_dict))
+            return cls(smd_buffer, header)
+
+        res = cls(smd_buffer)
+        header_cache.save(path, len(res.header.buffer), res.header.data)
+        return res
 
     @property
     def creation_datetime(self) -> datetime.datetime:
@@ -293,11 +366,36 @@ class SMDParser:
         return self.header.frame_options.central_wavelength
 
     @property
-    def body_buffer(self) -> bytes:
+    def body_buffer(self) -> Buffer:
         return self.__body_buffer
 
-    def set_body_buffer(self, buffer: bytes) -> SMDParser:
+    def set_body_buffer(self, buffer: Buffer) -> SMDParser:
         self.__body_buffer = buffer
+        self.__fingerprint = None
+        return self
+
+    def content_fingerprint(self) -> str:
+        """returns fingerprint of contents (hex digest of blake2b)
+        Hash of header and body are combined, and the body is hashed in
+        chunks directly from the (memory-mapped) buffer. It is computed only
+        once for each parser.
+        """
+        if self.__fingerprint is None:
+            header_hash = hashlib.blake2b(
+                self.header.buffer, digest_size=self.FINGERPRINT_SIZE)
+            body_hash = hashlib.blake2b(digest_size=self.FINGERPRINT_SIZE)
+            body = memoryview(self.body_buffer).cast('B')
+            for start in range(0, len(body), self.FINGERPRINT_CHUNK_SIZE):
+                body_hash.update(
+                    body[start:start + self.FINGERPRINT_CHUNK_SIZE])
+            self.__fingerprint = hashlib.blake2b(
+                header_hash.digest() + body_hash.digest(),
+                digest_size=self.FINGERPRINT_SIZE).hexdigest()
+        return self.__fingerprint
+
+    def set_content_fingerprint(self, fingerprint: str) -> SMDParser:
+        """set fingerprint computed before (e.g. loaded from cache)"""
+        self.__fingerprint = fingerprint
         return self
 
     @property
@@ -339,10 +437,17 @@ class SMDParser:
         detector = self.header.data_calibrations[detector_id]
         return detector.channels[channel_id].axis_array
 
+    def write(self, f: BinaryIO) -> None:
+        """write header and body into a file object without concatenating
+        them (body is written in chunks of WRITE_CHUNK_SIZE bytes)"""
+        f.write(self.header.buffer)
+        body = memoryview(self.body_buffer).cast('B')
+        for start in range(0, len(body), self.WRITE_CHUNK_SIZE):
+            f.write(body[start:start + self.WRITE_CHUNK_SIZE])
+
     def save(self, path: str) -> None:
-        buffer = self.header.buffer + self.body_buffer
         with open(path, mode='wb') as f:
-            f.write(buffer)
+            self.write(f)
         print(f"Saved: {path}")
 
 
@@ -362,14 +467,20 @@ class SimpledSMDParser(SMDParser):
     and r is index of spectral axis (concatenated).
     """
 
-    def __init__(self, smd_buffer: bytes) -> None:
-        super().__init__(smd_buffer)
+    def __init__(self, smd_buffer: SourceBuffer,
+                 header: Union[SMDHeader, None] = None) -> None:
+        super().__init__(smd_buffer, header)
         self.validate()
 
         self.__detectors = [
             data_calibration.channels[0]
             for data_calibration in self.header.data_calibrations]
         self.__full_array = self.unpack_full_array()
+        # (detector ID, unit, excitation wavelength) -> spectral axis
+        self.__spectral_axes: Dict[Tuple[int, str, float], np.ndarray] = {}
+        self.__chunk_cache: Union[ChunkCache, None] = None
+        # identifies data of this parser in (shared) chunk cache
+        self.__cache_token = object()
 
     def validate(self) -> None:
         """check if data has only one channel and series"""
@@ -416,16 +527,100 @@ class SimpledSMDParser(SMDParser):
     def change_values(self, array: np.ndarray) -> SimpledSMDParser:
         """setter of spectral data
         self.__full_array and self.__body_buffer will be changed.
+        Body buffer refers to memory of the array (not copied
+        when array is C-contiguous and its dtype is DTYPE).
         """
-        if array.shape != self.full_array_size:
-            raise ValueError(
-                "Shape of new array ({}) is different from original shape ({})"
-                .format(array.shape, self.full_array_size))
-        body_buf = array.tobytes(order='C')
-        self.set_body_buffer(body_buf)
+        self.__validate_shape(array.shape)
+        array = np.ascontiguousarray(array, dtype=DTYPE)
+        self.set_body_buffer(array.data.cast('B'))
         self.__full_array = array
+        self.__cache_token = object()  # cached chunks are outdated
+        return self
+
+    @property
+    def chunk_cache(self) -> Union[ChunkCache, None]:
+        return self.__chunk_cache
+
+    def set_chunk_cache(self, cache: Union[ChunkCache, None]
+                        ) -> SimpledSMDParser:
+        """set cache through which spectra are read by read_spectrum()
+        (None: read directly from body buffer)"""
+        self.__chunk_cache = cache
         return self
 
+    def __validate_shape(self, shape: Tuple[int, ...]) -> None:
+        """check if shape is the same as full array"""
+        if shape != self.full_array_size:
+            raise ValueError(
+                "Shape of new array ({}) is different from original shape ({})"
+                .format(shape, self.full_array_size))
+
+    def iter_chunks(self, chunk_shape: Tuple[int, ...]
+                    ) -> Iterator[Tuple[ChunkSlices, np.ndarray]]:
+        """iterate over spatial blocks of full array in C order
+
+        Args:
+            chunk_shape (Tuple[int, ...]): size of each block in (z, y, x).
+                Spectral axis is never split.
+
+        Yields:
+            Tuple[ChunkSlices, np.ndarray]: slices of the block in full array
+                and view of the block (not copied)
+        """
+        if len(chunk_shape) != len(self.spatial_size) \
+                or min(chunk_shape) < 1:
+            raise ValueError(f"got invalid chunk shape ({chunk_shape})")
+        starts = [range(0, size, step) for size, step
+                  in zip(self.spatial_size, chunk_shape)]
+        for start in itertools.product(*starts):
+            slices = tuple(slice(idx, idx + step)
+                           for idx, step in zip(start, chunk_shape))
+            yield slices, self.full_array[slices]
+
+    def apply(self, func: Callable[[np.ndarray], np.ndarray],
+              chunk_shape: Tuple[int, ...], path: str) -> None:
+        """save smd file whose spectral data is transformed with func.
+        Spectral data is transformed block by block and written to the
+        output file, so memory usage depends on chunk_shape
+        rather than the size of the whole array. Output is written into a
+        temporary file and renamed when it is complete, so path can be the
+        source file itself.
+
+        Args:
+            func (Callable[[np.ndarray], np.ndarray]): function which
+                receives a block of spectral data (array[z][y][x][r])
+                and returns the array of the same shape
+            chunk_shape (Tuple[int, ...]): size of each block in (z, y, x)
+            path (str): path of output smd file
+        """
+        header_buf = self.header.buffer
+        body_size = int(np.prod(self.full_array_size)) * DTYPE().itemsize
+
+        def save(tmp_path: str) -> None:
+            with open(tmp_path, mode='r+b') as f:
+                f.write(header_buf)
+                f.truncate(len(header_buf) + body_size)
+
+            dst = np.memmap(tmp_path, dtype=DTYPE, mode='r+',
+                            offset=len(header_buf),
+                            shape=self.full_array_size)
+            try:
+                for slices, chunk in self.iter_chunks(chunk_shape):
+                    res = func(chunk)
+                    if res.shape != chunk.shape:
+                        raise ValueError(
+                            "Shape of transformed chunk ({}) is different "
+                            "from original shape ({})".format(
+                                res.shape, chunk.shape))
+                    dst[slices] = res
+                dst.flush()
+            finally:
+                del dst  # unmap before the file is renamed (or removed)
+
+        # incomplete file is removed by writer if func raises an error
+        with OutputWriter() as writer:
+            writer.write_with(path, save, lambda: print(f"Saved: {path}"))
+
     def __validate_detector_id(self, detector_id: int) -> None:
         """check if detector_id is valid"""
         if not detector_id < self.detector_count:
@@ -441,19 +636,117 @@ class SimpledSMDParser(SMDParser):
 
         return self.full_array[:, :, :, start_idx:end_idx]
 
+    def detector_spectra(self, detector_id: int) -> np.ndarray:
+        """returns spectra of detector as 2-dimensional array
+        (array[pixel][r], pixels are in C order of z, y, x; not copied)"""
+        arr = self.detector_array(detector_id)
+        return arr.reshape(-1, arr.shape[-1])
+
     def detector_array_size(self, detector_id: int
                             ) -> Tuple[int, ...]:
         """returns size of spectral data
         from the detector specified with detector_id"""
         return self.spatial_size + (self.detector_sizes[detector_id],)
 
+    def __validate_coordinate(self, coordinate: Coordinate) -> None:
+        """check if coordinate (z, y, x) is in spatial size"""
+        if len(coordinate) != len(self.spatial_size) or not all(
+                0 <= idx < size
+                for idx, size in zip(coordinate, self.spatial_size)):
+            raise IndexError(f"coordinate {tuple(coordinate)} is out of "
+                             f"spatial size {self.spatial_size}")
+
+    def spectrum_offset(self, coordinate: Coordinate,
+                        detector_id: int) -> int:
+        """returns offset of spectrum at coordinate (z, y, x) of the
+        detector in body buffer (bytes)"""
+        self.__validate_coordinate(coordinate)
+        self.__validate_detector_id(detector_id)
+        z, y, x = coordinate
+        _, size_y, size_x, size_r = self.full_array_size
+        pixel_idx = (z * size_y + y) * size_x + x
+        start_idx = sum(self.detector_sizes[:detector_id])
+        return (pixel_idx * size_r + start_idx) * DTYPE().itemsize
+
+    def read_spectrum(self, coordinate: Coordinate,
+                      detector_id: int = 0) -> np.ndarray:
+        """returns spectrum at coordinate (z, y, x) of the detector
+        Only bytes of the spectrum are read from body buffer (copied, so
+        that the array does not refer to the memory-mapped file). If chunk
+        cache is set, the chunk of rows of the detector containing the pixel
+        is read through the cache instead.
+        """
+        offset = self.spectrum_offset(coordinate, detector_id)
+        if self.__chunk_cache is not None:
+            return self.__read_cached_spectrum(coordinate, detector_id)
+        return np.frombuffer(
+            self.body_buffer, dtype=DTYPE,
+            count=self.detector_sizes[detector_id], offset=offset).copy()
+
+    def __read_cached_spectrum(self, coordinate: Coordinate,
+                               detector_id: int) -> np.ndarray:
+        cache: ChunkCache = self.__chunk_cache  # type: ignore
+        z, y, x = coordinate
+        start_y = y - y % cache.rows_per_chunk
+        stop_y = start_y + cache.rows_per_chunk
+        chunk = cache.get(  # array[y][x][r] (only the detector)
+            (self.__cache_token, detector_id, z, start_y),
+            lambda: np.array(
+                self.detector_array(detector_id)[z, start_y:stop_y]))
+        return chunk[y - start_y, x].copy()
+
+    def read_spectra(self, coordinates: Sequence[Coordinate],
+                     detector_id: int = 0) -> np.ndarray:
+        """returns spectra at coordinates (z, y, x) of the detector
+        (array[point][r])"""
+        res = np.empty((len(coordinates), self.detector_sizes[detector_id]),
+                       dtype=DTYPE)
+        for idx, coordinate in enumerate(coordinates):
+            res[idx] = self.read_spectrum(coordinate, detector_id)
+        return res
+
+    @staticmethod
+    def line_coordinates(start: Coordinate,
+                         stop: Coordinate) -> List[Coordinate]:
+        """returns pixels on the line from start to stop (both included)"""
+        count = max(abs(b - a) for a, b in zip(start, stop)) + 1
+        points = np.rint(np.linspace(start, stop, count)).astype(int)
+        return [tuple(int(idx) for idx in point)  # type: ignore
+                for point in points]
+
+    def read_line(self, start: Coordinate, stop: Coordinate,
+                  detector_id: int = 0
+                  ) -> Tuple[List[Coordinate], np.ndarray]:
+        """returns pixels on the line from start to stop (z, y, x) and
+        their spectra (array[point][r])"""
+        coordinates = self.line_coordinates(start, stop)
+        return coordinates, self.read_spectra(coordinates, detector_id)
+
     def spectral_axis(
             self, detector_id: int, unit: SpectralUnit = 'nm') -> np.ndarray:
         """returns an array of spectral axis from specific detector
         with specific unit. unit defaults to 'nm'.
+        Axes are computed only once for each detector, unit and excitation
+        wavelength, and returned arrays are read-only (copy them to modify).
         """
         self.__validate_detector_id(detector_id)
 
+        key = (detector_id, unit, self.excite_nm)
+        res = self.__spectral_axes.get(key)
+        if res is None:
+            res = self.__compute_spectral_axis(detector_id, unit)
+            res.setflags(write=False)
+            self.__spectral_axes[key] = res
+        return res
+
+    def spectral_axes(self, detector_id: int
+                      ) -> Dict[SpectralUnit, np.ndarray]:
+        """returns spectral axes of specific detector in all units"""
+        return {unit: self.spectral_axis(detector_id, unit)
+                for unit in SPECTRAL_UNITS}
+
+    def __compute_spectral_axis(
+            self, detector_id: int, unit: SpectralUnit) -> np.ndarray:
         wlength = self.detectors[detector_id].axis_array
         if unit == 'nm':
             res = wlength
@@ -0,0 +1,240 @@
+"""
+Stacking of repeated acquisitions into one time-series wave
+
+Acquisitions of the same region (with the same spatial and spectral
+geometry) are grouped, sorted by acquisition time, and written frame by
+frame into one preallocated ibw file. Because ibw has up to 4 dimensions,
+frames are concatenated along the third (z) dimension:
+    array[x][y][z + t * size_z][r]
+(i.e. the third dimension is time itself when frames have a single z;
+otherwise it is an index without unit, and the layout is in the note).
+Acquisition time of each frame is saved in the note and as a separate wave
+of Igor dates (name of the wave + "_t").
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import os
+from typing import (TYPE_CHECKING, BinaryIO, Dict, Hashable, List, Sequence,
+                    Tuple, Union)
+
+import numpy as np
+
+from .ibwio import DATA_OFFSET, NAME_SIZE, IBWStream, encode_note, igor_time
+from .notegen import IBWNoteGenerator
+from .outputwriter import OutputWriter
+from .smdparser import DTYPE, SimpledSMDParser
+
+if TYPE_CHECKING:
+    from .convertjob import ConvertJob
+
+TIME_WAVE_SUFFIX = "_t"
+TIME_UNIT = "s"
+DATE_UNIT = "dat"  # unit of Igor dates
+
+
+def geometry_key(smd_data: SimpledSMDParser, detector_id: int) -> Hashable:
+    """returns key which is the same for acquisitions with the same spatial
+    and spectral geometry"""
+    spectral_axis = smd_data.spectral_axis(detector_id)
+    return (smd_data.spatial_size,
+            tuple(sorted(smd_data.spatial_scales.items())),
+            smd_data.detector_names[detector_id],
+            hashlib.sha1(spectral_axis.tobytes()).hexdigest())
+
+
+def group_by_geometry(frames: Sequence[SimpledSMDParser],
+                      detector_ids: Sequence[int]) -> List[List[int]]:
+    """group frames by geometry of detectors
+
+    Returns:
+        List[List[int]]: indices of frames in each group (sorted by
+            acquisition time)
+    """
+    groups: Dict[Hashable, List[int]] = {}
+    for idx, (frame, detector_id) in enumerate(zip(frames, detector_ids)):
+        groups.setdefault(geometry_key(frame, detector_id), []).append(idx)
+    return [sorted(group, key=lambda idx: frames[idx].creation_datetime)
+            for group in groups.values()]
+
+
+def group_jobs(jobs: Sequence[ConvertJob]) -> List[List[ConvertJob]]:
+    """group jobs by geometry of selected detectors (each group is sorted by
+    acquisition time)"""
+    groups = group_by_geometry([job.smd_data for job in jobs],
+                               [job.selected_detector for job in jobs])
+    return [[jobs[idx] for idx in group] for group in groups]
+
+
+def numbered_paths(path: str, count: int) -> List[str]:
+    """returns paths of outputs of groups (numbered if multiple groups)"""
+    if count == 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return [f"{root}_{idx}{ext}" for idx in range(count)]
+
+
+class TimeSeriesStacker:
+    """Class for stacking detector arrays of frames into one wave
+    """
+    CHUNK_SIZE = 64 * 1024 * 1024  # bytes of frame written at once
+
+    def __init__(self, frames: Sequence[SimpledSMDParser],
+                 detector_ids: Sequence[int],
+                 names: Union[Sequence[str], None] = None) -> None:
+        """
+        Args:
+            frames (Sequence[SimpledSMDParser]): smd data of frames
+            detector_ids (Sequence[int]): detector stacked in each frame
+            names (Union[Sequence[str], None], optional): names of frames
+                used in note. Defaults to None ("frame0", "frame1", ...).
+        """
+        if not frames:
+            raise ValueError("no frame is specified")
+        names = list(names) if names is not None \
+            else [f"frame{idx}" for idx in range(len(frames))]
+        keys = [geometry_key(frame, detector_id)
+                for frame, detector_id in zip(frames, detector_ids)]
+        for key, name in zip(keys, names):
+            if key != keys[0]:
+                raise ValueError(f"geometry of {name} is different from "
+                                 f"{names[0]}")
+
+        order = sorted(range(len(frames)),
+                       key=lambda idx: frames[idx].creation_datetime)
+        self.__frames = [frames[idx] for idx in order]
+        self.__detector_ids = [detector_ids[idx] for idx in order]
+        self.__names = [names[idx] for idx in order]
+
+    @classmethod
+    def from_jobs(cls, jobs: Sequence[ConvertJob]) -> TimeSeriesStacker:
+        """stack selected detectors of jobs"""
+        return cls([job.smd_data for job in jobs],
+                   [job.selected_detector for job in jobs],
+                   [job.smd_name for job in jobs])
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.__frames)
+
+    @property
+    def times(self) -> List[datetime.datetime]:
+        """returns acquisition time of frames (sorted)"""
+        return [frame.creation_datetime for frame in self.__frames]
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """returns size of stacked wave (x, y, z * frames, r)"""
+        size_z, size_y, size_x, size_r = \
+            self.__frames[0].detector_array_size(self.__detector_ids[0])
+        return (size_x, size_y, size_z * self.frame_count, size_r)
+
+    def elapsed_seconds(self) -> np.ndarray:
+        """returns seconds from the first frame"""
+        start = self.times[0]
+        return np.array([(time - start).total_seconds()
+                         for time in self.times])
+
+    def make_note(self) -> str:
+        """note of stacked wave (information of the first frame and
+        acquisition time of each frame)"""
+        generator = IBWNoteGenerator(self.__frames[0])
+        generator.set_detector_id(self.__detector_ids[0])
+        rows = [IBWNoteGenerator.ITEM_LV1_FMT.format(
+                    name, "{} (+{:g} s)".format(
+                        time.strftime(IBWNoteGenerator.DATETIME_FMT), elapsed))
+                for name, time, elapsed in zip(
+                    self.__names, self.times, self.elapsed_seconds())]
+        size_z = self.__frames[0].spatial_size[0]
+        if size_z > 1:  # third dimension mixes z and frames
+            rows.insert(0, IBWNoteGenerator.ITEM_LV1_FMT.format(
+                "Layout", f"z + frame * {size_z} ({size_z} z per frame)"))
+        return generator.generate() + "\n" \
+            + IBWNoteGenerator.HEADING_FMT.format("Frames") + "".join(rows)
+
+    def file_size(self) -> int:
+        """returns size of output ibw file (stacked wave) in bytes"""
+        return DATA_OFFSET + int(np.prod(self.shape)) * DTYPE().itemsize \
+            + len(encode_note(self.make_note()))
+
+    def __scales(self) -> Tuple[List[Tuple[float, float]], List[str]]:
+        """returns scales and units of x, y, z (or time), and r"""
+        first = self.__frames[0]
+        scales = [first.spatial_scales[axis] for axis in ('X', 'Y', 'Z')]
+        units = [first.spatial_units[axis] for axis in ('X', 'Y', 'Z')]
+        duration = float(self.elapsed_seconds()[-1])
+        if first.spatial_size[0] > 1:
+            # third dimension is index of z and frames (layout is in note)
+            scales[2] = (0.0, 1.0)
+            units[2] = ""
+        elif duration > 0:
+            # third dimension is time (mean interval of frames)
+            scales[2] = (0.0, duration / (self.frame_count - 1))
+            units[2] = TIME_UNIT
+        return scales, units
+
+    def write(self, f: BinaryIO, name: str) -> None:
+        """write stacked wave into a file opened for writing"""
+        scales, units = self.__scales()
+        with IBWStream(f, self.shape, name, dtype=DTYPE, scales=scales,
+                       units=units, note=self.make_note(),
+                       creation_time=self.times[0]) as stream:
+            dst = stream.data  # array[x][y][z + t * size_z][r]
+            for idx in range(self.frame_count):
+                self.__write_frame(dst, idx)
+
+    def __write_frame(self, dst: np.ndarray, idx: int) -> None:
+        src = self.__frames[idx].detector_array(self.__detector_ids[idx])
+        size_z, size_y, size_x, size_r = src.shape
+        rows = max(1, self.CHUNK_SIZE // (size_x * size_r * DTYPE().itemsize))
+        for z in range(size_z):
+            for y in range(0, size_y, rows):
+                block = src[z, y:y + rows]  # array[y][x][r]
+                dst[:, y:y + block.shape[0], z + idx * size_z, :] = \
+                    np.transpose(block, (1, 0, 2))
+
+    def write_times(self, f: BinaryIO, name: str) -> None:
+        """write acquisition times (Igor dates) into a file opened for
+        writing"""
+        with IBWStream(f, (self.frame_count,), name, dtype=np.float64,
+                       data_unit=DATE_UNIT,
+                       creation_time=self.times[0]) as stream:
+            stream.data[:] = [igor_time(time) for time in self.times]
+
+    def save(self, path: str, name: Union[str, None] = None,
+             writer: Union[OutputWriter, None] = None) -> None:
+        """save stacked wave and wave of acquisition times into ibw files
+        atomically (times are saved as name + "_t")
+
+        Args:
+            path (str): path of output ibw file
+            name (Union[str, None], optional): name of wave. Defaults to
+                None (name of output file).
+            writer (Union[OutputWriter, None], optional): writer of output.
+                Defaults to None (outputs are committed immediately).
+        """
+        if name is None:
+            name = os.path.splitext(os.path.basename(path))[0]
+        max_length = NAME_SIZE - 1 - len(TIME_WAVE_SUFFIX)
+        time_name = name[:max_length] + TIME_WAVE_SUFFIX
+        time_path = os.path.join(os.path.dirname(path), f"{time_name}.ibw")
+        time_size = DATA_OFFSET + self.frame_count * 8
+
+        def on_commit(saved_path: str) -> None:
+            print(f"Saved: {saved_path}")
+
+        def save_with(writer: OutputWriter) -> None:
+            with writer.open(path, self.file_size(),
+                             lambda: on_commit(path)) as f:
+                self.write(f, name)
+            with writer.open(time_path, time_size,
+                             lambda: on_commit(time_path)) as f:
+                self.write_times(f, time_name)
+
+        if writer is None:
+            with OutputWriter() as writer:
+                save_with(writer)
+        else:
+            save_with(writer)
@@ -0,0 +1,268 @@
+"""
+Stitching of tiled acquisitions into one wave
+
+Large areas are acquired as tiles saved in separate smd files. Position of
+each tile is found from stage counts (AxisCountStart) in the headers, and
+detector arrays of tiles are written block by block into one preallocated
+ibw file, so that tiles are never held in memory at once. Pixels covered by
+no tile are filled with NaN, and where tiles overlap, tiles acquired later
+overwrite earlier ones.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import (TYPE_CHECKING, BinaryIO, Dict, List, Sequence, Tuple,
+                    Union)
+
+import numpy as np
+
+from .ibwio import DATA_OFFSET, IBWStream, encode_note
+from .notegen import IBWNoteGenerator
+from .outputwriter import OutputWriter
+from .smdparser import DTYPE, SimpledSMDParser, SpatialAxisName
+
+if TYPE_CHECKING:
+    from .convertjob import ConvertJob
+
+SPATIAL_AXES: Tuple[SpatialAxisName, ...] = ('Z', 'Y', 'X')
+IBW_AXIS_ORDER = (2, 1, 0, 3)  # array[z][y][x][r] -> array[x][y][z][r]
+
+
+def group_jobs_by_detector(jobs: Sequence[ConvertJob]
+                           ) -> List[List[ConvertJob]]:
+    """group jobs (tiles) by name of selected detector, so that jobs of
+    different detectors of the same smd file are never placed on the same
+    pixels (order of jobs is kept)"""
+    groups: Dict[str, List[ConvertJob]] = {}
+    for job in jobs:
+        groups.setdefault(job.selected_detector_name, []).append(job)
+    return list(groups.values())
+
+
+class StitchReport:
+    """Report of layout of tiles (gaps, overlaps and misaligned tiles)
+    """
+
+    def __init__(self) -> None:
+        self.shape: Tuple[int, ...] = ()
+        self.gap_pixels = 0
+        self.overlap_pixels = 0
+        self.overlaps: List[Tuple[str, str]] = []  # pairs of tile names
+        self.misaligned: List[str] = []
+        self.warnings: List[str] = []
+
+    def lines(self) -> List[str]:
+        res = [f"Stitched size (z, y, x, r): {self.shape}",
+               f"Gaps: {self.gap_pixels} pixel(s) (filled with NaN)",
+               f"Overlaps: {self.overlap_pixels} pixel(s)"]
+        res += [f"  {first} and {second}" for first, second in self.overlaps]
+        if self.misaligned:
+            res.append("Tiles not aligned to pixel grid (rounded): "
+                       + ", ".join(self.misaligned))
+        res += [f"Warning: {warning}" for warning in self.warnings]
+        return res
+
+    def print_summary(self) -> None:
+        print("\n".join(self.lines()))
+
+
+class TileStitcher:
+    """Class for placing detector arrays of tiles into one wave
+    """
+    CHUNK_SIZE = 64 * 1024 * 1024  # bytes of tile written at once
+
+    def __init__(self, tiles: Sequence[SimpledSMDParser],
+                 detector_ids: Sequence[int],
+                 names: Union[Sequence[str], None] = None) -> None:
+        """
+        Args:
+            tiles (Sequence[SimpledSMDParser]): smd data of tiles
+            detector_ids (Sequence[int]): detector stitched in each tile
+            names (Union[Sequence[str], None], optional): names of tiles used
+                in report and note. Defaults to None ("tile0", "tile1", ...).
+        """
+        if not tiles:
+            raise ValueError("no tile is specified")
+        self.__tiles = list(tiles)
+        self.__detector_ids = list(detector_ids)
+        self.__names = list(names) if names is not None \
+            else [f"tile{idx}" for idx in range(len(tiles))]
+        self.__report = StitchReport()
+        self.__validate()
+        self.__offsets, self.__shape, self.__coverage = self.__layout()
+
+    @classmethod
+    def from_jobs(cls, jobs: Sequence[ConvertJob]) -> TileStitcher:
+        """stitch selected detectors of jobs"""
+        return cls([job.smd_data for job in jobs],
+                   [job.selected_detector for job in jobs],
+                   [job.smd_name for job in jobs])
+
+    @property
+    def report(self) -> StitchReport:
+        return self.__report
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """returns size of stitched array (z, y, x, r)"""
+        return self.__shape
+
+    @property
+    def offsets(self) -> List[Tuple[int, ...]]:
+        """returns position of each tile in stitched array (z, y, x)"""
+        return self.__offsets
+
+    def __validate(self) -> None:
+        first, first_id = self.__tiles[0], self.__detector_ids[0]
+        first_axes = first.header.stage_parameters.axes
+        for tile, detector_id, name in zip(
+                self.__tiles, self.__detector_ids, self.__names):
+            if tile.detector_sizes[detector_id] \
+                    != first.detector_sizes[first_id]:
+                raise ValueError(f"spectral size of {name} is different "
+                                 f"from {self.__names[0]}")
+            axes = tile.header.stage_parameters.axes
+            for axis in SPATIAL_AXES:
+                if axes[axis].step_count != first_axes[axis].step_count \
+                        or axes[axis].scale != first_axes[axis].scale:
+                    raise ValueError(f"step of {axis}-axis of {name} is "
+                                     f"different from {self.__names[0]}")
+            if not np.allclose(tile.spectral_axis(detector_id),
+                               first.spectral_axis(first_id)):
+                raise ValueError(f"spectral axis of {name} is different "
+                                 f"from {self.__names[0]}")
+
+    def __layout(self) -> Tuple[List[Tuple[int, ...]], Tuple[int, ...],
+                                np.ndarray]:
+        """find positions of tiles and count tiles covering each pixel"""
+        axes_list = [tile.header.stage_parameters.axes
+                     for tile in self.__tiles]
+        base = [min(axes[axis].start_count for axes in axes_list)
+                for axis in SPATIAL_AXES]
+        offsets: List[Tuple[int, ...]] = []
+        for axes, name in zip(axes_list, self.__names):
+            offset: List[int] = []
+            for axis, base_count in zip(SPATIAL_AXES, base):
+                if axes[axis].step_count == 0:  # axis is not scanned
+                    if axes[axis].start_count != base_count:
+                        self.__report.warnings.append(
+                            f"{axis}-axis is not scanned but position of "
+                            f"{name} is different (placed at the same "
+                            f"position)")
+                    offset.append(0)
+                    continue
+                steps = (axes[axis].start_count - base_count) \
+                    / axes[axis].step_count
+                if steps != round(steps) and name not in \
+                        self.__report.misaligned:
+                    self.__report.misaligned.append(name)
+                offset.append(int(round(steps)))
+            offsets.append(tuple(offset))
+
+        spatial_shape = tuple(
+            max(offset[dim] + tile.spatial_size[dim]
+                for offset, tile in zip(offsets, self.__tiles))
+            for dim in range(len(SPATIAL_AXES)))
+        shape = spatial_shape \
+            + (self.__tiles[0].detector_sizes[self.__detector_ids[0]],)
+
+        coverage = np.zeros(spatial_shape, dtype=np.uint16)
+        boxes = []
+        for tile_offset, tile in zip(offsets, self.__tiles):
+            box = tuple(slice(start, start + size)
+                        for start, size in zip(tile_offset, tile.spatial_size))
+            coverage[box] += 1
+            boxes.append(box)
+        for i, box in enumerate(boxes):
+            for j in range(i + 1, len(boxes)):
+                if all(a.start < b.stop and b.start < a.stop
+                       for a, b in zip(box, boxes[j])):
+                    self.__report.overlaps.append(
+                        (self.__names[i], self.__names[j]))
+
+        self.__report.shape = shape
+        self.__report.gap_pixels = int(np.count_nonzero(coverage == 0))
+        self.__report.overlap_pixels = int(np.count_nonzero(coverage > 1))
+        return offsets, shape, coverage
+
+    def make_note(self) -> str:
+        """note of stitched wave (information of the first tile and
+        position of each tile)"""
+        generator = IBWNoteGenerator(self.__tiles[0])
+        generator.set_detector_id(self.__detector_ids[0])
+        rows = [IBWNoteGenerator.ITEM_LV1_FMT.format(
+                    name, "(x, y, z) = ({2}, {1}, {0})".format(*offset))
+                for name, offset in zip(self.__names, self.__offsets)]
+        return generator.generate() + "\n" \
+            + IBWNoteGenerator.HEADING_FMT.format("Tiles") + "".join(rows)
+
+    def file_size(self) -> int:
+        """returns size of output ibw file in bytes"""
+        return DATA_OFFSET + int(np.prod(self.__shape)) * DTYPE().itemsize \
+            + len(encode_note(self.make_note()))
+
+    def write(self, f: BinaryIO, name: str) -> None:
+        """write stitched wave into a file opened for writing"""
+        first = self.__tiles[0]
+        base = [min(tile.header.stage_parameters.axes[axis].start_count
+                    for tile in self.__tiles) for axis in SPATIAL_AXES]
+        scales = []
+        units = []
+        for axis, base_count in zip(reversed(SPATIAL_AXES), reversed(base)):
+            info = first.header.stage_parameters.axes[axis]
+            scales.append((info.scale * base_count, info.step_length))
+            units.append(info.unit)
+        order = sorted(range(len(self.__tiles)),
+                       key=lambda idx: self.__tiles[idx].creation_datetime)
+
+        with IBWStream(
+                f, tuple(self.__shape[dim] for dim in IBW_AXIS_ORDER), name,
+                dtype=DTYPE, scales=scales, units=units,
+                note=self.make_note(),
+                creation_time=self.__tiles[order[0]].creation_datetime
+        ) as stream:
+            dst = stream.data  # array[x][y][z][r]
+            for z in range(self.__shape[0]):
+                ys, xs = np.nonzero(self.__coverage[z] == 0)
+                if ys.size:
+                    dst[xs, ys, z, :] = np.nan
+            for idx in order:  # tiles acquired later overwrite others
+                self.__write_tile(dst, idx)
+
+    def __write_tile(self, dst: np.ndarray, idx: int) -> None:
+        src = self.__tiles[idx].detector_array(self.__detector_ids[idx])
+        size_z, size_y, size_x, size_r = src.shape
+        off_z, off_y, off_x = self.__offsets[idx]
+        rows = max(1, self.CHUNK_SIZE // (size_x * size_r * DTYPE().itemsize))
+        for z in range(size_z):
+            for y in range(0, size_y, rows):
+                block = src[z, y:y + rows]  # array[y][x][r]
+                dst[off_x:off_x + size_x,
+                    off_y + y:off_y + y + block.shape[0],
+                    off_z + z, :] = np.transpose(block, (1, 0, 2))
+
+    def save(self, path: str, name: Union[str, None] = None,
+             writer: Union[OutputWriter, None] = None) -> None:
+        """save stitched wave into ibw file atomically
+
+        Args:
+            path (str): path of output ibw file
+            name (Union[str, None], optional): name of wave. Defaults to
+                None (name of output file).
+            writer (Union[OutputWriter, None], optional): writer of output.
+                Defaults to None (output is committed immediately).
+        """
+        if name is None:
+            name = os.path.splitext(os.path.basename(path))[0]
+
+        def on_commit() -> None:
+            print(f"Saved: {path}")
+
+        if writer is None:
+            with OutputWriter() as writer:
+                with writer.open(path, self.file_size(), on_commit) as f:
+                    self.write(f, name)
+        else:
+            with writer.open(path, self.file_size(), on_commit) as f:
+                self.write(f, name)
@@ -0,0 +1,94 @@
+"""
+Verification of ibw outputs against their smd sources
+
+Outputs are checked with checksums recorded when they were written, and
+their data are compared with the detector block of the source (transposed
+in the same way as conversion). Both files are memory-mapped and compared
+block by block, so that memory usage does not depend on the file size.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Union
+
+import numpy as np
+
+from .ibwio import IBWHeader, open_data
+from .outputwriter import file_checksum
+from .preprocess import SpectralPreprocessor
+from .smdparser import DTYPE, SimpledSMDParser
+
+CHUNK_SIZE = 64 * 1024 * 1024  # bytes of source compared at once
+RTOL = 1e-5  # tolerances used when outputs are preprocessed
+ATOL = 1e-6
+
+
+def verify_output(smd_data: SimpledSMDParser, detector_id: int,
+                  ibw_path: str, checksum: Union[str, None] = None,
+                  preprocessor: Union[SpectralPreprocessor, None] = None,
+                  check_data: bool = True) -> List[str]:
+    """compare ibw output with the detector block of smd source
+
+    Args:
+        smd_data (SimpledSMDParser): source smd data
+        detector_id (int): index of converted detector
+        ibw_path (str): path of output ibw file
+        checksum (Union[str, None], optional): sha256 of output recorded
+            when it was written. Defaults to None (not checked).
+        preprocessor (Union[SpectralPreprocessor, None], optional):
+            preprocessor applied in conversion. Defaults to None.
+        check_data (bool, optional): whether to compare data (only checksum
+            is checked if False). Defaults to True.
+
+    Returns:
+        List[str]: problems found (empty if output matches source)
+    """
+    if not os.path.isfile(ibw_path):
+        return ["output does not exist"]
+    problems: List[str] = []
+    if checksum is not None and file_checksum(ibw_path) != checksum:
+        problems.append("checksum is different from the recorded one")
+    if not check_data:
+        return problems
+
+    header = IBWHeader.read(ibw_path)
+    src = smd_data.detector_array(detector_id)  # array[z][y][x][r]
+    size_z, size_y, size_x, size_r = src.shape
+    out_r = preprocessor.output_size(size_r) if preprocessor else size_r
+    expected_shape = (size_x, size_y, size_z, out_r)
+    if header.shape != expected_shape:
+        problems.append(f"shape of wave {header.shape} is different from "
+                        f"source {expected_shape}")
+        return problems
+
+    dst = open_data(ibw_path)  # array[x][y][z][r]
+    rows = max(1, CHUNK_SIZE // (size_x * size_r * DTYPE().itemsize))
+    mismatches = 0
+    max_diff = 0.0
+    for z in range(size_z):
+        for y in range(0, size_y, rows):
+            block = src[z, y:y + rows]  # array[y][x][r]
+            if preprocessor:
+                block = preprocessor.process_chunk(
+                    block.reshape(-1, size_r)
+                ).reshape(block.shape[:-1] + (out_r,))
+            expected = np.transpose(block, (1, 0, 2))
+            actual = dst[:, y:y + rows, z, :]
+            if preprocessor:
+                same = np.isclose(actual, expected, rtol=RTOL, atol=ATOL,
+                                  equal_nan=True)
+            else:
+                same = (actual == expected) \
+                    | (np.isnan(actual) & np.isnan(expected))
+            count = same.size - np.count_nonzero(same)
+            if count:
+                mismatches += count
+                diff = np.abs(actual.astype(np.float64) - expected)
+                max_diff = max(max_diff, float(np.nanmax(diff[~same])))
+    del dst
+
+    if mismatches:
+        problems.append(f"{mismatches} value(s) are different from source "
+                        f"(max difference: {max_diff:.4g})")
+    return problems
@@ -0,0 +1,292 @@
+import base64
+import math
+import threading
+import tkinter as tk
+from tkinter import ttk
+from typing import Dict, List, Union, cast
+
+import numpy as np
+
+from .appsettings import ApplicationSettings
+from .chunkcache import ChunkCache
+from .constants import PADDING_OPTIONS
+from .convertjob import ConvertJob
+from .preview import PreviewCache, PreviewMaps, encode_png, make_thumbnail
+from .smdparser import (SPECTRAL_UNITS, Coordinate, SimpledSMDParser,
+                        SpectralUnit)
+
+
+class _SharedChunkCache:
+    """Chunk cache set to smd data while viewers of the data are open"""
+
+    def __init__(self, cache: ChunkCache,
+                 previous: Union[ChunkCache, None]) -> None:
+        self.cache = cache
+        self.previous = previous  # cache set before viewers were opened
+        self.viewers = 0
+
+
+class SpectrumViewerWindow(tk.Toplevel):
+    """Window to display intensity map of a job and spectrum of the pixel
+    clicked on the map
+    Intensity maps are computed (or loaded from preview cache) in a
+    background thread, and spectra are read on demand through chunk cache,
+    so that spectral data is never loaded at once.
+    """
+    MAP_SIZE = 320  # small maps are enlarged to this size (pixels)
+    MAX_MAP_SIZE = 640  # large maps are reduced within this size (pixels)
+    PLOT_WIDTH = 480
+    PLOT_HEIGHT = 320
+    PLOT_MARGIN = 50
+    POLL_INTERVAL = 50  # ms
+    ROWS_PER_CHUNK = 1  # clicked pixels are scattered (less read per miss)
+
+    # chunk caches shared by viewers of the same smd data (key: id of data)
+    __shared_caches: Dict[int, _SharedChunkCache] = {}
+    MARKER_COLOR = 'red'
+    LINE_COLOR = 'blue'
+
+    def __init__(self, master: tk.Misc, job: ConvertJob,
+                 settings: ApplicationSettings, *args, **kwargs) -> None:
+        kwargs['master'] = master
+        super().__init__(*args, **kwargs)
+
+        self.title(f"Viewer: {job.smd_name}")
+        self.resizable(False, False)
+        self.bind('<Escape>', lambda event: self.destroy())
+
+        # variables
+        self.__job = job
+        self.__smd_data = job.smd_data
+        self.__bands = settings.preview_bands
+        self.__cache: Union[ChunkCache, None] = \
+            self.__acquire_cache(self.__smd_data, settings)
+        self.__previews: Union[List[PreviewMaps], None] = None
+        self.__preview_error: Union[Exception, None] = None
+        self.__image: Union[tk.PhotoImage, None] = None  # keep reference
+        self.__pixel: Union[Coordinate, None] = None
+
+        size_z, size_y, size_x = self.__smd_data.spatial_size
+        longest = max(size_y, size_x)
+        self.__zoom = max(1, self.MAP_SIZE // longest)
+        self.__subsample = math.ceil(longest / self.MAX_MAP_SIZE) \
+            if longest > self.MAX_MAP_SIZE else 1
+
+        self.detector_names = [
+            f"{name} ({id_})" for id_, name
+            in enumerate(self.__smd_data.detector_names)]
+        self.detector = tk.StringVar(
+            value=self.detector_names[job.selected_detector])
+        self.unit = tk.StringVar(value=SPECTRAL_UNITS[0])
+        self.z_idx = tk.IntVar(value=0)
+        self.status = tk.StringVar(value="Click a pixel to show spectrum.")
+
+        self.__create_widgets()
+        self.__start_preview()
+        self.focus()
+
+    @classmethod
+    def __acquire_cache(cls, smd_data: SimpledSMDParser,
+                        settings: ApplicationSettings) -> ChunkCache:
+        """set chunk cache to smd data (shared with other viewers of the
+        same data) and returns it"""
+        shared = cls.__shared_caches.get(id(smd_data))
+        if shared is None:
+            shared = _SharedChunkCache(
+                ChunkCache(settings.read_cache_bytes,
+                           min(settings.read_cache_rows,
+                               cls.ROWS_PER_CHUNK)),
+                smd_data.chunk_cache)
+            cls.__shared_caches[id(smd_data)] = shared
+            smd_data.set_chunk_cache(shared.cache)
+        shared.viewers += 1
+        return shared.cache
+
+    @classmethod
+    def __release_cache(cls, smd_data: SimpledSMDParser) -> None:
+        """restore chunk cache of smd data when the last viewer of the data
+        is closed"""
+        shared = cls.__shared_caches[id(smd_data)]
+        shared.viewers -= 1
+        if shared.viewers:
+            return
+        del cls.__shared_caches[id(smd_data)]
+        if smd_data.chunk_cache is shared.cache:  # not replaced by others
+            smd_data.set_chunk_cache(shared.previous)
+
+    @property
+    def detector_id(self) -> int:
+        return self.detector_names.index(self.detector.get())
+
+    def __create_widgets(self) -> None:
+        options = ttk.Frame(self)
+        options.grid(column=0, row=0, columnspan=2, sticky=tk.W)
+        ttk.Label(options, text="Detector:").pack(
+            side=tk.LEFT, **PADDING_OPTIONS)
+        detector_box = ttk.Combobox(
+            options, textvariable=self.detector, values=self.detector_names,
+            state='readonly')
+        detector_box.pack(side=tk.LEFT, **PADDING_OPTIONS)
+        detector_box.bind('<<ComboboxSelected>>',
+                          lambda event: self.__redraw())
+        ttk.Label(options, text="Unit:").pack(side=tk.LEFT, **PADDING_OPTIONS)
+        unit_box = ttk.Combobox(
+            options, textvariable=self.unit, values=SPECTRAL_UNITS,
+            state='readonly', width=6)
+        unit_box.pack(side=tk.LEFT, **PADDING_OPTIONS)
+        unit_box.bind('<<ComboboxSelected>>',
+                      lambda event: self.__draw_spectrum())
+        ttk.Label(options, text="Z:").pack(side=tk.LEFT, **PADDING_OPTIONS)
+        z_box = tk.Spinbox(
+            options, from_=0, to=self.__smd_data.spatial_size[0] - 1,
+            textvariable=self.z_idx, width=5, state='readonly',
+            command=self.__redraw)
+        z_box.pack(side=tk.LEFT, **PADDING_OPTIONS)
+
+        _, size_y, size_x = self.__smd_data.spatial_size
+        self.map_canvas = tk.Canvas(
+            self, width=self.__to_canvas(size_x),
+            height=self.__to_canvas(size_y), highlightthickness=0)
+        self.map_canvas.grid(column=0, row=1, **PADDING_OPTIONS)
+        self.map_canvas.bind('<Button-1>', self.__handle_map_click)
+        self.map_canvas.create_text(
+            self.__to_canvas(size_x) // 2, self.__to_canvas(size_y) // 2,
+            text="Computing\nintensity map...", justify=tk.CENTER)
+
+        self.plot_canvas = tk.Canvas(
+            self, width=self.PLOT_WIDTH, height=self.PLOT_HEIGHT,
+            background='white', highlightthickness=0)
+        self.plot_canvas.grid(column=1, row=1, **PADDING_OPTIONS)
+
+        ttk.Label(self, textvariable=self.status).grid(
+            column=0, row=2, columnspan=2, sticky=tk.W, **PADDING_OPTIONS)
+
+    def __to_canvas(self, pixel: int) -> int:
+        """convert index of pixel into position on map canvas"""
+        return pixel * self.__zoom // self.__subsample
+
+    def __to_pixel(self, position: int) -> int:
+        """convert position on map canvas into index of pixel"""
+        return position * self.__subsample // self.__zoom
+
+    def __start_preview(self) -> None:
+        """compute (or load) intensity maps of all detectors in background
+        """
+        def generate() -> None:
+            try:
+                _, self.__previews = PreviewCache().get(
+                    self.__smd_data, self.__job.src_path, self.__bands)
+            except Exception as error:
+                self.__preview_error = error
+
+        self.__preview_thread = threading.Thread(target=generate, daemon=True)
+        self.__preview_thread.start()
+        self.after(self.POLL_INTERVAL, self.__poll_preview)
+
+    def __poll_preview(self) -> None:
+        if not self.winfo_exists():
+            return
+        if self.__preview_thread.is_alive():
+            self.after(self.POLL_INTERVAL, self.__poll_preview)
+            return
+        if self.__preview_error is not None:
+            self.status.set(f"Error: Intensity map is not available "
+                            f"({self.__preview_error})")
+        self.__draw_map()
+
+    def __redraw(self) -> None:
+        self.__draw_map()
+        if self.__pixel is not None:
+            _, y, x = self.__pixel
+            self.__pixel = (self.z_idx.get(), y, x)
+        self.__draw_spectrum()
+
+    def __draw_map(self) -> None:
+        if self.__previews is None:
+            return
+        intensity = self.__previews[self.detector_id]['intensity']
+        image = make_thumbnail(intensity[self.z_idx.get()],
+                               size=self.MAP_SIZE)
+        self.__image = tk.PhotoImage(
+            data=base64.b64encode(encode_png(image)))
+        if self.__subsample > 1:
+            self.__image = self.__image.subsample(self.__subsample)
+        self.map_canvas.delete('all')
+        self.map_canvas.create_image(0, 0, image=self.__image, anchor=tk.NW)
+        self.__draw_marker()
+
+    def __draw_marker(self) -> None:
+        self.map_canvas.delete('marker')
+        if self.__pixel is None:
+            return
+        _, y, x = self.__pixel
+        size = max(self.__to_canvas(1), 3)
+        self.map_canvas.create_rectangle(
+            self.__to_canvas(x), self.__to_canvas(y),
+            self.__to_canvas(x) + size, self.__to_canvas(y) + size,
+            outline=self.MARKER_COLOR, tags='marker')
+
+    def __handle_map_click(self, event: tk.Event) -> None:
+        _, size_y, size_x = self.__smd_data.spatial_size
+        x, y = self.__to_pixel(event.x), self.__to_pixel(event.y)
+        if not (0 <= x < size_x and 0 <= y < size_y):
+            return
+        self.__pixel = (self.z_idx.get(), y, x)
+        self.__draw_marker()
+        self.__draw_spectrum()
+
+    def __draw_spectrum(self) -> None:
+        if self.__cache is None:  # callback after the window is destroyed
+            return
+        canvas = self.plot_canvas
+        canvas.delete('all')
+        if self.__pixel is None:
+            return
+        z, y, x = self.__pixel
+        spectrum = self.__smd_data.read_spectrum(self.__pixel,
+                                                 self.detector_id)
+        axis = self.__smd_data.spectral_axis(
+            self.detector_id, cast(SpectralUnit, self.unit.get()))
+        self.status.set(f"(x, y, z) = ({x}, {y}, {z})  "
+                        f"[chunk cache: {self.__cache.summary()}]")
+
+        finite = np.isfinite(spectrum) & np.isfinite(axis)
+        if np.count_nonzero(finite) < 2:
+            canvas.create_text(self.PLOT_WIDTH // 2, self.PLOT_HEIGHT // 2,
+                               text="<<no data>>")
+            return
+        axis, spectrum = axis[finite], spectrum[finite]
+        axis_low, axis_high = float(axis.min()), float(axis.max())
+        low, high = float(spectrum.min()), float(spectrum.max())
+        if axis_high == axis_low:
+            axis_high = axis_low + 1
+        if high == low:
+            high = low + 1
+
+        margin = self.PLOT_MARGIN
+        width = self.PLOT_WIDTH - margin * 2
+        height = self.PLOT_HEIGHT - margin * 2
+        xs = margin + (axis - axis_low) / (axis_high - axis_low) * width
+        ys = margin + (high - spectrum) / (high - low) * height
+        canvas.create_rectangle(margin, margin, margin + width,
+                                margin + height)
+        canvas.create_line(*np.column_stack([xs, ys]).ravel().tolist(),
+                           fill=self.LINE_COLOR)
+
+        bottom = margin + height
+        canvas.create_text(margin, bottom + 5, text=f"{axis_low:.5g}",
+                           anchor=tk.N)
+        canvas.create_text(margin + width, bottom + 5,
+                           text=f"{axis_high:.5g}", anchor=tk.N)
+        canvas.create_text(margin + width // 2, bottom + 20,
+                           text=self.unit.get(), anchor=tk.N)
+        canvas.create_text(margin - 5, margin, text=f"{high:.4g}",
+                           anchor=tk.E)
+        canvas.create_text(margin - 5, bottom, text=f"{low:.4g}",
+                           anchor=tk.E)
+
+    def destroy(self) -> None:
+        if self.__cache is not None:  # destroy() may be called twice
+            self.__release_cache(self.__smd_data)
+            self.__cache = None
+        super().destroy()
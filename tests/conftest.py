@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import os
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+import pytest
+
+from smdconverter.appsettings import (ApplicationSettings,
+                                      ApplicationSettingsHandler)
+
+SMDFactory = Callable[..., Tuple[str, np.ndarray]]
+
+
+def smd_header(shape: Tuple[int, int, int], detector_sizes: Sequence[int],
+               start: Tuple[int, int, int] = (0, 0, 0),
+               step: Tuple[int, int, int] = (2, 2, 2),
+               date: str = "01/02/2023", time: str = "12:34:56",
+               axis_range: Tuple[float, float] = (540., 560.)) -> bytes:
+    """returns xml header of smd file with one channel for each detector"""
+    axes = ""
+    for axis, size, start_count, step_count in zip(
+            "ZYX", shape, start, step):
+        axes += (
+            f"<Axis{axis}><AxisUnitName>um</AxisUnitName>"
+            f"<AxisScaleFloat>0.5</AxisScaleFloat>"
+            f"<AxisCountStart>{start_count}</AxisCountStart>"
+            f"<AxisCountStop>{start_count + step_count * (size - 1)}"
+            f"</AxisCountStop>"
+            f"<AxisCountStep>{step_count}</AxisCountStep></Axis{axis}>")
+    multi = len(detector_sizes) if len(detector_sizes) > 1 else 0
+    calibrations = ""
+    for idx, size in enumerate(detector_sizes):
+        tag = f"DataCalibration{idx + 1}" if multi else "DataCalibration"
+        axis_array = " ".join(f"{value:.4f}"
+                              for value in np.linspace(*axis_range, size))
+        calibrations += (
+            f"<{tag}><Channels>1</Channels><DataDimentions><Channel0>"
+            f"<DeviceName>Det{idx}</DeviceName><SeriesSize>1</SeriesSize>"
+            f"<ChannelSize>{size}</ChannelSize>"
+            f"<ChannelAxisUnit>nm</ChannelAxisUnit>"
+            f"<ChannelAxisArray>{axis_array}</ChannelAxisArray>"
+            f"<ChannelInfo><I0>info</I0></ChannelInfo>"
+            f"</Channel0></DataDimentions></{tag}>")
+    size_z, size_y, size_x = shape
+    xml = (
+        f"<SCANDATA><ScannedFrameParameters><FrameHeader>"
+        f"<Date>{date}</Date><Time>{time}</Time></FrameHeader>"
+        f"<FrameOptions><MultiDetectionCount>{multi}</MultiDetectionCount>"
+        f"<OmuLaserWLnm>532.0</OmuLaserWLnm>"
+        f"<OmuGratingGroove>1800</OmuGratingGroove>"
+        f"<OmuCentralWaveLengthNM>550.0</OmuCentralWaveLengthNM>"
+        f"</FrameOptions><Stage3DParameters>"
+        f"<AxisSizeZ>{size_z}</AxisSizeZ><AxisSizeY>{size_y}</AxisSizeY>"
+        f"<AxisSizeX>{size_x}</AxisSizeX>"
+        f"<StageAxesDimentions>{axes}</StageAxesDimentions>"
+        f"</Stage3DParameters>{calibrations}"
+        f"</ScannedFrameParameters></SCANDATA>\r\n")
+    return xml.encode()
+
+
+@pytest.fixture
+def make_smd(tmp_path) -> SMDFactory:
+    """returns function which writes smd file of random data into tmp_path
+    and returns its path and spectral data (array[z][y][x][r])"""
+    def make(name: str = "sample.smd",
+             shape: Tuple[int, int, int] = (2, 3, 4),
+             detector_sizes: Sequence[int] = (5, 7), seed: int = 0,
+             data: Union[np.ndarray, None] = None, **kwargs
+             ) -> Tuple[str, np.ndarray]:
+        if data is None:
+            data = np.random.default_rng(seed).random(
+                tuple(shape) + (sum(detector_sizes),), dtype=np.float32)
+        path = os.path.join(str(tmp_path), name)
+        with open(path, mode='wb') as f:
+            f.write(smd_header(shape, detector_sizes, **kwargs))
+            f.write(np.ascontiguousarray(data, dtype=np.float32).tobytes())
+        return path, data
+    return make
+
+
+@pytest.fixture
+def settings(tmp_path) -> ApplicationSettings:
+    """returns default settings (saved into tmp_path)"""
+    return ApplicationSettingsHandler(
+        str(tmp_path / "settings.json")).load()
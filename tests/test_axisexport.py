@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from smdconverter.axisexport import (SpectralAxisExport, axis_hash,
+                                     existing_names)
+from smdconverter.convertjob import ConvertJob
+
+
+@pytest.fixture
+def jobs(make_smd):
+    first, _ = make_smd("first.smd", detector_sizes=(5, 7))
+    same, _ = make_smd("same.smd", detector_sizes=(5, 7))
+    other, _ = make_smd("other.smd", detector_sizes=(5, 7),
+                        axis_range=(600., 620.))
+    return [ConvertJob(path, name) for path, name in
+            ((first, "first"), (same, "same"), (other, "other"))]
+
+
+def test_identical_axes_are_exported_once(jobs, settings):
+    export = SpectralAxisExport(jobs, ['nm', 'cm-1'], settings)
+    assert len(export.axes) == 4  # 2 distinct axes in 2 units
+    assert export.names[jobs[0]] == export.names[jobs[1]]
+    assert set(export.names[jobs[2]].values()).isdisjoint(
+        export.names[jobs[0]].values())
+    names = [name for _, _, name in export.axes]
+    assert len(set(names)) == len(names)
+
+
+def test_reserved_names_are_avoided(jobs, settings):
+    names = SpectralAxisExport(jobs[:1], ['nm'], settings).names[jobs[0]]
+    reserved = names['nm']
+    jobs[1].output_name = reserved
+    export = SpectralAxisExport(jobs[1:2], ['nm'], settings,
+                                reserved_names=[reserved + "_1"])
+    assert export.names[jobs[1]]['nm'] == reserved + "_2"
+
+
+def test_axis_hash(jobs):
+    axis = jobs[0].spectral_axis_array('nm')
+    assert axis_hash(axis, 'nm') == axis_hash(axis.copy(), 'nm')
+    assert axis_hash(axis, 'nm') != axis_hash(axis, 'GHz')
+
+
+def test_existing_names(tmp_path):
+    for name in ("wave.ibw", "upper.IBW", "note.txt"):
+        (tmp_path / name).write_bytes(b"")
+    assert sorted(existing_names(str(tmp_path))) == ["upper", "wave"]
+    assert existing_names(str(tmp_path / "missing")) == []
+
+
+def test_save(jobs, settings, tmp_path):
+    pytest.importorskip("ibwpy")
+    export = SpectralAxisExport(jobs, ['nm'], settings)
+    export.save(os.path.join(str(tmp_path), ""))
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        f"{name}.ibw" for _, _, name in export.axes)
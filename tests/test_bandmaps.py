@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pytest
+
+from smdconverter.bandmaps import (BandExpression, BandMapGenerator,
+                                   integration_weights)
+from smdconverter.ibwio import IBWHeader, open_data
+from smdconverter.smdparser import SimpledSMDParser
+
+
+@pytest.mark.parametrize('text', [
+    "D.__class__",
+    "().__class__.__bases__",
+    "__import__('os')",
+    "open('file')",
+    "D(1)",
+    "abs(D, out=G)",
+    "np.abs(D)",
+    "[D, G]",
+    "D if G else 1",
+    "lambda: D",
+    "'text'",
+    "D[0]",
+    "D and G",
+])
+def test_escapes_from_whitelist_are_rejected(text):
+    with pytest.raises(ValueError):
+        BandExpression(text)
+
+
+def test_syntax_error_is_value_error():
+    with pytest.raises(ValueError):
+        BandExpression("D +")
+
+
+def test_expression_is_evaluated_without_builtins():
+    expression = BandExpression("where(D > 1, sqrt(D) / -G, 2 ** G)")
+    assert expression.names == {"D", "G"}
+    values = {"D": np.array([4.0, 1.0]), "G": np.array([2.0, 3.0])}
+    np.testing.assert_allclose(expression.evaluate(values), [-1.0, 8.0])
+    # division by zero is not warned
+    np.testing.assert_array_equal(
+        BandExpression("D / G").evaluate(
+            {"D": np.array([1.0]), "G": np.array([0.0])}), [np.inf])
+
+
+@pytest.mark.parametrize('axis', [np.linspace(0, 10, 11),
+                                  np.linspace(10, 0, 11)])
+def test_integration_weights_are_trapezoidal(axis):
+    weights = integration_weights(axis, 2, 6)
+    spectrum = axis ** 2
+    inside = (axis >= 2) & (axis <= 6)
+    points = np.sort(axis[inside])
+    values = points ** 2
+    expected = ((values[1:] + values[:-1]) / 2 * np.diff(points)).sum()
+    assert weights @ spectrum == pytest.approx(expected)
+    assert (weights[~inside] == 0).all()
+    with pytest.raises(ValueError):
+        integration_weights(axis, 2.2, 2.8)
+
+
+@pytest.fixture
+def band_smd(make_smd):
+    # axis in nm: 540, 541, ..., 560
+    data = np.random.default_rng(0).random((2, 3, 4, 21), dtype=np.float32)
+    path, _ = make_smd(detector_sizes=(21,), data=data)
+    return SimpledSMDParser.from_file(path), data
+
+
+SETTINGS = {"unit": "nm",
+            "bands": {"A": [542, 546], "B": [555, 550], "bg": [558, 560]},
+            "maps": {"ratio": "(A - bg_mean) / (B - bg_mean)",
+                     "A_position": "A_centroid",
+                     "peak": "B_peak", "top": "maximum(A_max, B_max)"}}
+
+
+def test_maps_equal_values_computed_directly(band_smd, monkeypatch):
+    smd_data, data = band_smd
+    monkeypatch.setattr(BandMapGenerator, 'CHUNK_SPECTRA', 5)
+    generator = BandMapGenerator(smd_data, 0, SETTINGS)
+    assert generator.map_names == list(SETTINGS["maps"])
+    maps = generator.generate()
+
+    axis = np.linspace(540., 560., 21)
+    a, b, bg = (slice(2, 7), slice(10, 16), slice(18, 21))
+
+    def area(band):
+        spectra = data[..., band].astype(np.float64)
+        return ((spectra[..., 1:] + spectra[..., :-1]) / 2).sum(axis=-1)
+
+    bg_mean = area(bg) / 2
+    np.testing.assert_allclose(
+        maps["ratio"], (area(a) - bg_mean) / (area(b) - bg_mean), rtol=1e-4)
+    a_weights = integration_weights(axis, 542, 546)
+    np.testing.assert_allclose(
+        maps["A_position"],
+        data @ (a_weights * axis) / (data @ a_weights), rtol=1e-5)
+    np.testing.assert_allclose(
+        maps["peak"], axis[b][data[..., b].argmax(axis=-1)], rtol=1e-6)
+    np.testing.assert_allclose(
+        maps["top"], np.maximum(data[..., a].max(axis=-1),
+                                data[..., b].max(axis=-1)))
+
+
+@pytest.mark.parametrize('settings', [
+    {"bands": {"A": [542, 546]}, "maps": {}},
+    {"bands": {"A": [542, 546]}, "maps": {"m": "C"}},
+    {"bands": {"A": [542, 546]}, "maps": {"m": "A_median"}},
+    {"bands": {"abs": [542, 546]}, "maps": {"m": "abs"}},
+    {"bands": {"1A": [542, 546]}, "maps": {"m": "1"}},
+])
+def test_invalid_settings_are_rejected(band_smd, settings):
+    with pytest.raises(ValueError):
+        BandMapGenerator(band_smd[0], 0, settings)
+
+
+def test_constant_map_fills_all_pixels(band_smd):
+    maps = BandMapGenerator(band_smd[0], 0, {"maps": {"one": "1"}}) \
+        .generate()
+    np.testing.assert_array_equal(maps["one"], np.ones((2, 3, 4)))
+
+
+def test_save_writes_each_map(band_smd, tmp_path):
+    smd_data, _ = band_smd
+    dst_dir = str(tmp_path / "out")
+    os.mkdir(dst_dir)
+    generator = BandMapGenerator(smd_data, 0, SETTINGS)
+    paths = generator.save(dst_dir, "sample")
+    assert [IBWHeader.read(path).name for path in paths] == \
+        [f"sample_{name}" for name in SETTINGS["maps"]]
+    np.testing.assert_allclose(
+        open_data(paths[0]),
+        np.transpose(generator.generate()["ratio"], (2, 1, 0)))
@@ -0,0 +1,129 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from smdconverter.catalog import OutputCatalog, copy_renamed_wave
+from smdconverter.convertjob import ConvertJob
+from smdconverter.ibwio import (DATA_OFFSET, IBWHeader, IBWStream,
+                                make_headers, open_data)
+from smdconverter.outputwriter import OutputWriter
+from smdconverter.pipeline import ConversionPipeline
+from smdconverter.smdparser import SimpledSMDParser
+
+
+def write_wave(path: str, data: np.ndarray, name: str) -> None:
+    with open(path, mode='w+b') as f:
+        with IBWStream(f, data.shape, name, note="note") as stream:
+            stream.data[...] = data
+
+
+def checksum(path: str) -> int:
+    with open(path, mode='rb') as f:
+        headers = f.read(DATA_OFFSET)
+    return sum(struct.unpack(f'<{DATA_OFFSET // 2}h', headers)) & 0xffff
+
+
+def test_fingerprint_depends_only_on_contents(make_smd, monkeypatch):
+    path, data = make_smd("a.smd")
+    copy_path, _ = make_smd("b.smd", data=data)
+    other_path, _ = make_smd("c.smd", seed=1)
+    fingerprint = SimpledSMDParser.from_file(path).content_fingerprint()
+    assert SimpledSMDParser.from_file(copy_path).content_fingerprint() \
+        == fingerprint
+    assert SimpledSMDParser.from_file(other_path).content_fingerprint() \
+        != fingerprint
+    monkeypatch.setattr(SimpledSMDParser, 'FINGERPRINT_CHUNK_SIZE', 5)
+    assert SimpledSMDParser.from_file(path).content_fingerprint() \
+        == fingerprint
+
+
+def test_catalog_round_trip(tmp_path):
+    output_path = tmp_path / "out.ibw"
+    output_path.write_bytes(b"output")
+    catalog_path = str(tmp_path / "catalog" / "catalog.json")
+    key = OutputCatalog.make_key("fingerprint", 0, [{'name': 'despike'}])
+    assert key != OutputCatalog.make_key("fingerprint", 1)
+
+    catalog = OutputCatalog(catalog_path)
+    assert catalog.lookup(key) is None
+    catalog.record(key, str(output_path))
+    catalog.save()
+    assert OutputCatalog(catalog_path).lookup(key) == str(output_path)
+
+    output_path.write_bytes(b"changed output")
+    assert catalog.lookup(key) is None
+    os.remove(output_path)
+    assert catalog.lookup(key) is None
+
+
+def test_broken_catalog_is_ignored(tmp_path):
+    catalog_path = tmp_path / "catalog.json"
+    catalog_path.write_text("{broken")
+    assert OutputCatalog(str(catalog_path)).lookup("key") is None
+
+
+def test_ibw_header_round_trip(tmp_path):
+    data = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+    path = str(tmp_path / "wave.ibw")
+    write_wave(path, data, "wave0")
+    header = IBWHeader.read(path)
+    assert (header.name, header.shape) == ("wave0", (2, 3, 4))
+    assert header.dtype == np.dtype('<f4')
+    np.testing.assert_array_equal(open_data(path), data)
+    assert checksum(path) == 0
+    with open(path, mode='rb') as f:
+        assert f.read()[-4:] == b"note"
+
+
+def test_copy_renamed_wave(tmp_path):
+    data = np.arange(6, dtype=np.float32).reshape(2, 3)
+    src_path, dst_path = str(tmp_path / "src.ibw"), str(tmp_path / "dst.ibw")
+    write_wave(src_path, data, "original")
+    copy_renamed_wave(src_path, dst_path, "renamed")
+    assert IBWHeader.read(dst_path).name == "renamed"
+    assert IBWHeader.read(src_path).name == "original"
+    np.testing.assert_array_equal(open_data(dst_path), data)
+    assert checksum(dst_path) == 0
+    with pytest.raises(ValueError):
+        copy_renamed_wave(src_path, dst_path, "n" * 32)
+
+
+def test_make_headers_rejects_invalid_names():
+    with pytest.raises(ValueError):
+        make_headers((1,), "n" * 32)
+    with pytest.raises(UnicodeEncodeError):
+        make_headers((1,), "é")
+
+
+def test_pipeline_reuses_duplicated_sources(make_smd, tmp_path, monkeypatch):
+    made = []
+
+    class Wave:
+        def __init__(self, job):
+            self.job = job
+
+        def save(self, path):
+            write_wave(path, self.job.smd_data.detector_array(0)[0, 0],
+                       self.job.output_name)
+
+    def make_output(job, steps=None):
+        made.append(job.output_name)
+        return Wave(job)
+
+    monkeypatch.setattr(ConvertJob, 'make_output', make_output)
+    path, data = make_smd("a.smd")
+    copy_path, _ = make_smd("b.smd", data=data)
+    jobs = [ConvertJob(path, "out0"), ConvertJob(copy_path, "out1")]
+    dst_dir = tmp_path / "dst"
+    dst_dir.mkdir()
+    catalog = OutputCatalog(str(tmp_path / "catalog.json"))
+    with OutputWriter(fsync=False) as writer:
+        ConversionPipeline(writer, catalog=catalog).run(
+            jobs, os.path.join(str(dst_dir), ""))
+    assert made == ["out0"]
+    assert IBWHeader.read(str(dst_dir / "out1.ibw")).name == "out1"
+    np.testing.assert_array_equal(open_data(str(dst_dir / "out1.ibw")),
+                                  data[0, 0, :, :5])
+    assert checksum(str(dst_dir / "out1.ibw")) == 0
@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+import pytest
+
+from smdconverter.chunkcache import ChunkCache
+from smdconverter.smdparser import SimpledSMDParser
+
+
+def chunk(value, nbytes=100):
+    return np.full(nbytes, value, dtype=np.uint8)
+
+
+def test_size_is_bounded_and_lru_is_evicted():
+    cache = ChunkCache(max_bytes=350)
+    for key in "abc":
+        cache.get(key, lambda key=key: chunk(ord(key)))
+    assert cache.size == 300 and len(cache) == 3
+    cache.get("a", lambda: pytest.fail("cached chunk is loaded"))  # a: newest
+
+    cache.get("d", lambda: chunk(0))
+    assert cache.size == 300 and cache.size <= cache.max_bytes
+    loaded = []
+    cache.get("b", lambda: loaded.append("b") or chunk(0))  # evicted
+    cache.get("a", lambda: loaded.append("a") or chunk(0))
+    assert loaded == ["b"]
+    assert cache.stats() == {'hits': 2, 'misses': 5, 'chunks': 3,
+                             'bytes': 300}
+
+
+def test_chunk_larger_than_limit_is_not_cached():
+    cache = ChunkCache(max_bytes=50)
+    res = cache.get("a", lambda: chunk(1))
+    assert res.nbytes == 100
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_cached_chunks_are_read_only():
+    cache = ChunkCache()
+    res = cache.get("a", lambda: chunk(1))
+    with pytest.raises(ValueError):
+        res[0] = 2
+
+
+def test_clear_and_summary():
+    cache = ChunkCache(max_bytes=1024 * 1024)
+    cache.get("a", lambda: chunk(1, 512 * 1024))
+    cache.get("a", lambda: chunk(1))
+    assert cache.summary() == \
+        "1 hit(s), 1 miss(es) (50.0% hit), 1 chunk(s) (0.5 MiB) cached"
+    cache.clear()
+    assert len(cache) == 0 and cache.size == 0
+    assert ChunkCache().summary().startswith("0 hit(s), 0 miss(es) (0.0%")
+
+
+def test_invalid_rows_are_rejected():
+    with pytest.raises(ValueError):
+        ChunkCache(rows_per_chunk=0)
+
+
+def test_bound_is_kept_with_threads():
+    cache = ChunkCache(max_bytes=1000)
+
+    def read(offset):
+        for idx in range(200):
+            cache.get((idx + offset) % 37, lambda: chunk(idx))
+
+    threads = [threading.Thread(target=read, args=(offset,))
+               for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.size <= 1000 and cache.size == 100 * len(cache)
+    assert cache.hits + cache.misses == 800
+
+
+def test_parser_reads_through_cache(make_smd):
+    path, data = make_smd(shape=(2, 5, 4), detector_sizes=(5, 7))
+    cache = ChunkCache(rows_per_chunk=2)
+    smd_data = SimpledSMDParser.from_file(path).set_chunk_cache(cache)
+    for z, y, x in [(0, 0, 0), (0, 1, 3), (1, 4, 2), (0, 0, 1)]:
+        np.testing.assert_array_equal(
+            smd_data.read_spectrum((z, y, x), 1), data[z, y, x, 5:])
+    # chunks of rows 0-1 of z=0 and rows 4-5 of z=1
+    assert cache.stats()['misses'] == 2 and cache.stats()['hits'] == 2
+    assert cache.size == (2 * 4 * 7 + 1 * 4 * 7) * 4
+
+    # cache can be shared, and chunks of changed values are not used
+    other = SimpledSMDParser.from_file(path).set_chunk_cache(cache)
+    np.testing.assert_array_equal(other.read_spectrum((0, 0, 0), 1),
+                                  data[0, 0, 0, 5:])
+    assert cache.stats()['misses'] == 3
+    smd_data.change_values(np.zeros_like(data))
+    np.testing.assert_array_equal(smd_data.read_spectrum((0, 0, 0), 1),
+                                  np.zeros(7))
@@ -0,0 +1,103 @@
+import json
+
+import numpy as np
+import pytest
+
+from smdconverter.datastats import DetectorStatistics
+from smdconverter.preprocess import BackgroundSubtraction, SpectralPreprocessor
+
+
+def test_chan_merge_equals_numpy():
+    rng = np.random.default_rng(0)
+    chunks = [rng.normal(loc=1e3, scale=scale, size=size).astype(np.float32)
+              for scale, size in [(1., 1000), (5., 10), (.1, 1), (20., 300)]]
+    stats = DetectorStatistics()
+    for chunk in chunks:
+        stats.update(chunk)
+    values = np.concatenate(chunks).astype(np.float64)
+    assert stats.count == values.size
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.std == pytest.approx(values.std(), rel=1e-9)
+    assert stats.min == values.min() and stats.max == values.max()
+
+
+def test_histogram_range_grows_to_contain_all_values():
+    rng = np.random.default_rng(1)
+    chunks = [rng.uniform(0, 1, 100), rng.uniform(-5, 0, 100),
+              rng.uniform(10, 30, 100), np.full(3, 2.0)]
+    stats = DetectorStatistics(bins=8)
+    for chunk in chunks:
+        stats.update(chunk)
+    values = np.concatenate(chunks)
+    edges = stats.hist_edges
+    assert stats.hist_counts.size == 8
+    assert edges[0] <= values.min() and values.max() <= edges[-1]
+    assert stats.hist_counts.sum() == values.size
+    # maximum of the first chunk lies on the last edge of the initial
+    # range (inclusive), which becomes an inner edge when range grows
+    expected, _ = np.histogram(values, bins=edges)
+    assert np.abs(stats.hist_counts - expected).sum() <= 2
+
+
+def test_raw_counts_are_separate_from_output():
+    raw = np.array([[np.nan, 1.0, np.inf], [-np.inf, 65535., 70000.]],
+                   dtype=np.float32)
+    output = np.array([[np.nan, 1.0, 2.0], [3.0, np.nan, 5.0]])
+    stats = DetectorStatistics(saturation_level=65535)
+    stats.update(output, raw)
+    # +inf is also at or above saturation level
+    assert (stats.nan_count, stats.inf_count, stats.saturated_count) == \
+        (1, 2, 3)
+    assert stats.count == 4 and stats.mean == pytest.approx(11 / 4)
+
+    stats = DetectorStatistics()  # saturation is not counted
+    stats.update(raw)
+    assert (stats.nan_count, stats.inf_count, stats.saturated_count) == \
+        (1, 2, 0)
+    assert stats.count == 3
+
+
+def test_empty_statistics():
+    stats = DetectorStatistics()
+    stats.update(np.full(4, np.nan))
+    res = stats.to_dict()
+    assert res['detector']['nanCount'] == 4
+    assert res['output']['count'] == 0
+    assert res['output']['min'] is None and res['output']['std'] is None
+    assert np.isnan(stats.std)
+    assert dict(stats.note_items())["Output mean"] == "NaN"
+
+
+def test_to_dict_is_json_serializable():
+    stats = DetectorStatistics(saturation_level=100.0, bins=4)
+    stats.update(np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32))
+    res = json.loads(json.dumps(stats.to_dict()))
+    assert res['output']['mean'] == pytest.approx(2.5)
+    assert res['output']['histCounts'] == stats.hist_counts.tolist()
+    assert sum(res['output']['histCounts']) == 4
+    assert res['detector']['saturationLevel'] == 100.0
+    items = dict(stats.note_items())
+    assert items["Detector saturated count"] == "0 (>= 100)"
+    assert items["Output histogram"] == " ".join(
+        map(str, stats.hist_counts))
+
+
+def test_odd_bins_are_rejected():
+    with pytest.raises(ValueError):
+        DetectorStatistics(bins=7)
+
+
+def test_preprocessor_accumulates_raw_and_output(monkeypatch):
+    monkeypatch.setattr(SpectralPreprocessor, 'CHUNK_SPECTRA', 3)
+    src = np.random.default_rng(2).random((2, 2, 2, 6)).astype(np.float32)
+    src[0, 0, 0, 0] = np.nan
+    src[1, 1, 1, 5] = 10.0
+    stats = DetectorStatistics(saturation_level=5.0)
+    res = SpectralPreprocessor([BackgroundSubtraction(1.0)]).process(
+        src, stats)
+    assert (stats.nan_count, stats.saturated_count) == (1, 1)
+    finite = res[np.isfinite(res)].astype(np.float64)
+    assert stats.count == finite.size
+    assert stats.mean == pytest.approx(finite.mean())
+    assert stats.std == pytest.approx(finite.std())
+    assert stats.min == finite.min() and stats.max == finite.max()
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+from smdconverter.denoise import PCADenoiser, StreamingPCA
+from smdconverter.ibwio import IBWHeader, open_data
+from smdconverter.smdparser import SimpledSMDParser
+
+
+def low_rank_spectra(pixel_num=500, size_r=40, rank=3, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = rng.normal(size=(pixel_num, rank)) * [10., 3., 1.][:rank]
+    components = rng.normal(size=(rank, size_r))
+    return scores @ components + rng.normal(size=size_r)
+
+
+def test_components_match_exact_svd(monkeypatch):
+    monkeypatch.setattr(StreamingPCA, 'CHUNK_SPECTRA', 64)  # many chunks
+    spectra = low_rank_spectra()
+    spectra += np.random.default_rng(1).normal(
+        scale=1e-3, size=spectra.shape)
+    pca = StreamingPCA(spectra, rank=3).fit()
+
+    centered = spectra - spectra.mean(axis=0)
+    _, singular_values, vt = np.linalg.svd(centered, full_matrices=False)
+    np.testing.assert_allclose(pca.mean, spectra.mean(axis=0))
+    np.testing.assert_allclose(pca.singular_values, singular_values[:3],
+                               rtol=1e-6)
+    # components are equal except their signs
+    np.testing.assert_allclose(np.abs(pca.loadings.T @ vt[:3].T),
+                               np.eye(3), atol=1e-6)
+    np.testing.assert_allclose(
+        pca.explained_variance_ratio,
+        singular_values[:3] ** 2 / (singular_values ** 2).sum(), rtol=1e-6)
+
+
+def test_low_rank_spectra_are_reconstructed():
+    spectra = low_rank_spectra()
+    pca = StreamingPCA(spectra, rank=3).fit()
+    reconstructed = pca.reconstruct(pca.transform(spectra))
+    np.testing.assert_allclose(reconstructed, spectra, atol=1e-8)
+    assert pca.explained_variance_ratio.sum() == pytest.approx(1.0)
+
+
+def test_non_finite_values_are_zero():
+    spectra = low_rank_spectra(pixel_num=50)
+    spectra[3, 5] = np.nan
+    spectra[7, 1] = np.inf
+    pca = StreamingPCA(spectra, rank=2).fit()
+    assert np.isfinite(pca.loadings).all()
+    cleaned = np.nan_to_num(spectra, nan=0.0, posinf=0.0)
+    np.testing.assert_allclose(pca.mean, cleaned.mean(axis=0))
+
+
+@pytest.mark.parametrize('rank', [0, 41])
+def test_invalid_rank_is_rejected(rank):
+    with pytest.raises(ValueError):
+        StreamingPCA(low_rank_spectra(), rank=rank)
+
+
+def test_save_writes_denoised_data_scores_and_loadings(make_smd, tmp_path):
+    spectra = low_rank_spectra(pixel_num=2 * 3 * 4, size_r=12, rank=2)
+    path, _ = make_smd(detector_sizes=(12,),
+                       data=spectra.reshape(2, 3, 4, 12).astype(np.float32))
+    dst_dir = str(tmp_path / "out")
+    os.mkdir(dst_dir)
+    denoiser = PCADenoiser(SimpledSMDParser.from_file(path), 0, rank=2)
+    denoiser.save(dst_dir, "sample")
+
+    names = ["sample_pca", "sample_scores", "sample_loadings"]
+    paths = [os.path.join(dst_dir, f"{name}.ibw") for name in names]
+    assert [IBWHeader.read(path_).name for path_ in paths] == names
+    assert IBWHeader.read(paths[0]).shape == (4, 3, 2, 12)
+    assert IBWHeader.read(paths[1]).shape == (4, 3, 2, 2)
+    assert IBWHeader.read(paths[2]).shape == (12, 2)
+
+    source = np.transpose(spectra.reshape(2, 3, 4, 12), (2, 1, 0, 3))
+    np.testing.assert_allclose(open_data(paths[0]), source, atol=1e-4)
+    np.testing.assert_allclose(open_data(paths[2]), denoiser.pca.loadings,
+                               rtol=1e-6)
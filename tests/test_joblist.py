@@ -0,0 +1,60 @@
+import tkinter as tk
+
+import pytest
+
+from smdconverter.convertjob import ConvertJob
+from smdconverter.jobcollection import JobCollection
+from smdconverter.joblist import JobList
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError as error:
+        pytest.skip(f"display is not available ({error})")
+    yield root
+    root.destroy()
+
+
+@pytest.fixture
+def job_list(root, make_smd, settings):
+    jobs = JobCollection()
+    for idx in range(3):
+        path, _ = make_smd(f"sample{idx}.smd", seed=idx)
+        jobs.append(ConvertJob(path, f"out{idx}"))
+    return JobList(root, jobs, lambda job: None, settings)
+
+
+def test_rows_follow_jobs(job_list):
+    job_list.update_contents()
+    assert [job_list.jobs_dict[item_id] for item_id in
+            job_list.get_children()] == list(job_list.jobs)
+
+    item_ids = job_list.get_children()
+    removed = job_list.jobs[1]
+    job_list.jobs.remove(removed)
+    job_list.update_contents()
+    assert job_list.get_children() == (item_ids[0], item_ids[2])
+    assert removed not in job_list.jobs_dict.values()
+
+
+def test_update_job_redraws_row_when_idle(root, job_list):
+    job_list.update_contents()
+    job = job_list.jobs[0]
+    item_id = job_list.get_children()[0]
+    job.output_name = "renamed"
+    job_list.update_job(job)
+    job_list.update_job(job)
+    root.update()
+    assert job_list.item(item_id, 'values')[-1] == "renamed"
+
+
+def test_select_and_neighbor_jobs(job_list):
+    job_list.update_contents()
+    first, second, third = job_list.jobs
+    job_list.select_job(second)
+    assert job_list.selected_job is second
+    assert job_list.neighbor_job(second, 'Up') is first
+    assert job_list.neighbor_job(first, 'Up') is third
+    assert job_list.neighbor_job(third, 'Down') is first
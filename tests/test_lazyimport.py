@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = ('tkinter', 'tkinterdnd2', 'ibwpy', 'pkg_resources')
+
+
+def imported_modules(module: str) -> set:
+    """returns top-level names of modules loaded by importing module in a
+    new interpreter"""
+    code = (f"import sys, {module}\n"
+            f"print(' '.join(sorted(name.split('.')[0] "
+            f"for name in sys.modules)))")
+    res = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR,
+                         capture_output=True, text=True, check=True)
+    return set(res.stdout.split())
+
+
+@pytest.mark.parametrize(
+    'module', ['smdconverter', 'smdconverter.smdparser', 'smdconverter.cli'])
+def test_heavy_modules_are_deferred(module):
+    assert not imported_modules(module) & set(DEFERRED_MODULES)
+
+
+def test_image_path_is_resolved_on_access():
+    from smdconverter import constants
+    assert os.path.isdir(constants.IMAGE_PATH)
+    assert 'IMAGE_PATH' in vars(constants)
+    with pytest.raises(AttributeError):
+        getattr(constants, 'UNKNOWN_CONSTANT')
+
+
+def test_unknown_attribute_of_package():
+    import smdconverter
+    with pytest.raises(AttributeError):
+        getattr(smdconverter, 'UNKNOWN_ATTRIBUTE')
@@ -0,0 +1,34 @@
+import datetime
+
+import pytest
+
+from smdconverter.convertjob import ConvertJob
+from smdconverter.nameformatter import (NameFormatTemplate,
+                                        SpectralDataIBWNameFormatter,
+                                        compile_name_format,
+                                        format_data_names)
+
+CREATION_TIME = datetime.datetime(2023, 2, 1, 9, 5, 7)
+
+
+@pytest.mark.parametrize('name_fmt', [
+    "%O", "%Y%m%d_%O", "%y-%H%M%S", "%O_%O", "100%%_%a_%O", "plain", ""])
+def test_template_equals_strftime(name_fmt):
+    expected = CREATION_TIME.strftime(name_fmt.replace("%O", "sample"))
+    assert NameFormatTemplate(name_fmt).format(
+        "sample", CREATION_TIME) == expected
+
+
+def test_compile_name_format_is_cached():
+    assert compile_name_format("%O_%Y") is compile_name_format("%O_%Y")
+
+
+def test_format_data_names_equals_formatter(make_smd, settings):
+    path, _ = make_smd("1 sample.smd")
+    jobs = [ConvertJob(path, ""), ConvertJob(path, "")]
+    jobs[1].select_detector(1)
+    settings.data_name_formats[jobs[0].selected_detector_name] = "%O_%Y"
+    expected = [SpectralDataIBWNameFormatter(
+        job, settings, print_warning=False).get_name() for job in jobs]
+    assert format_data_names(jobs, settings) == expected
+    assert expected[0] == "wave1_sample_2023"
@@ -0,0 +1,61 @@
+from smdconverter.convertjob import ConvertJob
+from smdconverter.jobcollection import JobCollection
+from smdconverter.nameformatter import NameRegistry, NameReport
+
+
+def test_unique_name_adds_suffix():
+    registry = NameRegistry()
+    assert registry.unique_name("data") == "data"
+    registry.add("data")
+    registry.add("data_1")
+    assert registry.unique_name("data") == "data_2"
+    registry.add("data_2")
+    assert registry.unique_name("data") == "data_3"
+
+
+def test_counts_and_duplicates():
+    registry = NameRegistry()
+    registry.add("data")
+    registry.add("data")
+    registry.add("other")
+    assert registry.duplicates == ["data"]
+    registry.remove("data")
+    assert "data" in registry and registry.duplicates == []
+    registry.remove("data")
+    assert "data" not in registry
+    assert 1 not in registry
+
+
+def test_report_summary():
+    report = NameReport()
+    assert not report
+    report.add("a", "message")
+    report.add("b", "message")
+    report.add("c", "other")
+    assert len(report) == 3
+    assert report.summary() == {"message": ["a", "b"], "other": ["c"]}
+
+
+def test_collection_keeps_registry_in_sync(make_smd):
+    path, _ = make_smd()
+    jobs = JobCollection()
+    first, second = ConvertJob(path, "data"), ConvertJob(path, "data")
+    jobs.extend([first, second])
+    assert jobs.names.duplicates == ["data"]
+
+    second.output_name = "renamed"
+    jobs.update_name(second)
+    assert jobs.names.duplicates == []
+    assert "renamed" in jobs.names
+
+    jobs.remove(second)
+    assert "renamed" not in jobs.names
+    assert jobs.output_names == ("data",)
+
+
+def test_add_jobs_makes_names_unique(make_smd, settings):
+    path, _ = make_smd()
+    jobs = JobCollection()
+    jobs.add_jobs([ConvertJob(path, "") for _ in range(3)], settings)
+    assert len(set(jobs.output_names)) == 3
+    assert jobs.revalidate() == []
@@ -0,0 +1,68 @@
+import hashlib
+import os
+
+import pytest
+
+from smdconverter.outputwriter import OutputWriter, file_checksum
+
+
+def write_text(text: bytes):
+    def save(path: str) -> None:
+        with open(path, mode='wb') as f:
+            f.write(text)
+    return save
+
+
+def test_files_appear_on_commit(tmp_path):
+    committed = []
+    writer = OutputWriter(fsync_batch_size=2)
+    for idx in range(3):
+        dst_path = str(tmp_path / f"out{idx}.bin")
+        writer.write_with(dst_path, write_text(b"data"),
+                          lambda dst_path=dst_path: committed.append(dst_path))
+    # the third file waits for the next batch
+    names = sorted(os.listdir(tmp_path))
+    assert names[0].startswith(".out2.bin.")  # temporary file
+    assert names[1:] == ["out0.bin", "out1.bin"]
+    writer.commit()
+    assert sorted(os.listdir(tmp_path)) == ["out0.bin", "out1.bin",
+                                            "out2.bin"]
+    assert committed == [str(tmp_path / f"out{idx}.bin") for idx in range(3)]
+
+
+def test_failed_save_leaves_nothing(tmp_path):
+    def save(path: str) -> None:
+        with open(path, mode='wb') as f:
+            f.write(b"partial")
+        raise RuntimeError("failed")
+
+    with OutputWriter() as writer:
+        with pytest.raises(RuntimeError):
+            writer.write_with(str(tmp_path / "out.bin"), save)
+    assert os.listdir(tmp_path) == []
+
+
+def test_existing_file_is_replaced_atomically(tmp_path):
+    dst_path = tmp_path / "out.bin"
+    dst_path.write_bytes(b"old")
+    with OutputWriter(fsync=False) as writer:
+        with writer.open(str(dst_path), size=1024) as f:
+            f.write(b"new")
+        assert dst_path.read_bytes() == b"new"  # committed immediately
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+
+def test_discard_removes_pending_files(tmp_path):
+    writer = OutputWriter(fsync_batch_size=10)
+    writer.write_with(str(tmp_path / "out.bin"), write_text(b"data"))
+    writer.discard()
+    writer.commit()
+    assert os.listdir(tmp_path) == []
+
+
+def test_file_checksum(tmp_path, monkeypatch):
+    monkeypatch.setattr('smdconverter.outputwriter.CHECKSUM_CHUNK_SIZE', 7)
+    data = os.urandom(100)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    assert file_checksum(str(path)) == hashlib.sha256(data).hexdigest()
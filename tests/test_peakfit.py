@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+from smdconverter.ibwio import IBWHeader, open_data
+from smdconverter.mapexport import MAX_NAME_LENGTH, map_wave_names
+from smdconverter.peakfit import (MAP_NAMES, LorentzianFitter,
+                                  PeakFitMapper)
+
+
+def lorentzian(x, position, width, amplitude, offset):
+    half = width / 2
+    return amplitude * half ** 2 / ((x - position) ** 2 + half ** 2) \
+        + offset
+
+
+TRUE_PARAMS = np.array([[550.0, 4.0, 10.0, 1.0],
+                        [543.2, 2.5, 3.0, -0.5],
+                        [556.7, 6.0, 100.0, 20.0]])
+
+
+def test_known_parameters_are_recovered():
+    axis = np.linspace(530, 570, 201)
+    spectra = np.stack([lorentzian(axis, *params)
+                        for params in TRUE_PARAMS])
+    params, rms = LorentzianFitter(axis).fit(spectra)
+    np.testing.assert_allclose(params, TRUE_PARAMS, rtol=1e-4, atol=1e-4)
+    assert (rms < 1e-4).all()
+
+
+def test_noisy_spectra_are_fitted_within_noise():
+    axis = np.linspace(530, 570, 201)
+    rng = np.random.default_rng(0)
+    spectra = np.stack([lorentzian(axis, *params)
+                        for params in TRUE_PARAMS])
+    spectra += rng.normal(scale=0.01, size=spectra.shape)
+    params, rms = LorentzianFitter(axis).fit(spectra)
+    np.testing.assert_allclose(params[:, 0], TRUE_PARAMS[:, 0], atol=0.05)
+    np.testing.assert_allclose(params[:, 1], TRUE_PARAMS[:, 1], rtol=0.05)
+    np.testing.assert_allclose(rms, 0.01, rtol=0.3)
+
+
+def test_fitted_range_and_missing_values():
+    axis = np.linspace(570, 530, 201)  # descending axis
+    spectrum = lorentzian(axis, *TRUE_PARAMS[0])
+    spectrum[axis > 560] = 1e3  # out of fitted range
+    spectrum[100] = np.nan
+    spectra = np.stack([spectrum, np.full_like(axis, np.nan)])
+    params, rms = LorentzianFitter(axis, start=560, stop=535).fit(spectra)
+    np.testing.assert_allclose(params[0], TRUE_PARAMS[0], rtol=1e-4)
+    assert np.isnan(params[1]).all() and np.isnan(rms[1])
+
+
+def test_too_narrow_range_is_rejected():
+    with pytest.raises(ValueError):
+        LorentzianFitter(np.linspace(530, 570, 201), start=550, stop=550.5)
+
+
+def test_map_wave_names_are_valid_and_short(capsys):
+    suffixes = [f"_{name}" for name in MAP_NAMES]
+    names = map_wave_names("1st sample-" + "a" * 40, suffixes)
+    assert all(len(name) <= MAX_NAME_LENGTH for name in names)
+    assert all(name.endswith(suffix)
+               for name, suffix in zip(names, suffixes))
+    assert names[0].startswith("wave1st_sample")
+    assert len({name[:-len(suffix)]
+                for name, suffix in zip(names, suffixes)}) == 1
+    assert "Warning:" in capsys.readouterr().out
+
+    assert map_wave_names("sample", ["_a"]) == ["sample_a"]
+    assert capsys.readouterr().out == ""
+    with pytest.raises(ValueError):
+        map_wave_names("sample", ["-a"])
+    with pytest.raises(ValueError):
+        map_wave_names("sample", ["_" * MAX_NAME_LENGTH])
+
+
+@pytest.fixture
+def lorentzian_smd(make_smd):
+    axis = np.linspace(540., 560., 41)
+    positions = np.linspace(545, 555, 2 * 3 * 4).reshape(2, 3, 4)
+    data = lorentzian(axis, positions[..., None], 3.0, 5.0, 1.0)
+    path, _ = make_smd(shape=(2, 3, 4), detector_sizes=(41,),
+                       data=data.astype(np.float32))
+    return path, positions
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_mapper_fits_every_pixel(lorentzian_smd, monkeypatch, workers):
+    path, positions = lorentzian_smd
+    monkeypatch.setattr(PeakFitMapper, 'CHUNK_SPECTRA', 5)
+    mapper = PeakFitMapper(path, 0, unit='nm', workers=workers)
+    maps = mapper.fit()
+    assert set(maps) == set(MAP_NAMES)
+    # axis in the header is rounded to 4 decimal places
+    np.testing.assert_allclose(maps['position'], positions, atol=1e-3)
+    np.testing.assert_allclose(maps['width'], 3.0, rtol=1e-3)
+    np.testing.assert_allclose(maps['amplitude'], 5.0, rtol=1e-3)
+
+
+def test_mapper_saves_maps(lorentzian_smd, tmp_path):
+    path, positions = lorentzian_smd
+    dst_dir = str(tmp_path / "out")
+    os.mkdir(dst_dir)
+    paths = PeakFitMapper(path, 0, unit='nm', workers=1).save(
+        dst_dir, "sample")
+    assert [os.path.basename(path_) for path_ in paths] == \
+        [f"sample_{name}.ibw" for name in MAP_NAMES]
+    header = IBWHeader.read(paths[0])
+    assert header.name == "sample_position"
+    assert header.shape == (4, 3, 2)
+    np.testing.assert_allclose(open_data(paths[0]),
+                               np.transpose(positions, (2, 1, 0)),
+                               atol=1e-3)
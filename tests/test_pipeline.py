@@ -0,0 +1,86 @@
+import os
+import threading
+
+import pytest
+
+from smdconverter.convertjob import ConvertJob
+from smdconverter.outputwriter import OutputWriter
+from smdconverter.pipeline import ConversionPipeline, prefetch_file
+
+
+class FakeWave:
+    """output wave which records how many waves are in memory at once"""
+    lock = threading.Lock()
+    alive = 0
+    max_alive = 0
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        with self.lock:
+            FakeWave.alive += 1
+            FakeWave.max_alive = max(FakeWave.max_alive, FakeWave.alive)
+
+    def save(self, path: str) -> None:
+        with open(path, mode='w') as f:
+            f.write(self.name)
+        with self.lock:
+            FakeWave.alive -= 1
+
+
+@pytest.fixture
+def jobs(make_smd, monkeypatch):
+    FakeWave.alive = FakeWave.max_alive = 0
+
+    def make_output(job, steps=None):
+        if job.output_name == "broken":
+            raise ValueError("broken source")
+        return FakeWave(job.output_name)
+
+    monkeypatch.setattr(ConvertJob, 'make_output', make_output)
+    res = []
+    for idx in range(6):
+        path, _ = make_smd(f"sample{idx}.smd", seed=idx)
+        res.append(ConvertJob(path, f"out{idx}"))
+    return res
+
+
+def run(jobs, dst_dir, **kwargs):
+    ended = []
+    with OutputWriter(fsync=False) as writer:
+        ConversionPipeline(writer, **kwargs).run(
+            jobs, os.path.join(str(dst_dir), ""),
+            on_job_end=lambda job, error: ended.append((job, error)))
+    return ended
+
+
+@pytest.mark.parametrize('write_queue_size', [1, 3])
+def test_outputs_are_written_in_order(jobs, tmp_path, write_queue_size):
+    dst_dir = tmp_path / "dst"
+    dst_dir.mkdir()
+    ended = run(jobs, dst_dir, read_ahead=2,
+                write_queue_size=write_queue_size)
+    assert ended == [(job, None) for job in jobs]
+    for job in jobs:
+        assert (dst_dir / f"{job.output_name}.ibw").read_text() == \
+            job.output_name
+    assert FakeWave.max_alive <= write_queue_size
+
+
+def test_errors_are_reported_per_job(jobs, tmp_path):
+    dst_dir = tmp_path / "dst"
+    dst_dir.mkdir()
+    jobs[1].output_name = "broken"
+    os.remove(jobs[3].src_path)  # job is opened, but cannot be read ahead
+    ended = run(jobs, dst_dir)
+    assert [job for job, _ in ended] == jobs
+    errors = [error for _, error in ended]
+    assert isinstance(errors[1], ValueError)
+    assert isinstance(errors[3], OSError)
+    assert [idx for idx, error in enumerate(errors) if error] == [1, 3]
+    assert sorted(os.listdir(dst_dir)) == [
+        f"out{idx}.ibw" for idx in (0, 2, 4, 5)]
+
+
+def test_prefetch_file(make_smd):
+    path, _ = make_smd()
+    prefetch_file(path, bytearray(7))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from smdconverter.preprocess import (BackgroundSubtraction, BandNormalization,
+                                     Despiking, PolynomialBaseline,
+                                     SpectralPreprocessor)
+from smdconverter.smdparser import SimpledSMDParser
+
+
+def test_background_subtraction():
+    spectra = np.full((2, 3), 10.0, dtype=np.float32)
+    np.testing.assert_array_equal(BackgroundSubtraction(4.0)(spectra), 6.0)
+
+
+def test_despiking_replaces_only_spikes():
+    rng = np.random.default_rng(0)
+    spectra = (1 + rng.normal(0, 0.01, (3, 50))).astype(np.float32)
+    spiked = spectra.copy()
+    spiked[1, 20] += 10
+    res = Despiking(width=5, threshold=8.0)(spiked)
+    assert abs(res[1, 20] - spectra[1, 20]) < 0.1
+    unchanged = np.ones_like(spiked, dtype=bool)
+    unchanged[1, 20] = False
+    np.testing.assert_array_equal(res[unchanged], spiked[unchanged])
+
+
+@pytest.mark.parametrize('width', [1, 2, 4])
+def test_despiking_rejects_invalid_width(width):
+    with pytest.raises(ValueError):
+        Despiking(width=width)
+
+
+def test_polynomial_baseline_removes_polynomial():
+    axis = np.linspace(500, 600, 40)
+    x = (axis - 550) / 50
+    baselines = np.stack([1 + 2 * x + 3 * x ** 2, 5 - x ** 2])
+    res = PolynomialBaseline(axis, degree=2, iterations=0)(baselines)
+    np.testing.assert_allclose(res, 0, atol=1e-9)
+
+
+def test_band_normalization():
+    axis = np.arange(10, dtype=float)
+    spectra = np.arange(20, dtype=float).reshape(2, 10) + 1
+    res = BandNormalization(axis, 2, 4)(spectra)
+    np.testing.assert_allclose(res[:, 2:5].sum(axis=1), 1)
+
+
+def test_band_normalization_rejects_band_out_of_axis():
+    with pytest.raises(ValueError):
+        BandNormalization(np.arange(10, dtype=float), 20, 30)
+
+
+def test_process_equals_process_chunk(monkeypatch):
+    src = np.random.default_rng(1).random((2, 3, 4, 6), dtype=np.float32)
+    preprocessor = SpectralPreprocessor(
+        [BackgroundSubtraction(0.5), Despiking(width=3)])
+    monkeypatch.setattr(SpectralPreprocessor, 'CHUNK_SPECTRA', 5)
+    res = preprocessor.process(src)
+    assert res.shape == src.shape
+    np.testing.assert_array_equal(
+        res, preprocessor.process_chunk(src.reshape(-1, 6)).reshape(src.shape))
+
+
+def test_process_without_steps_returns_source():
+    src = np.zeros((1, 1, 2, 3), dtype=np.float32)
+    assert SpectralPreprocessor([]).process(src) is src
+
+
+def test_from_settings(make_smd):
+    path, _ = make_smd()
+    smd_data = SimpledSMDParser.from_file(path)
+    preprocessor = SpectralPreprocessor.from_settings(
+        [{'name': 'subtractBackground', 'value': 1.0},
+         {'name': 'baseline', 'degree': 1}], smd_data, 0)
+    assert [type(step) for step in preprocessor.steps] == \
+        [BackgroundSubtraction, PolynomialBaseline]
+    with pytest.raises(ValueError):
+        SpectralPreprocessor.from_settings([{'name': 'unknown'}], smd_data, 0)
@@ -0,0 +1,68 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from smdconverter.preview import (PreviewCache, PreviewGenerator,
+                                  encode_png, make_thumbnail)
+from smdconverter.smdparser import SimpledSMDParser
+
+BANDS = {'Det1': {'unit': 'nm', 'start': 545., 'stop': 555.}}
+
+
+def test_generate_equals_full_reduction(make_smd, monkeypatch):
+    path, data = make_smd(detector_sizes=(5, 7))
+    smd_data = SimpledSMDParser.from_file(path)
+    monkeypatch.setattr(PreviewGenerator, 'CHUNK_SPECTRA', 5)
+    det0, det1 = PreviewGenerator(smd_data, BANDS).generate()
+
+    assert set(det0) == {'intensity', 'peak'}
+    np.testing.assert_allclose(det0['intensity'], data[..., :5].sum(axis=3),
+                               rtol=1e-6)
+    axis0 = smd_data.spectral_axis(0, 'nm')
+    np.testing.assert_array_equal(det0['peak'],
+                                  axis0[data[..., :5].argmax(axis=3)])
+
+    block = data[..., 5:]
+    axis1 = smd_data.spectral_axis(1, 'nm')
+    mask = (axis1 >= 545) & (axis1 <= 555)
+    np.testing.assert_allclose(det1['band'], block[..., mask].sum(axis=3),
+                               rtol=1e-6)
+
+
+def test_cache_round_trip(make_smd, tmp_path):
+    path, _ = make_smd()
+    smd_data = SimpledSMDParser.from_file(path)
+    cache = PreviewCache(str(tmp_path / "cache"))
+    entry_dir, generated = cache.get(smd_data, path, BANDS)
+    loaded = cache.load(entry_dir)
+    assert len(loaded) == len(generated)
+    for generated_maps, loaded_maps in zip(generated, loaded):
+        assert generated_maps.keys() == loaded_maps.keys()
+        for name in generated_maps:
+            np.testing.assert_array_equal(generated_maps[name],
+                                          loaded_maps[name])
+    assert cache.entry_dir(path, {}) != entry_dir
+
+
+@pytest.mark.filterwarnings('error')
+def test_thumbnail_scales_to_8bit():
+    arr = np.array([[[0., 1.], [2., np.nan]]])
+    image = make_thumbnail(arr, size=4)
+    assert image.dtype == np.uint8
+    assert image.shape == (4, 4)
+    assert image.min() == 0 and image.max() == 255
+
+
+def test_encode_png_round_trip():
+    image = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    png = encode_png(image)
+    assert png.startswith(b'\x89PNG\r\n\x1a\n')
+    width, height = struct.unpack('>II', png[16:24])
+    assert (width, height) == (4, 3)
+    idat_start = png.index(b'IDAT')
+    idat_size = struct.unpack('>I', png[idat_start - 4:idat_start])[0]
+    rows = np.frombuffer(zlib.decompress(
+        png[idat_start + 4:idat_start + 4 + idat_size]), dtype=np.uint8)
+    np.testing.assert_array_equal(rows.reshape(3, 5)[:, 1:], image)
@@ -0,0 +1,104 @@
+import csv
+
+import numpy as np
+import pytest
+
+from smdconverter import cli
+from smdconverter.smdparser import SimpledSMDParser
+
+
+@pytest.fixture
+def smd(make_smd):
+    path, data = make_smd(shape=(2, 3, 4), detector_sizes=(5, 7))
+    return path, SimpledSMDParser.from_file(path), data
+
+
+def test_read_spectrum_equals_detector_array(smd):
+    _, smd_data, data = smd
+    for detector_id, band in enumerate((slice(0, 5), slice(5, 12))):
+        for coordinate in [(0, 0, 0), (1, 2, 3), (0, 1, 2)]:
+            spectrum = smd_data.read_spectrum(coordinate, detector_id)
+            np.testing.assert_array_equal(spectrum, data[coordinate][band])
+            np.testing.assert_array_equal(
+                spectrum,
+                smd_data.detector_array(detector_id)[coordinate])
+
+
+def test_read_spectrum_is_copied(smd):
+    _, smd_data, data = smd
+    spectrum = smd_data.read_spectrum((1, 1, 1))
+    spectrum[:] = -1
+    np.testing.assert_array_equal(smd_data.read_spectrum((1, 1, 1)),
+                                  data[1, 1, 1, :5])
+
+
+def test_spectrum_offset_is_position_in_body(smd):
+    _, smd_data, _ = smd
+    assert smd_data.spectrum_offset((0, 0, 0), 0) == 0
+    assert smd_data.spectrum_offset((0, 0, 0), 1) == 5 * 4
+    assert smd_data.spectrum_offset((1, 2, 3), 1) == \
+        ((12 + 2 * 4 + 3) * 12 + 5) * 4
+
+
+@pytest.mark.parametrize('coordinate', [(2, 0, 0), (0, 3, 0), (0, 0, -1),
+                                        (0, 0)])
+def test_coordinate_out_of_size_is_rejected(smd, coordinate):
+    with pytest.raises(IndexError):
+        smd[1].read_spectrum(coordinate)
+
+
+def test_read_spectra_and_line(smd):
+    _, smd_data, data = smd
+    coordinates = [(0, 0, 0), (1, 2, 3), (0, 2, 1)]
+    np.testing.assert_array_equal(
+        smd_data.read_spectra(coordinates, 1),
+        np.stack([data[point][5:] for point in coordinates]))
+
+    line, spectra = smd_data.read_line((0, 0, 0), (1, 2, 3), 0)
+    assert line[0] == (0, 0, 0) and line[-1] == (1, 2, 3)
+    assert len(line) == 4
+    assert all(max(abs(a - b) for a, b in zip(first, second)) == 1
+               for first, second in zip(line, line[1:]))
+    np.testing.assert_array_equal(
+        spectra, np.stack([data[point][:5] for point in line]))
+    assert SimpledSMDParser.line_coordinates((1, 1, 1), (1, 1, 1)) \
+        == [(1, 1, 1)]
+
+
+def test_read_coordinates(tmp_path):
+    path = tmp_path / "coords.txt"
+    path.write_text("# z y x\n0 1 2\n\n1,2, 3\n", encoding='utf-8')
+    assert cli.read_coordinates(str(path)) == [(0, 1, 2), (1, 2, 3)]
+    path.write_text("0 1\n", encoding='utf-8')
+    with pytest.raises(ValueError):
+        cli.read_coordinates(str(path))
+
+
+def test_cli_writes_spectra_as_csv(smd, tmp_path, capsys):
+    path, smd_data, data = smd
+    coords = tmp_path / "coords.txt"
+    coords.write_text("1 2 3\n", encoding='utf-8')
+    output = tmp_path / "spectra.csv"
+    assert cli.main(['--settings', str(tmp_path / "settings.json"),
+                     'spectrum', path, '--point', '0', '1', '2',
+                     '--line', '0', '0', '0', '0', '0', '1',
+                     '--coords', str(coords), '--detector', '1',
+                     '--output', str(output)]) == 0
+    assert "Saved:" in capsys.readouterr().out
+
+    with open(output, encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['nm', '(0 1 2)', '(0 0 0)', '(0 0 1)', '(1 2 3)']
+    assert len(rows) == 1 + 7
+    values = np.array([[float(value) for value in row] for row in rows[1:]])
+    np.testing.assert_allclose(values[:, 0], smd_data.spectral_axis(1),
+                               rtol=1e-6)
+    expected = np.stack([data[point][5:] for point in
+                         [(0, 1, 2), (0, 0, 0), (0, 0, 1), (1, 2, 3)]])
+    np.testing.assert_allclose(values[:, 1:].T, expected, rtol=1e-6)
+
+
+def test_cli_reports_invalid_point(smd, tmp_path, capsys):
+    assert cli.main(['--settings', str(tmp_path / "settings.json"),
+                     'spectrum', smd[0], '--point', '5', '0', '0']) == 1
+    assert "Error: Reading spectra failed" in capsys.readouterr().out
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from smdconverter.preprocess import (BackgroundSubtraction,
+                                     SpectralPreprocessor, SpectralResampling)
+from smdconverter.smdparser import SimpledSMDParser
+
+
+@pytest.mark.parametrize('axis', [np.linspace(500, 600, 11),
+                                  np.linspace(600, 500, 11),
+                                  np.array([500., 510., 530., 560., 600.])])
+def test_linear_spectra_are_reproduced(axis):
+    resampling = SpectralResampling(axis, start=505, stop=595, points=19)
+    assert resampling.size == 19
+    assert resampling.scale == (505, 5)
+    spectra = np.stack([axis * 2 + 1, -axis]).astype(np.float32)
+    target = 505 + 5 * np.arange(19)
+    np.testing.assert_allclose(resampling(spectra),
+                               np.stack([target * 2 + 1, -target]),
+                               rtol=1e-5)
+
+
+def test_points_out_of_axis_are_nan():
+    resampling = SpectralResampling(np.linspace(500, 600, 11),
+                                    start=450, stop=650, points=5)
+    res = resampling(np.ones((1, 11), dtype=np.float32))
+    np.testing.assert_array_equal(np.isnan(res[0]),
+                                  [True, False, False, False, True])
+
+
+def test_default_range_keeps_size():
+    axis = np.linspace(560, 540, 7)
+    resampling = SpectralResampling(axis)
+    assert resampling.size == 7
+    assert resampling.scale == (540, pytest.approx(20 / 6))
+
+
+@pytest.mark.parametrize('kwargs', [{'points': 1}, {'start': 1, 'stop': 1}])
+def test_invalid_range(kwargs):
+    with pytest.raises(ValueError):
+        SpectralResampling(np.linspace(500, 600, 11), **kwargs)
+    with pytest.raises(ValueError):
+        SpectralResampling(np.array([500.]))
+
+
+def test_resampling_must_be_last(make_smd):
+    path, _ = make_smd()
+    smd_data = SimpledSMDParser.from_file(path)
+    resample = {'name': 'resample', 'unit': 'cm-1', 'points': 4}
+    background = {'name': 'subtractBackground', 'value': 1.0}
+    with pytest.raises(ValueError):
+        SpectralPreprocessor.from_settings([resample, background],
+                                           smd_data, 0)
+    preprocessor = SpectralPreprocessor.from_settings(
+        [background, resample], smd_data, 0)
+    assert isinstance(preprocessor.steps[0], BackgroundSubtraction)
+    assert preprocessor.resampling.unit == 'cm-1'
+    assert preprocessor.output_size(5) == 4
+    res = preprocessor.process(smd_data.detector_array(0))
+    assert res.shape == (2, 3, 4, 4)
@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+from smdconverter.convertjob import ConvertJob
+from smdconverter.headercache import HeaderCache
+from smdconverter.session import JobSession
+
+
+@pytest.fixture
+def header_cache(tmp_path):
+    return HeaderCache(str(tmp_path / "header_cache"))
+
+
+def test_round_trip(make_smd, tmp_path, header_cache):
+    path, _ = make_smd()
+    done, failed = ConvertJob(path, "done"), ConvertJob(path, "failed")
+    failed.select_detector(1)
+    done.status, done.output_checksum = 'done', "0123abcd"
+    failed.status = 'failed'
+    session_path = str(tmp_path / "session" / "session.json")
+    JobSession([done, failed], "dst/").save(session_path)
+    assert os.listdir(os.path.dirname(session_path)) == ["session.json"]
+
+    loaded = JobSession.load(session_path, header_cache)
+    assert loaded.dst_dir == "dst/"
+    assert [(job.src_path, job.selected_detector, job.output_name,
+             job.status, job.output_checksum) for job in loaded.jobs] == [
+        (path, 0, "done", 'done', "0123abcd"),
+        (path, 1, "failed", 'failed', None)]
+    assert loaded.pending_jobs == [loaded.jobs[1]]
+
+
+def test_missing_sources_are_skipped(make_smd, tmp_path, header_cache):
+    path, _ = make_smd()
+    session = JobSession([ConvertJob(path, "kept")], "")
+    session_dict = session.to_dict()
+    session_dict['jobs'].append(dict(session_dict['jobs'][0],
+                                     src_path=str(tmp_path / "lost.smd")))
+    session_path = str(tmp_path / "session.json")
+    with open(session_path, mode='w') as f:
+        json.dump(session_dict, f)
+    loaded = JobSession.load(session_path, header_cache)
+    assert [job.output_name for job in loaded.jobs] == ["kept"]
+
+
+def test_unsupported_version(tmp_path):
+    session_path = str(tmp_path / "session.json")
+    with open(session_path, mode='w') as f:
+        json.dump({'version': JobSession.VERSION + 1, 'jobs': []}, f)
+    with pytest.raises(ValueError):
+        JobSession.load(session_path)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from smdconverter.smdparser import SimpledSMDParser
+
+
+def test_save_round_trip(make_smd, tmp_path):
+    path, data = make_smd()
+    parser = SimpledSMDParser.from_file(path)
+    out_path = str(tmp_path / "saved.smd")
+    parser.save(out_path)
+    with open(path, mode='rb') as src, open(out_path, mode='rb') as dst:
+        assert src.read() == dst.read()
+
+
+def test_save_in_small_chunks(make_smd, tmp_path, monkeypatch):
+    path, _ = make_smd()
+    monkeypatch.setattr(SimpledSMDParser, 'WRITE_CHUNK_SIZE', 7)
+    out_path = str(tmp_path / "saved.smd")
+    SimpledSMDParser.from_file(path).save(out_path)
+    with open(path, mode='rb') as src, open(out_path, mode='rb') as dst:
+        assert src.read() == dst.read()
+
+
+def test_change_values_updates_body(make_smd):
+    path, data = make_smd()
+    parser = SimpledSMDParser.from_file(path)
+    parser.change_values(data * 2)
+    body = np.frombuffer(parser.body_buffer, dtype=np.float32)
+    np.testing.assert_array_equal(body, (data * 2).ravel())
+
+
+def test_change_values_rejects_other_shape(make_smd):
+    path, data = make_smd()
+    with pytest.raises(ValueError):
+        SimpledSMDParser.from_file(path).change_values(data[:1])
+
+
+@pytest.mark.parametrize('chunk_shape', [(1, 1, 1), (1, 2, 3), (2, 3, 4),
+                                         (5, 5, 5)])
+def test_apply_equals_full_load(make_smd, tmp_path, chunk_shape):
+    path, data = make_smd()
+
+    def func(chunk):
+        return np.sqrt(chunk) + 1
+
+    expected_path = str(tmp_path / "expected.smd")
+    parser = SimpledSMDParser.from_file(path)
+    parser.change_values(func(data))
+    parser.save(expected_path)
+
+    out_path = str(tmp_path / "applied.smd")
+    SimpledSMDParser.from_file(path).apply(func, chunk_shape, out_path)
+    with open(expected_path, mode='rb') as expected, \
+            open(out_path, mode='rb') as applied:
+        assert expected.read() == applied.read()
+
+
+def test_apply_overwrites_source(make_smd):
+    path, data = make_smd()
+    SimpledSMDParser.from_file(path).apply(lambda chunk: -chunk,
+                                           (1, 1, 2), path)
+    np.testing.assert_array_equal(
+        SimpledSMDParser.from_file(path).full_array, -data)
+
+
+def test_apply_rejects_changed_shape(make_smd, tmp_path):
+    path, _ = make_smd()
+    out_path = tmp_path / "applied.smd"
+    with pytest.raises(ValueError):
+        SimpledSMDParser.from_file(path).apply(
+            lambda chunk: chunk[..., :1], (1, 1, 1), str(out_path))
+    assert not out_path.exists()
+    assert list(tmp_path.iterdir()) == [tmp_path / "sample.smd"]
+
+
+def test_iter_chunks_covers_array(make_smd):
+    path, data = make_smd()
+    covered = np.zeros(data.shape[:3], dtype=int)
+    for slices, chunk in SimpledSMDParser.from_file(path).iter_chunks(
+            (2, 2, 3)):
+        np.testing.assert_array_equal(chunk, data[slices])
+        covered[slices] += 1
+    assert (covered == 1).all()
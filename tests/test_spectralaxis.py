@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from smdconverter.smdparser import SPECTRAL_UNITS, SimpledSMDParser
+
+
+@pytest.fixture
+def smd_data(make_smd):
+    path, _ = make_smd(detector_sizes=(5, 7))
+    return SimpledSMDParser.from_file(path)
+
+
+def test_axes_are_computed_once(smd_data):
+    axis = smd_data.spectral_axis(1, 'cm-1')
+    assert smd_data.spectral_axis(1, 'cm-1') is axis
+    assert not axis.flags.writeable
+    with pytest.raises(ValueError):
+        axis[0] = 0
+
+
+def test_axes_in_all_units(smd_data):
+    wavelength = np.linspace(540, 560, 7)
+    axes = smd_data.spectral_axes(1)
+    assert tuple(axes) == SPECTRAL_UNITS
+    np.testing.assert_allclose(axes['nm'], wavelength, rtol=1e-6)
+    np.testing.assert_allclose(axes['cm-1'],
+                               (1 / 532 - 1 / wavelength) * 1e7, rtol=1e-4)
+    np.testing.assert_allclose(
+        axes['GHz'], SimpledSMDParser.LIGHT_C * (1 / 532 - 1 / wavelength),
+        rtol=1e-4)
+
+
+def test_axes_follow_excitation_wavelength(smd_data):
+    axis = smd_data.spectral_axis(0, 'cm-1')
+    smd_data.header.frame_options.data['OmuLaserWLnm'] = "633.0"
+    changed = smd_data.spectral_axis(0, 'cm-1')
+    assert changed is not axis
+    np.testing.assert_allclose(
+        changed, (1 / 633 - 1 / smd_data.spectral_axis(0, 'nm')) * 1e7)
+
+
+def test_invalid_arguments(smd_data):
+    with pytest.raises(ValueError):
+        smd_data.spectral_axis(2)
+    with pytest.raises(ValueError):
+        smd_data.spectral_axis(0, 'eV')
@@ -0,0 +1,82 @@
+import struct
+
+import numpy as np
+import pytest
+
+from smdconverter.ibwio import (BIN_HEADER_SIZE, DIM_UNITS_OFFSET,
+                                SFA_OFFSET, SFB_OFFSET, UNITS_SIZE,
+                                IBWHeader, igor_time, open_data)
+from smdconverter.smdparser import SimpledSMDParser
+from smdconverter.stack import (TimeSeriesStacker, group_by_geometry,
+                                numbered_paths)
+
+TIMES = ("12:00:10", "12:00:00", "12:00:30")  # acquisition order: 1, 0, 2
+
+
+def open_frames(make_smd, shape=(1, 3, 4)):
+    frames, arrays = [], []
+    for idx, time in enumerate(TIMES):
+        path, data = make_smd(f"frame{idx}.smd", shape=shape,
+                              detector_sizes=(5,), seed=idx, time=time)
+        frames.append(SimpledSMDParser.from_file(path))
+        arrays.append(data)
+    return frames, arrays
+
+
+def third_dimension(path):
+    """returns (start, delta) and unit of the third dimension of wave"""
+    with open(path, mode='rb') as f:
+        header = f.read(BIN_HEADER_SIZE + DIM_UNITS_OFFSET + 3 * UNITS_SIZE)
+    delta = struct.unpack_from('<d', header, BIN_HEADER_SIZE + SFA_OFFSET
+                               + 2 * 8)[0]
+    start = struct.unpack_from('<d', header, BIN_HEADER_SIZE + SFB_OFFSET
+                               + 2 * 8)[0]
+    unit_offset = BIN_HEADER_SIZE + DIM_UNITS_OFFSET + 2 * UNITS_SIZE
+    unit = header[unit_offset:unit_offset + UNITS_SIZE].rstrip(b'\x00')
+    return (start, delta), unit.decode()
+
+
+def test_frames_are_stacked_in_time_order(make_smd, tmp_path):
+    frames, arrays = open_frames(make_smd)
+    stacker = TimeSeriesStacker(frames, [0] * 3)
+    assert stacker.shape == (4, 3, 3, 5)
+    path = str(tmp_path / "series.ibw")
+    stacker.save(path)
+
+    res = open_data(path)  # array[x][y][t][r]
+    for t, idx in enumerate((1, 0, 2)):
+        np.testing.assert_array_equal(
+            res[:, :, t, :], np.transpose(arrays[idx][0], (1, 0, 2)))
+    assert third_dimension(path) == ((0.0, 15.0), "s")
+
+    times = open_data(str(tmp_path / "series_t.ibw"))
+    assert IBWHeader.read(str(tmp_path / "series_t.ibw")).name == "series_t"
+    np.testing.assert_array_equal(
+        times, [igor_time(time) for time in stacker.times])
+
+
+def test_frames_with_multiple_z(make_smd, tmp_path):
+    frames, arrays = open_frames(make_smd, shape=(2, 3, 4))
+    stacker = TimeSeriesStacker(frames, [0] * 3)
+    path = str(tmp_path / "series.ibw")
+    stacker.save(path)
+    res = open_data(path)  # array[x][y][z + t * size_z][r]
+    np.testing.assert_array_equal(
+        res[:, :, 2 + 1, :], np.transpose(arrays[0][1], (1, 0, 2)))
+    assert third_dimension(path) == ((0.0, 1.0), "")
+    assert "Layout: z + frame * 2" in stacker.make_note()
+
+
+def test_group_by_geometry(make_smd):
+    frames, _ = open_frames(make_smd)
+    path, _ = make_smd("other.smd", shape=(1, 2, 4), detector_sizes=(5,))
+    frames.append(SimpledSMDParser.from_file(path))
+    assert group_by_geometry(frames, [0] * 4) == [[1, 0, 2], [3]]
+    with pytest.raises(ValueError):
+        TimeSeriesStacker(frames, [0] * 4)
+
+
+def test_numbered_paths():
+    assert numbered_paths("dir/out.ibw", 1) == ["dir/out.ibw"]
+    assert numbered_paths("dir/out.ibw", 2) == ["dir/out_0.ibw",
+                                                "dir/out_1.ibw"]
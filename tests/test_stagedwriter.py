@@ -0,0 +1,82 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+from smdconverter.outputwriter import StagedOutputWriter
+
+
+def write_text(text: bytes):
+    def save(path: str) -> None:
+        with open(path, mode='wb') as f:
+            f.write(text)
+    return save
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    staging_dir, dst_dir = tmp_path / "staging", tmp_path / "dst"
+    dst_dir.mkdir()
+    return staging_dir, dst_dir
+
+
+def test_outputs_are_copied(dirs):
+    staging_dir, dst_dir = dirs
+    committed = []
+    with StagedOutputWriter(str(staging_dir), copy_workers=2) as writer:
+        for idx in range(5):
+            dst_path = str(dst_dir / f"out{idx}.bin")
+            writer.write_with(dst_path, write_text(bytes([idx])),
+                              lambda dst_path=dst_path:
+                              committed.append(dst_path))
+        with writer.open(str(dst_dir / "opened.bin"), size=64) as f:
+            f.write(b"opened")
+    assert sorted(committed) == [str(dst_dir / f"out{idx}.bin")
+                                 for idx in range(5)]
+    for idx in range(5):
+        assert (dst_dir / f"out{idx}.bin").read_bytes() == bytes([idx])
+    assert (dst_dir / "opened.bin").read_bytes() == b"opened"
+    assert os.listdir(staging_dir) == []
+
+
+def test_failed_copy_is_raised_on_commit(dirs):
+    staging_dir, dst_dir = dirs
+    committed = []
+    writer = StagedOutputWriter(str(staging_dir), copy_workers=1)
+    with pytest.raises(OSError):
+        with writer:
+            writer.write_with(str(dst_dir / "missing" / "out.bin"),
+                              write_text(b"lost"))
+            writer.write_with(str(dst_dir / "out.bin"), write_text(b"data"),
+                              lambda: committed.append("out.bin"))
+    assert committed == ["out.bin"]
+    assert os.listdir(dst_dir) == ["out.bin"]
+    assert os.listdir(staging_dir) == []
+
+
+def test_discard_removes_staged_files(dirs, monkeypatch):
+    staging_dir, dst_dir = dirs
+    copy_started, resume_copy = threading.Event(), threading.Event()
+    copyfileobj = shutil.copyfileobj
+
+    def blocking_copyfileobj(*args, **kwargs):
+        copy_started.set()
+        resume_copy.wait(5)
+        copyfileobj(*args, **kwargs)
+
+    monkeypatch.setattr(shutil, 'copyfileobj', blocking_copyfileobj)
+    writer = StagedOutputWriter(str(staging_dir), copy_workers=1)
+    try:
+        writer.write_with(str(dst_dir / "copied.bin"), write_text(b"data"))
+        copy_started.wait(5)
+        writer.write_with(str(dst_dir / "cancelled.bin"),
+                          write_text(b"data"))
+        # the first copy resumes after the second one is cancelled
+        threading.Timer(0.5, resume_copy.set).start()
+        writer.discard()
+    finally:
+        resume_copy.set()
+        writer.__exit__(None, None, None)
+    assert os.listdir(dst_dir) == ["copied.bin"]
+    assert os.listdir(staging_dir) == []
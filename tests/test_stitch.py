@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from smdconverter.convertjob import ConvertJob
+from smdconverter.ibwio import IBWHeader, open_data
+from smdconverter.smdparser import SimpledSMDParser
+from smdconverter.stitch import TileStitcher, group_jobs_by_detector
+
+
+def open_tile(make_smd, name, **kwargs):
+    path, data = make_smd(name, shape=(1, 3, 4), detector_sizes=(5,),
+                          **kwargs)
+    return SimpledSMDParser.from_file(path), data
+
+
+def stitched_data(stitcher, tmp_path):
+    path = str(tmp_path / "stitched.ibw")
+    stitcher.save(path)
+    assert IBWHeader.read(path).name == "stitched"
+    return np.transpose(open_data(path), (2, 1, 0, 3))  # array[z][y][x][r]
+
+
+def test_adjacent_tiles(make_smd, tmp_path):
+    left, left_data = open_tile(make_smd, "left.smd", seed=0)
+    right, right_data = open_tile(make_smd, "right.smd", seed=1,
+                                  start=(0, 0, 8))
+    stitcher = TileStitcher([left, right], [0, 0])
+    assert stitcher.offsets == [(0, 0, 0), (0, 0, 4)]
+    assert stitcher.shape == (1, 3, 8, 5)
+    np.testing.assert_array_equal(
+        stitched_data(stitcher, tmp_path),
+        np.concatenate([left_data, right_data], axis=2))
+    assert stitcher.report.gap_pixels == stitcher.report.overlap_pixels == 0
+
+
+def test_gap_and_overlap(make_smd, tmp_path):
+    first, first_data = open_tile(make_smd, "first.smd", seed=0,
+                                  time="12:00:00")
+    later, later_data = open_tile(make_smd, "later.smd", seed=1,
+                                  start=(0, 2, 4), time="12:30:00")
+    # the tile acquired later is given first, but overwrites the other
+    stitcher = TileStitcher([later, first], [0, 0])
+    assert stitcher.shape == (1, 4, 6, 5)
+    res = stitched_data(stitcher, tmp_path)
+    np.testing.assert_array_equal(res[:, 1:, 2:], later_data)
+    np.testing.assert_array_equal(res[:, :1, :4], first_data[:, :1])
+    assert np.isnan(res[:, 0, 4:]).all() and np.isnan(res[:, 3, :2]).all()
+    assert stitcher.report.gap_pixels == 4
+    assert stitcher.report.overlap_pixels == 4
+
+
+def test_unscanned_axis(make_smd, tmp_path):
+    first, _ = open_tile(make_smd, "first.smd", step=(0, 2, 2))
+    second, _ = open_tile(make_smd, "second.smd", step=(0, 2, 2),
+                          start=(5, 0, 8))
+    stitcher = TileStitcher([first, second], [0, 0])
+    assert stitcher.offsets == [(0, 0, 0), (0, 0, 4)]
+    assert len(stitcher.report.warnings) == 1
+
+
+def test_incompatible_tiles(make_smd):
+    first, _ = open_tile(make_smd, "first.smd")
+    other_axis, _ = open_tile(make_smd, "axis.smd", axis_range=(600., 620.))
+    other_step, _ = open_tile(make_smd, "step.smd", step=(2, 2, 4))
+    path, _ = make_smd("size.smd", shape=(1, 3, 4), detector_sizes=(6,))
+    other_size = SimpledSMDParser.from_file(path)
+    for tile in (other_axis, other_step, other_size):
+        with pytest.raises(ValueError):
+            TileStitcher([first, tile], [0, 0])
+    with pytest.raises(ValueError):
+        TileStitcher([], [])
+
+
+def test_group_jobs_by_detector(make_smd):
+    path, _ = make_smd(detector_sizes=(5, 7))
+    jobs = [ConvertJob(path, f"out{idx}") for idx in range(4)]
+    jobs[1].select_detector(1)
+    jobs[3].select_detector(1)
+    assert group_jobs_by_detector(jobs) == [[jobs[0], jobs[2]],
+                                            [jobs[1], jobs[3]]]
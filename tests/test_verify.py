@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from smdconverter import cli, verify
+from smdconverter.ibwio import IBWStream, open_data
+from smdconverter.outputwriter import file_checksum
+from smdconverter.preprocess import BackgroundSubtraction, SpectralPreprocessor
+from smdconverter.smdparser import SimpledSMDParser
+
+
+@pytest.fixture
+def source(make_smd):
+    path, data = make_smd(shape=(2, 3, 4), detector_sizes=(5, 7))
+    return SimpledSMDParser.from_file(path), data
+
+
+def write_output(path: str, block: np.ndarray) -> None:
+    """write detector block (array[z][y][x][r]) as converted wave"""
+    transposed = np.transpose(block, (2, 1, 0, 3))  # array[x][y][z][r]
+    with open(path, mode='w+b') as f:
+        with IBWStream(f, transposed.shape, "wave0") as stream:
+            stream.data[...] = transposed
+
+
+def test_matching_output(source, tmp_path, monkeypatch):
+    smd_data, data = source
+    path = str(tmp_path / "out.ibw")
+    write_output(path, data[..., 5:])
+    monkeypatch.setattr(verify, 'CHUNK_SIZE', 1)  # one row at a time
+    assert verify.verify_output(smd_data, 1, path,
+                                checksum=file_checksum(path)) == []
+
+
+def test_different_values_are_reported(source, tmp_path):
+    smd_data, data = source
+    changed = data[..., :5].copy()
+    changed[1, 2, 3, 4] += 1
+    path = str(tmp_path / "out.ibw")
+    write_output(path, changed)
+    problems = verify.verify_output(smd_data, 0, path)
+    assert len(problems) == 1
+    assert problems[0].startswith("1 value(s) are different")
+
+
+def test_checksum_and_shape(source, tmp_path):
+    smd_data, data = source
+    path = str(tmp_path / "out.ibw")
+    write_output(path, data[..., :5])
+    assert verify.verify_output(smd_data, 0, path, checksum="0" * 64,
+                                check_data=False) == \
+        ["checksum is different from the recorded one"]
+    assert "shape" in verify.verify_output(smd_data, 1, path)[0]
+    assert verify.verify_output(smd_data, 0, str(tmp_path / "none.ibw")) \
+        == ["output does not exist"]
+
+
+def test_preprocessed_output_within_tolerance(source, tmp_path):
+    smd_data, data = source
+    preprocessor = SpectralPreprocessor([BackgroundSubtraction(0.25)])
+    path = str(tmp_path / "out.ibw")
+    write_output(path, data[..., :5] - 0.25)
+    assert verify.verify_output(smd_data, 0, path,
+                                preprocessor=preprocessor) == []
+    assert open_data(path).shape == (4, 3, 2, 5)
+
+
+def test_cli_reports_unreadable_session(tmp_path, capsys):
+    session_path = tmp_path / "session.json"
+    session_path.write_text("{broken")
+    for path in (session_path, tmp_path / "missing.json"):
+        assert cli.main(['--settings', str(tmp_path / "settings.json"),
+                         'verify', str(path)]) == 1
+        assert "Error: Loading session failed" in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import tkinter as tk
+
+import numpy as np
+import pytest
+
+from smdconverter.chunkcache import ChunkCache
+from smdconverter.convertjob import ConvertJob
+from smdconverter.smdparser import SimpledSMDParser
+from smdconverter.viewerwndw import SpectrumViewerWindow
+
+# classmethods which manage chunk caches do not need a display
+acquire_cache = SpectrumViewerWindow._SpectrumViewerWindow__acquire_cache
+release_cache = SpectrumViewerWindow._SpectrumViewerWindow__release_cache
+
+
+@pytest.fixture
+def smd_data(make_smd):
+    path, _ = make_smd()
+    return SimpledSMDParser.from_file(path)
+
+
+def test_cache_is_shared_while_viewers_are_open(smd_data, settings):
+    previous = ChunkCache()
+    smd_data.set_chunk_cache(previous)
+    first = acquire_cache(smd_data, settings)
+    second = acquire_cache(smd_data, settings)
+    assert first is second is smd_data.chunk_cache
+    assert first is not previous
+    assert first.rows_per_chunk == SpectrumViewerWindow.ROWS_PER_CHUNK
+
+    release_cache(smd_data)
+    assert smd_data.chunk_cache is first
+    release_cache(smd_data)
+    assert smd_data.chunk_cache is previous  # restored by the last viewer
+
+
+def test_caches_of_different_data_are_separate(make_smd, settings):
+    data = [SimpledSMDParser.from_file(make_smd(f"{idx}.smd")[0])
+            for idx in range(2)]
+    caches = [acquire_cache(smd_data, settings) for smd_data in data]
+    assert caches[0] is not caches[1]
+    for smd_data in data:
+        release_cache(smd_data)
+        assert smd_data.chunk_cache is None
+
+
+def test_replaced_cache_is_kept(smd_data, settings):
+    acquire_cache(smd_data, settings)
+    replaced = ChunkCache()
+    smd_data.set_chunk_cache(replaced)
+    release_cache(smd_data)
+    assert smd_data.chunk_cache is replaced
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError as error:
+        pytest.skip(f"display is not available ({error})")
+    yield root
+    root.destroy()
+
+
+def test_viewer_reads_spectra_through_cache(root, make_smd, settings):
+    path, data = make_smd()
+    job = ConvertJob(path, "out")
+    viewer = SpectrumViewerWindow(root, job, settings)
+    other = SpectrumViewerWindow(root, job, settings)
+    cache = job.smd_data.chunk_cache
+    assert cache is not None
+    np.testing.assert_array_equal(job.smd_data.read_spectrum((1, 2, 3)),
+                                  data[1, 2, 3, :5])
+    assert cache.stats()['misses'] == 1
+
+    viewer.destroy()
+    viewer.destroy()  # called twice
+    assert job.smd_data.chunk_cache is cache
+    other.destroy()
+    assert job.smd_data.chunk_cache is None